@@ -0,0 +1,100 @@
+"""Compare decode time per upload format, before and after format sniffing.
+
+The image is scaled to phone-camera size and re-encoded in every format this
+install can write. "pillow" is a plain ``Image.open`` and full-size
+grayscale conversion; "sniffed" is the decode step of the print pipeline
+(reduced-scale JPEG decoding) for the continuous58 width. For a JPEG
+input with an EXIF thumbnail, the instant preview path is timed too.
+
+Usage: python -m benchmarks.decode [image] [--size WxH] [--repeat N]
+"""
+
+import argparse
+import io
+import time
+from pathlib import Path
+
+from PIL import Image, features
+
+from ditherbooth.imaging.decode import _heif_available, exif_thumbnail, open_image
+from ditherbooth.imaging.process import _open_gray
+
+SAMPLE = (
+    Path(__file__).resolve().parent.parent
+    / "ditherbooth"
+    / "static"
+    / "examples"
+    / "original.png"
+)
+WIDTH = 463
+FORMATS = {
+    "JPEG": {"quality": 90},
+    "PNG": {},
+    "WEBP": {"quality": 90},
+    "AVIF": {"quality": 70},
+    "HEIF": {"quality": 90},
+}
+
+
+def available(fmt: str) -> bool:
+    if fmt == "HEIF":
+        return _heif_available()
+    if fmt in ("WEBP", "AVIF"):
+        return bool(features.check(fmt.lower()))
+    return True
+
+
+def timed(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def plain_decode(data: bytes) -> None:
+    with Image.open(io.BytesIO(data)) as img:
+        img.convert("L")
+
+
+def thumbnail_decode(data: bytes) -> None:
+    with open_image(data) as img:
+        exif_thumbnail(img)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("image", nargs="?", default=str(SAMPLE))
+    parser.add_argument(
+        "--size", default="4032x3024", help="camera resolution to scale to"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    data = Path(args.image).read_bytes()
+    size = tuple(int(v) for v in args.size.split("x"))
+    with Image.open(io.BytesIO(data)) as img:
+        photo = img.convert("RGB").resize(size, Image.BICUBIC)
+
+    print(f"decode to {WIDTH} dots wide from {size[0]}x{size[1]}:")
+    print(f"  {'format':<8}{'bytes':>10}{'pillow ms':>12}{'sniffed ms':>12}")
+    for fmt, options in FORMATS.items():
+        if not available(fmt):
+            print(f"  {fmt:<8}{'(no encoder installed)':>34}")
+            continue
+        buf = io.BytesIO()
+        photo.save(buf, format=fmt, **options)
+        encoded = buf.getvalue()
+        before = timed(lambda: plain_decode(encoded), args.repeat)
+        after = timed(lambda: _open_gray(encoded, WIDTH, None), args.repeat)
+        print(f"  {fmt:<8}{len(encoded):>10}{before:>12.1f}{after:>12.1f}")
+
+    with open_image(data) as img:
+        has_thumb = exif_thumbnail(img) is not None
+    if has_thumb:
+        ms = timed(lambda: thumbnail_decode(data), args.repeat)
+        print(f"EXIF thumbnail of {Path(args.image).name}: {ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
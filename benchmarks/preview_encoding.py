@@ -0,0 +1,61 @@
+"""Compare preview encodings: PNG at several zlib levels vs. raw packed bits.
+
+Usage: python -m benchmarks.preview_encoding [image] [--repeat N]
+"""
+
+import argparse
+import io
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from ditherbooth.imaging.process import to_1bit
+from ditherbooth.imaging.raster import pack_1bit
+
+SAMPLE = (
+    Path(__file__).resolve().parent.parent
+    / "ditherbooth"
+    / "static"
+    / "examples"
+    / "original.png"
+)
+SIZES = {"continuous58": (463, None), "label100x150": (800, 1200)}
+
+
+def encode_png(img: Image.Image, level: int) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", compress_level=level)
+    return buf.getvalue()
+
+
+def timed(func, repeat: int):
+    best = float("inf")
+    out = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("image", nargs="?", default=str(SAMPLE))
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    img_bytes = Path(args.image).read_bytes()
+
+    for media, (width, height) in SIZES.items():
+        img = to_1bit(img_bytes, width, height)
+        print(f"{media}: {img.width}x{img.height}")
+        print(f"  {'encoding':<16}{'ms':>8}{'bytes':>10}")
+        for level in (1, 6, 9):
+            ms, data = timed(lambda: encode_png(img, level), args.repeat)
+            print(f"  {'png level ' + str(level):<16}{ms:>8.2f}{len(data):>10}")
+        ms, data = timed(lambda: pack_1bit(img), args.repeat)
+        print(f"  {'raw packed':<16}{ms:>8.2f}{len(data):>10}")
+
+
+if __name__ == "__main__":
+    main()
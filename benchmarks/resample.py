@@ -0,0 +1,95 @@
+"""Compare resampling profiles: conversion time against difference from "best".
+
+The image is scaled to phone-camera size and saved as JPEG and PNG, then
+converted with each profile for every media width. "resize" times the
+scaling step alone and "total" the whole conversion including decoding.
+Quality is the PSNR against the "best" profile (higher is closer, inf is
+identical) of the scaled grayscale image and of the dithered print, the latter
+blurred slightly as the eye sees dots from a distance.
+
+Usage: python -m benchmarks.resample [image] [--size WxH] [--repeat N]
+"""
+
+import argparse
+import io
+import math
+import time
+from pathlib import Path
+
+from PIL import Image, ImageChops, ImageFilter
+
+from ditherbooth.imaging.process import RESAMPLE_PROFILES, _open_gray, _resize, to_1bit
+
+SAMPLE = (
+    Path(__file__).resolve().parent.parent
+    / "ditherbooth"
+    / "static"
+    / "examples"
+    / "original.png"
+)
+SIZES = {"continuous58": (463, None), "label100x150": (800, 1200)}
+
+
+def timed(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def psnr(a: Image.Image, b: Image.Image) -> float:
+    hist = ImageChops.difference(a, b).histogram()
+    mse = sum(count * value * value for value, count in enumerate(hist)) / (
+        a.width * a.height
+    )
+    return math.inf if mse == 0 else 10 * math.log10(255 * 255 / mse)
+
+
+def seen(img: Image.Image) -> Image.Image:
+    return img.convert("L").filter(ImageFilter.GaussianBlur(1.5))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("image", nargs="?", default=str(SAMPLE))
+    parser.add_argument(
+        "--size", default="4032x3024", help="camera resolution to scale to"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    size = tuple(int(v) for v in args.size.split("x"))
+    with Image.open(args.image) as img:
+        photo = img.convert("RGB").resize(size, Image.BICUBIC)
+
+    for fmt in ("JPEG", "PNG"):
+        buf = io.BytesIO()
+        photo.save(buf, format=fmt)
+        data = buf.getvalue()
+        for media, (width, height) in SIZES.items():
+            print(f"{fmt} {size[0]}x{size[1]} -> {media}:")
+            print(
+                f"  {'profile':<10}{'resize ms':>11}{'total ms':>10}{'gray dB':>9}{'print dB':>10}"
+            )
+            decoded, fitted = _open_gray(data, width, height)
+            reference_gray = _resize(decoded, fitted, "best")
+            reference = seen(to_1bit(data, width, height))
+            for profile in RESAMPLE_PROFILES:
+                resize_ms = timed(
+                    lambda: _resize(decoded, fitted, profile), args.repeat
+                )
+                total_ms = timed(
+                    lambda: to_1bit(data, width, height, profile=profile), args.repeat
+                )
+                gray = psnr(_resize(decoded, fitted, profile), reference_gray)
+                printed = psnr(
+                    seen(to_1bit(data, width, height, profile=profile)), reference
+                )
+                print(
+                    f"  {profile:<10}{resize_ms:>11.1f}{total_ms:>10.1f}{gray:>9.1f}{printed:>10.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
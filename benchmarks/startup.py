@@ -0,0 +1,103 @@
+"""Profile kiosk startup: import time per dependency and first-print latency.
+
+Every measurement runs in a fresh interpreter, as after a power cycle.
+
+Usage: python -m benchmarks.startup [image] [--top N]
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+SAMPLE = (
+    Path(__file__).resolve().parent.parent
+    / "ditherbooth"
+    / "static"
+    / "examples"
+    / "original.png"
+)
+
+# Times importing the app, then the same print pipeline twice (cold, then with
+# Pillow and the encoders loaded), optionally after the startup warm-up.
+FIRST_PRINT = """
+import json, sys, time
+start = time.perf_counter()
+import ditherbooth.app as app
+imported = time.perf_counter()
+if sys.argv[2] == "1":
+    app.warm_up()
+warmed = time.perf_counter()
+img_bytes = open(sys.argv[1], "rb").read()
+runs = []
+for _ in range(2):
+    app._raster_cache.clear()
+    t = time.perf_counter()
+    raster = app.get_raster(img_bytes, 463, 8000)
+    app.encode_payload(raster, app.Media.continuous58, app.Lang.EPL, app.DEFAULT_CONFIG)
+    runs.append(time.perf_counter() - t)
+print(json.dumps({"import": imported - start, "warm_up": warmed - imported, "runs": runs}))
+"""
+
+
+def import_breakdown(top: int) -> None:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import ditherbooth.app"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # Children are reported before their parent, so collect depth-1 entries
+    # until the depth-0 line says whose they were.
+    pending: dict = {}
+    direct: dict = {}
+    total = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line[13:]:
+            continue
+        _, cumulative, name = line[12:].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        if depth == 0:
+            if name == "ditherbooth.app":
+                total, direct = int(cumulative), pending
+            pending = {}
+        elif depth == 1:
+            # Grouped by top-level package, except our own modules
+            group = name if name.startswith("ditherbooth") else name.split(".")[0]
+            pending[group] = pending.get(group, 0) + int(cumulative)
+    print(f"import ditherbooth.app: {total / 1000:.1f} ms")
+    print(f"  {'module':<32}{'ms':>8}{'share':>8}")
+    for name, us in sorted(direct.items(), key=lambda kv: -kv[1])[:top]:
+        print(f"  {name:<32}{us / 1000:>8.1f}{us / total:>8.0%}")
+
+
+def first_print(image: str) -> None:
+    print("first print after boot (continuous58, EPL):")
+    print(f"  {'':<12}{'import':>8}{'warm-up':>9}{'1st job':>9}{'2nd job':>9}  ms")
+    for label, warm in (("cold", "0"), ("warmed up", "1")):
+        proc = subprocess.run(
+            [sys.executable, "-c", FIRST_PRINT, image, warm],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        t = json.loads(proc.stdout)
+        cells = [t["import"], t["warm_up"]] + t["runs"]
+        print(f"  {label:<12}" + "".join(f"{v * 1000:>9.1f}" for v in cells))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("image", nargs="?", default=str(SAMPLE))
+    parser.add_argument("--top", type=int, default=12)
+    args = parser.parse_args()
+    import_breakdown(args.top)
+    first_print(args.image)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Measure end-to-end print throughput against the virtual printer.
+
+A virtual printer (see :mod:`ditherbooth.printer.virtual`) is started and
+the app is pointed at it. The image is then submitted ``--count`` times
+through ``/print``, back to back from ``--clients`` kiosks, with the app's
+status polling and queueing in play. The report covers request latency, the
+time until the last label is out and labels per minute.
+
+Usage: python -m benchmarks.throughput [image] [--media M] [--lang L] [--count N] [--clients N] [--adaptive-speed]
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from ditherbooth.printer.virtual import VirtualPrinter
+from ditherbooth.jobs import LINK_BYTES_PER_S
+
+SAMPLE = (
+    Path(__file__).resolve().parent.parent
+    / "ditherbooth"
+    / "static"
+    / "examples"
+    / "original.png"
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("image", nargs="?", default=str(SAMPLE))
+    parser.add_argument("--media", default="label50x30")
+    parser.add_argument("--lang", default="EPL", choices=["EPL", "ZPL"])
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--clients", type=int, default=1)
+    parser.add_argument("--speed", type=int, help="EPL speed setting, 1-6")
+    parser.add_argument(
+        "--adaptive-speed", action="store_true", help="pick EPL speed by print density"
+    )
+    parser.add_argument(
+        "--link", type=float, default=LINK_BYTES_PER_S, help="link speed in bytes/s"
+    )
+    args = parser.parse_args()
+    img_bytes = Path(args.image).read_bytes()
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    # Real time throughout: the app paces jobs by its own print-time model.
+    printer = VirtualPrinter(link_bytes_per_s=args.link)
+    with tempfile.TemporaryDirectory() as tmp:
+        config = {
+            "printer_name": printer.serve_tcp(port=0),
+            "print_dedup_seconds": 0,
+            "epl_speed": args.speed,
+            "adaptive_speed": args.adaptive_speed,
+        }
+        (Path(tmp) / "config.json").write_text(json.dumps(config))
+        os.environ["DITHERBOOTH_CONFIG_PATH"] = str(Path(tmp) / "config.json")
+        os.environ["DITHERBOOTH_PRINT_RATE"] = "0"
+        # Imported here so it picks up the settings above.
+        from fastapi.testclient import TestClient
+
+        from ditherbooth.app import app
+
+        def submit(i: int) -> float:
+            start = time.perf_counter()
+            files = {"file": ("photo.png", img_bytes, "image/png")}
+            resp = client.post(
+                "/print", files=files, data={"media": args.media, "lang": args.lang}
+            )
+            resp.raise_for_status()
+            return time.perf_counter() - start
+
+        with TestClient(app) as client:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(args.clients) as pool:
+                latencies = list(pool.map(submit, range(args.count)))
+            submitted = time.perf_counter() - start
+            printer.wait_idle()
+            done = time.perf_counter() - start
+    printer.close()
+
+    stats = printer.stats()
+    print(
+        f"{args.count} x {args.media} {args.lang} from {args.clients} client(s), link {args.link:.0f} B/s"
+    )
+    print(
+        f"  request latency  median {statistics.median(latencies):.2f} s, max {max(latencies):.2f} s"
+    )
+    print(f"  all submitted    {submitted:.1f} s")
+    print(f"  last label out   {done:.1f} s")
+    print(
+        f"  printer          {stats['labels']} labels, {stats['bytes']} bytes, {stats['errors']} rejected"
+    )
+    print(f"  throughput       {stats['labels_per_minute']} labels/min")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import asyncio
+from collections import OrderedDict, deque
+import math
+import threading
+import time
+from typing import Optional
+
+
+class Overloaded(Exception):
+    """A request was refused; retry after ``retry_after`` seconds."""
+
+    def __init__(
+        self, retry_after: float, status_code: int = 503, detail: str = "Server busy"
+    ):
+        super().__init__(detail)
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.status_code = status_code
+        self.detail = detail
+
+
+class RateLimiter:
+    """Per-client token buckets: ``rate`` requests per second, ``burst`` at once.
+
+    Buckets of idle clients refill to ``burst`` anyway, so only the
+    ``max_clients`` most recently seen are kept. A ``rate`` of 0 disables the
+    limit.
+    """
+
+    def __init__(self, rate: float, burst: int, max_clients: int = 1024):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, key: str) -> None:
+        """Take a token for ``key`` or raise :class:`Overloaded` (429)."""
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            tokens, stamp = self._buckets.pop(key, (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - stamp) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        if not allowed:
+            raise Overloaded((1 - tokens) / self.rate, 429, "Too many requests")
+
+
+class AdmissionGate:
+    """Cap on concurrent jobs, with an optional bounded wait queue.
+
+    Jobs over ``limit`` wait in FIFO order if fewer than ``queue`` are
+    already waiting, for at most ``timeout`` seconds; otherwise they are
+    refused straight away with :class:`Overloaded`. The suggested retry delay
+    comes from a running average of how long jobs hold their slot.
+    """
+
+    def __init__(self, limit: int, queue: int = 0, timeout: float = 30.0):
+        self.limit = max(1, limit)
+        self.queue = max(0, queue)
+        self.timeout = timeout
+        self.in_flight = 0
+        self._waiters: deque = deque()
+        self._avg_hold = 1.0
+
+    @property
+    def available(self) -> bool:
+        return self.in_flight < self.limit and not self._waiters
+
+    def retry_after(self) -> float:
+        return self._avg_hold * (len(self._waiters) + 1) / self.limit
+
+    async def acquire(self, wait: bool = True) -> None:
+        if self.available:
+            self.in_flight += 1
+            return
+        if not wait or len(self._waiters) >= self.queue:
+            raise Overloaded(self.retry_after())
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await asyncio.wait((fut,), timeout=self.timeout)
+        except BaseException:
+            # Cancelled while waiting; hand on a slot granted meanwhile.
+            if fut.done() and not fut.cancelled():
+                self.release()
+            raise
+        finally:
+            if not fut.done():
+                fut.cancel()
+            try:
+                self._waiters.remove(fut)
+            except ValueError:
+                pass
+        if fut.cancelled():
+            raise Overloaded(self.retry_after())
+
+    def release(self, held: Optional[float] = None) -> None:
+        if held is not None:
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * held
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                # The slot passes straight to the next waiter.
+                fut.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def slot(self, wait: bool = True) -> "_Slot":
+        """``async with gate.slot():`` around the admitted work."""
+        return _Slot(self, wait)
+
+
+class _Slot:
+    def __init__(self, gate: AdmissionGate, wait: bool):
+        self.gate = gate
+        self.wait = wait
+        self.started = 0.0
+
+    async def __aenter__(self) -> None:
+        await self.gate.acquire(self.wait)
+        self.started = time.monotonic()
+
+    async def __aexit__(self, *exc) -> None:
+        self.gate.release(time.monotonic() - self.started)
+
+
+def parse_rate(value: Optional[str], default: tuple[float, int]) -> tuple[float, int]:
+    """Parse ``"<per second>,<burst>"`` (e.g. ``"0.5,3"``); ``"0"`` disables."""
+    if not value:
+        return default
+    rate, _, burst = value.partition(",")
+    return float(rate), int(burst or max(1, math.ceil(float(rate))))
@@ -1,26 +1,68 @@
 from enum import Enum
 from pathlib import Path
+import base64
+import csv
+import hashlib
 import io
+import itertools
 import json
 import logging
 import os
+import struct
 import subprocess
 import tempfile
-from typing import Optional
+import time
+from typing import TYPE_CHECKING, Optional
 import asyncio
+from contextlib import AsyncExitStack, asynccontextmanager
 import uuid
 from datetime import datetime, timezone
 
 from fastapi import FastAPI, File, Form, HTTPException, UploadFile, Request
-from fastapi.responses import FileResponse, JSONResponse, Response
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.concurrency import run_in_threadpool
 from PIL import Image, UnidentifiedImageError
 
-from ditherbooth.imaging.process import to_1bit
+from ditherbooth.admission import AdmissionGate, Overloaded, RateLimiter, parse_rate
+from ditherbooth.cache import LRUCache, TTLCache
+from ditherbooth.events import EventHub, StageTimer, format_event
+from ditherbooth.imaging.decode import UnsupportedImage
+from ditherbooth.imaging.process import (
+    BANDED_MIN_ROWS,
+    DEFAULT_RESAMPLE,
+    RESAMPLE_PROFILES,
+    fit_size,
+    fitted_height,
+    iter_1bit_bands,
+    to_1bit,
+    to_1bit_ordered,
+    upright_size,
+)
+from ditherbooth.imaging import raster as raster_ops
+from ditherbooth.jobs import JobTracker
+from ditherbooth.journal import JobJournal
+from ditherbooth.profiling import ProfileMiddleware, SamplingProfiler
+from ditherbooth.recent import RecentPrints
+from ditherbooth.shared import PrintQueue, SharedCache, default_cache_path
+from ditherbooth.imaging.tone import (
+    WEDGE_LEVELS,
+    lut_from_gamma,
+    lut_from_response,
+    step_wedge,
+)
+from ditherbooth.imaging.raster import PackedRaster, pack_1bit, png_bytes
 from ditherbooth.printer.cups import spool_raw
-from ditherbooth.printer.epl import img_to_epl_gw
-from ditherbooth.printer.zpl import img_to_zpl_gf
+from ditherbooth.printer.status import PrinterStatus, query_status
+from ditherbooth.printer.epl import iter_raster_to_epl_gw, raster_to_epl_gw
+from ditherbooth.printer.zpl import iter_raster_to_zpl_gf, raster_to_zpl_gf
+
+# Template rendering (ImageDraw/ImageFont) and the native encoder are only used
+# by the template routes, so they are imported on first use to keep kiosk boot
+# fast; see ``python -m benchmarks.startup``.
+if TYPE_CHECKING:
+    from ditherbooth.imaging.render import MergeRenderer
+    from ditherbooth.printer.vector import NativeLabel
 
 
 class Media(str, Enum):
@@ -54,7 +96,33 @@ PRINTER_NAME = os.getenv("DITHERBOOTH_PRINTER", "Zebra_LP2844")
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Optional warm-up so the first guest's print is as fast as later ones.
+    if os.getenv("DITHERBOOTH_WARMUP", "0") not in ("", "0"):
+        start = time.perf_counter()
+        try:
+            await run_in_threadpool(warm_up)
+        except Exception:  # noqa: BLE001
+            logger.exception("Warm-up failed")
+        else:
+            logger.info(
+                "Warm-up finished in %.0f ms", (time.perf_counter() - start) * 1000
+            )
+    replay = asyncio.create_task(replay_journal())
+    spooler = asyncio.create_task(run_spooler()) if SHARED_STATE else None
+    watcher = asyncio.create_task(watch_printer())
+    yield
+    replay.cancel()
+    watcher.cancel()
+    if spooler is not None:
+        spooler.cancel()
+        get_print_queue().release(_spooler_id)
+    close_journal()
+
+
+app = FastAPI(lifespan=lifespan)
 static_dir = Path(__file__).parent / "static"
 app.mount("/static", StaticFiles(directory=static_dir), name="static")
 
@@ -64,12 +132,1036 @@ async def index() -> FileResponse:
     return FileResponse(static_dir / "index.html")
 
 
+# Packed 1-bit rasters keyed by upload digest and target size. A preview
+# followed by a print, or re-printing with another language, darkness or speed,
+# only re-composes the header around the cached body.
+_raster_cache = LRUCache(maxsize=32)
+
+
+def media_box(media: Media, cfg: dict) -> tuple:
+    """Target width and max height in dots for ``media``.
+
+    Continuous media have no fixed height; they are capped by the configured
+    ``max_continuous_height_dots`` (``None`` for no limit).
+    """
+    width, fixed_height = MEDIA_DIMENSIONS[media]
+    if fixed_height is None:
+        return width, cfg.get("max_continuous_height_dots")
+    return width, fixed_height
+
+
+def packed_raster(
+    data: bytes, width: int, max_height: Optional[int], height: Optional[int] = None
+) -> PackedRaster:
+    """Check a client-dithered bitmap (rows as in :func:`pack_1bit`) for printing.
+
+    It must be whole rows at exactly ``width`` dots and no taller than
+    ``max_height``; ``height``, if the client sent it, must match too. Row
+    padding bits are cleared as Pillow does, so the payload is the same as
+    if the server had dithered it.
+    """
+    row_bytes = (width + 7) // 8
+    if not data or len(data) % row_bytes:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Bitmap must be whole rows of {row_bytes} bytes ({width} dots wide)",
+        )
+    rows = len(data) // row_bytes
+    if height is not None and height != rows:
+        raise HTTPException(
+            status_code=400, detail=f"Bitmap has {rows} rows, not {height}"
+        )
+    if max_height and rows > max_height:
+        raise HTTPException(
+            status_code=400, detail=f"Bitmap is taller than {max_height} dots"
+        )
+    pad = row_bytes * 8 - width
+    if pad:
+        mask = (0xFF << pad) & 0xFF
+        data = bytearray(data)
+        data[row_bytes - 1 :: row_bytes] = bytes(
+            b & mask for b in data[row_bytes - 1 :: row_bytes]
+        )
+        data = bytes(data)
+    return PackedRaster(width, rows, data)
+
+
+def get_raster(
+    img_bytes: bytes,
+    width: int,
+    max_height: Optional[int],
+    lut: Optional[tuple] = None,
+    profile: str = DEFAULT_RESAMPLE,
+    rotate: bool = False,
+) -> PackedRaster:
+    """The packed 1-bit raster for an upload, from the cache when possible.
+
+    With ``rotate`` the image is printed turned 90° clockwise (see
+    :func:`choose_rotation`).
+    """
+    key = (
+        hashlib.sha256(img_bytes).hexdigest(),
+        width,
+        max_height,
+        lut,
+        profile,
+        rotate,
+    )
+    raster = _raster_cache.get(key) or load_shared_raster(key)
+    if raster is not None:
+        _raster_cache.put(key, raster)
+    else:
+        if rotate:
+            # Dither upright with the media width along the image's height,
+            # then turn the packed bits; centred across the media.
+            printed_w, printed_h = fit_size(
+                upright_size(img_bytes)[::-1], width, max_height
+            )
+            img = to_1bit(img_bytes, printed_h, width, lut=lut, profile=profile)
+            raster = raster_ops.rotate_90(
+                raster_ops.center_rows(PackedRaster.from_image(img), width)
+            )
+        elif fitted_height(img_bytes, width, max_height) > BANDED_MIN_ROWS:
+            # Very tall continuous prints: dither strip by strip and keep
+            # only the packed rows.
+            raster = PackedRaster.from_bands(
+                iter_1bit_bands(img_bytes, width, max_height, lut=lut, profile=profile)
+            )
+        else:
+            raster = PackedRaster.from_image(
+                to_1bit(img_bytes, width, max_height, lut=lut, profile=profile)
+            )
+        _raster_cache.put(key, raster)
+        store_shared_raster(key, raster)
+    return raster
+
+
+# Orientation goals for ``auto_rotate``: "area" turns images that print larger
+# turned, "feed" (continuous media) turns those that print shorter. A turn has
+# to win by this factor, so near-square images stay upright.
+ROTATE_GOALS = ("off", "area", "feed")
+ROTATE_MIN_GAIN = 1.1
+
+
+def choose_rotation(img_bytes: bytes, media: Media, cfg: dict) -> bool:
+    """Whether to print the upload turned 90°, per ``auto_rotate``.
+
+    Compares the printed size both ways, from the image header only. On
+    fixed labels the feed is the label either way, so only area counts.
+    """
+    goal = cfg.get("auto_rotate", "off")
+    if goal not in ROTATE_GOALS[1:]:
+        return False
+    width, max_height = media_box(media, cfg)
+    size = upright_size(img_bytes)
+    upright_w, upright_h = fit_size(size, width, max_height)
+    turned_w, turned_h = fit_size(size[::-1], width, max_height)
+    if goal == "feed" and MEDIA_DIMENSIONS[media][1] is None:
+        return turned_h * ROTATE_MIN_GAIN <= upright_h
+    return turned_w * turned_h >= upright_w * upright_h * ROTATE_MIN_GAIN
+
+
+# Jobs with more packed raster data than this are streamed to the printer in
+# chunks rather than built as one payload.
+STREAM_MIN_BYTES = 256 * 1024
+
+
+def encode_payload(
+    raster: PackedRaster, media: Media, lang: Lang, cfg: dict, stream: bool = False
+):
+    """Compose the printer payload for a packed raster; no pixel work.
+
+    Returns bytes, or with ``stream`` an iterator of chunks (header, row
+    bands, footer) that :func:`spool_raw` writes as they are produced.
+    """
+    if lang == Lang.ZPL:
+        return iter_raster_to_zpl_gf(raster) if stream else raster_to_zpl_gf(raster)
+    encode_epl = iter_raster_to_epl_gw if stream else raster_to_epl_gw
+    cfg_dark = cfg.get("epl_darkness")
+    cfg_speed = cfg.get("epl_speed")
+    if media in (Media.continuous58, Media.continuous80):
+        # Trim trailing white rows for continuous media to avoid
+        # unnecessary feed after content. Leave a tiny post-print
+        # spacing by setting a small form length (Q=16 ≈ 2 mm).
+        raster = raster_ops.trim_bottom_white(raster)
+        return encode_epl(
+            raster,
+            y=0,
+            gap=0,
+            label_height=16,
+            darkness=cfg_dark,
+            speed=cfg_speed,
+        )
+    # For fixed-size labels, start at y=0 and let the printer use
+    # calibrated gap; reduce darkness and speed to avoid thermal cutoffs.
+    return encode_epl(
+        raster,
+        y=0,
+        label_height=MEDIA_DIMENSIONS[media][1],
+        gap=None,
+        darkness=cfg_dark,
+        speed=cfg_speed,
+    )
+
+
+# Fastest safe EPL speed and darkness by print density, as rows of
+# [densest band's black share up to, speed, darkness], in rising density.
+# Sparse labels (text, line art) can run fast with a little more heat; denser
+# ones get the configured epl_speed/epl_darkness. Per-printer tables can be
+# set as ``speed_tables``.
+DEFAULT_SPEED_TABLE = [
+    [0.10, 4, 9],
+    [0.30, 3, 8],
+]
+# Rows of dots per density band, about 8 mm; the head heats up over a band.
+DENSITY_BAND_ROWS = 64
+
+
+def speed_table(cfg: dict) -> list:
+    return (cfg.get("speed_tables") or {}).get(printer_key(cfg)) or DEFAULT_SPEED_TABLE
+
+
+def adapt_speed(raster: PackedRaster, lang: Lang, cfg: dict) -> dict:
+    """``cfg`` with the fastest EPL speed and darkness safe for ``raster``.
+
+    Looks up the densest band in the printer's speed table; with
+    ``adaptive_speed`` off, for ZPL, or when the label is denser than every
+    row, ``cfg`` is returned as is.
+    """
+    if lang != Lang.EPL or not cfg.get("adaptive_speed"):
+        return cfg
+    peak = max(raster_ops.band_density(raster, DENSITY_BAND_ROWS), default=0.0)
+    for max_density, speed, darkness in speed_table(cfg):
+        if peak <= max_density:
+            return {**cfg, "epl_speed": speed, "epl_darkness": darkness}
+    return cfg
+
+
+def warm_up() -> None:
+    """Run a synthetic image through decoding, dithering and every encoder.
+
+    The first real job otherwise pays for Pillow's plugin registration and
+    decoder setup, resampling kernels and a cold threadpool worker. Nothing
+    is cached, spooled or written.
+    """
+    gradient = Image.linear_gradient("L").resize((96, 64)).convert("RGB")
+    for fmt in ("JPEG", "PNG"):
+        buf = io.BytesIO()
+        gradient.save(buf, format=fmt)
+        img_bytes = buf.getvalue()
+        for media in Media:
+            width, max_height = media_box(media, DEFAULT_CONFIG)
+            raster = PackedRaster.from_image(to_1bit(img_bytes, width, max_height))
+            for lang in Lang:
+                encode_payload(raster, media, lang, DEFAULT_CONFIG)
+                b"".join(
+                    encode_payload(raster, media, lang, DEFAULT_CONFIG, stream=True)
+                )
+        png_bytes(to_1bit_ordered(img_bytes, width, max_height))
+        png_bytes(raster.to_image())
+
+
+# ---- Admission control ----
+
+# Imaging jobs allowed to run at once. Prints over the cap wait in a bounded
+# queue; previews are cheap to redo, so they get a smaller share and are
+# refused instead of queued.
+IMAGING_SLOTS = int(
+    os.getenv("DITHERBOOTH_IMAGING_SLOTS", str(min(4, os.cpu_count() or 1)))
+)
+PREVIEW_SLOTS = int(
+    os.getenv("DITHERBOOTH_PREVIEW_SLOTS", str(max(1, IMAGING_SLOTS // 2)))
+)
+PRINT_QUEUE = int(os.getenv("DITHERBOOTH_PRINT_QUEUE", "16"))
+PRINT_QUEUE_TIMEOUT = float(os.getenv("DITHERBOOTH_PRINT_QUEUE_TIMEOUT", "30"))
+_imaging_gate = AdmissionGate(
+    IMAGING_SLOTS, queue=PRINT_QUEUE, timeout=PRINT_QUEUE_TIMEOUT
+)
+_preview_gate = AdmissionGate(PREVIEW_SLOTS)
+# Per-client token buckets, "<per second>,<burst>"; "0" disables.
+_print_limiter = RateLimiter(*parse_rate(os.getenv("DITHERBOOTH_PRINT_RATE"), (1.0, 5)))
+_preview_limiter = RateLimiter(
+    *parse_rate(os.getenv("DITHERBOOTH_PREVIEW_RATE"), (5.0, 20))
+)
+
+
+def client_key(request: Request) -> str:
+    """Rate-limit key: the ``X-Client-Id`` header (kiosks behind one NAT), else the IP."""
+    return request.headers.get("X-Client-Id") or (
+        request.client.host if request.client else "unknown"
+    )
+
+
+def overloaded_error(exc: Overloaded) -> HTTPException:
+    return HTTPException(
+        status_code=exc.status_code,
+        detail=exc.detail,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+def check_rate(request: Request, print_job: bool) -> None:
+    """Take a token from the client's bucket or fail fast with 429."""
+    try:
+        (_print_limiter if print_job else _preview_limiter).check(client_key(request))
+    except Overloaded as exc:
+        raise overloaded_error(exc) from exc
+
+
+@asynccontextmanager
+async def imaging_slot(print_job: bool):
+    """Hold an imaging slot for the block, or fail fast with 503.
+
+    Prints queue for a slot (bounded); previews never wait.
+    """
+    try:
+        async with AsyncExitStack() as stack:
+            if not print_job:
+                await stack.enter_async_context(_preview_gate.slot(wait=False))
+            await stack.enter_async_context(_imaging_gate.slot(wait=print_job))
+            yield
+    except Overloaded as exc:
+        raise overloaded_error(exc) from exc
+
+
+# ---- Printer status and job tracking ----
+
+# Job, queue and printer updates for /api/events streams.
+_events = EventHub()
+
+
+def job_event(job) -> dict:
+    """A job's state plus its ``position`` among the unfinished jobs (0 is next)."""
+    data = job.to_dict()
+    data["position"] = next(
+        (i for i, j in enumerate(_jobs.active()) if j.id == job.id), None
+    )
+    return data
+
+
+def queue_event() -> dict:
+    return {"jobs": len(_jobs.active()), "eta_seconds": round(_jobs.queue_eta(), 1)}
+
+
+def publish_job(job) -> None:
+    """Push a job's new state to its client, and the queue to everyone."""
+    if _events.subscribers:
+        _events.publish("job", job_event(job), job.client)
+        _events.publish("queue", queue_event())
+
+
+_jobs = JobTracker(on_change=publish_job)
+# Status replies are reused for this long, so a burst of jobs polls once.
+PRINTER_STATUS_TTL = 1.0
+_printer_status = TTLCache(maxsize=4, ttl=PRINTER_STATUS_TTL)
+# How long a job is held back for the printer before giving up with 503.
+PRINTER_WAIT_TIMEOUT = float(os.getenv("DITHERBOOTH_PRINTER_WAIT_TIMEOUT", "30"))
+
+
+def polls_status(cfg: dict, printer_name: str) -> bool:
+    """Whether ``printer_status_poll`` is on for ``printer_name``.
+
+    Unset, it is on for network printers and CUPS queues but off for
+    devices: a query written to a device that can't answer (many have no
+    back channel) costs the full timeout on every poll.
+    """
+    poll = cfg.get("printer_status_poll")
+    return not printer_name.startswith("/dev/") if poll is None else bool(poll)
+
+
+async def printer_status(
+    cfg: dict, lang: Optional[Lang] = None
+) -> Optional[PrinterStatus]:
+    """Recent printer status, or ``None`` when polling is off or in test mode.
+
+    The printer is asked in ``lang``, the language of the job about to be
+    sent (the configured default otherwise).
+    """
+    printer_name = cfg.get("printer_name") or PRINTER_NAME
+    if cfg.get("test_mode") or not polls_status(cfg, printer_name):
+        return None
+    lang = (lang or Lang(cfg.get("default_lang", Lang.EPL.value))).value
+    key = (printer_name, lang)
+    status = _printer_status.get(key)
+    if status is None:
+        status = await run_in_threadpool(query_status, printer_name, lang)
+        _printer_status.put(key, status)
+    return status
+
+
+def refresh_jobs(status: Optional[PrinterStatus]) -> None:
+    _jobs.refresh(status.pending_jobs if status is not None else None)
+
+
+async def wait_for_printer(cfg: dict, lang: Optional[Lang] = None) -> None:
+    """Hold a job until the printer can take it.
+
+    Jobs wait while the printer reports paper out, head open, pause or a
+    full buffer, or while ``printer_max_pending_jobs`` of ours are still
+    printing, so its receive buffer never overflows. Gives up with 503 after
+    ``PRINTER_WAIT_TIMEOUT`` seconds.
+    """
+    limit = int(cfg.get("printer_max_pending_jobs") or 0)
+    deadline = time.monotonic() + PRINTER_WAIT_TIMEOUT
+    while True:
+        status = await printer_status(cfg, lang)
+        refresh_jobs(status)
+        blocking = status.blocking if status is not None else []
+        if not blocking and (not limit or _jobs.in_printer() < limit):
+            return
+        if time.monotonic() >= deadline:
+            detail = (
+                "Printer not ready: " + ", ".join(blocking)
+                if blocking
+                else "Printer busy"
+            )
+            retry_after = max(1, int(_jobs.queue_eta()) + 1)
+            raise HTTPException(
+                status_code=503,
+                detail=detail,
+                headers={"Retry-After": str(retry_after)},
+            )
+        await asyncio.sleep(PRINTER_STATUS_TTL)
+
+
+# ---- Job journal ----
+
+# Payloads are journaled next to config.json before spooling, so jobs
+# accepted before a crash or power cut are printed after the restart.
+JOURNAL_ENABLED = os.getenv("DITHERBOOTH_JOURNAL", "1") not in ("", "0")
+_journal: Optional[JobJournal] = None
+# Unfinished jobs found when the journal was opened, until replayed.
+_journal_pending: list = []
+
+
+def get_journal() -> Optional[JobJournal]:
+    global _journal
+    # With shared state the print queue is durable itself.
+    if not JOURNAL_ENABLED or SHARED_STATE:
+        return None
+    if _journal is None:
+        journal = JobJournal(get_config_path().parent / "journal.log")
+        _journal_pending.extend(journal.open())
+        _journal = journal
+    return _journal
+
+
+def close_journal() -> None:
+    global _journal
+    if _journal is not None:
+        _journal.close()
+        _journal = None
+
+
+async def replay_journal() -> None:
+    """Print the jobs a previous run accepted but never spooled."""
+    journal = get_journal()
+    if journal is None or not _journal_pending:
+        return
+    pending = list(_journal_pending)
+    _journal_pending.clear()
+    logger.info("Replaying %d unfinished print job(s) from the journal", len(pending))
+    for journal_id in pending:
+        meta = journal.meta(journal_id)
+        try:
+            media, lang = Media(meta["media"]), Lang(meta["lang"])
+            await submit_payload(
+                journal.read(journal_id),
+                media,
+                lang,
+                load_config(),
+                meta.get("rows"),
+                journal_id,
+            )
+        except Exception:  # noqa: BLE001
+            logger.exception("Replaying journaled job %s failed", journal_id)
+
+
+# ---- Shared state across worker processes ----
+
+# For ``uvicorn --workers N``: rasters, duplicate detection and the print
+# queue live in SQLite, and one elected process per printer spools its jobs.
+SHARED_STATE = os.getenv("DITHERBOOTH_SHARED_STATE", "0") not in ("", "0")
+SHARED_CACHE_MB = int(os.getenv("DITHERBOOTH_SHARED_CACHE_MB", "64"))
+# A spooler that stops renewing its lease this long is replaced.
+SPOOLER_LEASE_SECONDS = 10.0
+# How often queued jobs and results are looked for.
+SPOOLER_POLL_INTERVAL = 0.05
+_spooler_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+_spooler_wake: Optional[asyncio.Event] = None
+_print_queue: Optional[PrintQueue] = None
+_shared_cache: Optional[SharedCache] = None
+
+
+def get_print_queue() -> Optional[PrintQueue]:
+    global _print_queue
+    if SHARED_STATE and _print_queue is None:
+        _print_queue = PrintQueue(get_config_path().parent / "state.db")
+    return _print_queue
+
+
+def get_shared_cache() -> Optional[SharedCache]:
+    global _shared_cache
+    if SHARED_STATE and _shared_cache is None:
+        # One cache per installation, in memory where possible.
+        path = os.getenv("DITHERBOOTH_SHARED_CACHE_PATH")
+        if not path:
+            install = hashlib.sha256(
+                str(get_config_path().parent.resolve()).encode()
+            ).hexdigest()[:12]
+            path = default_cache_path(f"ditherbooth-{install}.cache.db")
+        _shared_cache = SharedCache(path, SHARED_CACHE_MB * 1024 * 1024)
+    return _shared_cache
+
+
+def shared_key(key: tuple) -> str:
+    return hashlib.sha256(repr(key).encode()).hexdigest()
+
+
+def load_shared_raster(key: tuple) -> Optional[PackedRaster]:
+    cache = get_shared_cache()
+    value = cache.get(shared_key(key)) if cache is not None else None
+    if value is None:
+        return None
+    width, height = struct.unpack_from("<II", value)
+    return PackedRaster(width, height, value[8:])
+
+
+def store_shared_raster(key: tuple, raster: PackedRaster) -> None:
+    cache = get_shared_cache()
+    if cache is not None:
+        cache.put(
+            shared_key(key),
+            struct.pack("<II", raster.width, raster.height) + raster.data,
+        )
+
+
+def queued_job_dict(row: dict) -> dict:
+    """A queued job as :meth:`Job.to_dict` would describe it, from the shared queue.
+
+    Only the spooling process tracks printer-confirmed completion; elsewhere
+    a spooled job is done when its ETA passes.
+    """
+    meta, result, now = row["meta"], row["result"] or {}, time.time()
+    eta = result.get("eta")
+    finished_at = None
+    if row["state"] == "spooled":
+        state = "printing" if eta and eta > now else "done"
+    else:
+        state = {"spooling": "printing"}.get(row["state"], row["state"])
+    if state == "done":
+        finished_at = eta
+    elif state == "failed":
+        finished_at = row["finished"]
+    return {
+        "id": row["id"],
+        "media": meta.get("media"),
+        "lang": meta.get("lang"),
+        "rows": meta.get("rows"),
+        "bytes": meta.get("bytes"),
+        "submitted_at": row["submitted"],
+        "state": state,
+        "started_at": None,
+        "eta": eta,
+        "finished_at": finished_at,
+        "completion": "estimate" if state == "done" else None,
+        "error": result.get("detail") if state == "failed" else None,
+        "eta_seconds": (
+            round(max(0.0, eta - now), 1) if state == "printing" and eta else None
+        ),
+    }
+
+
+async def submit_queued(
+    payload,
+    media: Media,
+    lang: Lang,
+    cfg: dict,
+    rows: int,
+    job_id: Optional[str] = None,
+    client: Optional[str] = None,
+) -> dict:
+    """Queue a job for the printer's elected spooler and wait until it is spooled."""
+    queue = get_print_queue()
+    if not isinstance(payload, (bytes, bytearray)):
+        payload = await run_in_threadpool(b"".join, payload)
+    job_id = job_id or uuid.uuid4().hex[:12]
+    meta = {
+        "media": media.value,
+        "lang": lang.value,
+        "rows": rows,
+        "bytes": len(payload),
+        "client": client,
+        "speed": cfg.get("epl_speed") if lang == Lang.EPL else None,
+    }
+    await run_in_threadpool(
+        queue.enqueue, job_id, printer_key(cfg), meta, bytes(payload)
+    )
+    if _spooler_wake is not None:
+        _spooler_wake.set()
+    while True:
+        job = await run_in_threadpool(queue.job, job_id)
+        result = job["result"] or {}
+        if job["state"] == "spooled":
+            eta_seconds = round(max(0.0, result["eta"] - time.time()), 1)
+            return {"status": "ok", "job_id": job_id, "eta_seconds": eta_seconds}
+        if job["state"] == "failed":
+            raise HTTPException(
+                status_code=result["status_code"],
+                detail=result["detail"],
+                headers=result.get("headers"),
+            )
+        await asyncio.sleep(SPOOLER_POLL_INTERVAL)
+
+
+async def run_spooler() -> None:
+    """Spool queued jobs for every printer this process holds the lease for.
+
+    Every worker runs this. Per printer the lease makes one of them the
+    spooler, which sends the jobs one at a time in queue order, pacing them
+    with :func:`wait_for_printer` as a single process would. If it dies, the
+    lease runs out and another worker takes over.
+    """
+    global _spooler_wake
+    _spooler_wake = asyncio.Event()
+    queue = get_print_queue()
+    while True:
+        try:
+            for printer in await run_in_threadpool(queue.printers_with_work):
+                while await run_in_threadpool(
+                    queue.acquire, printer, _spooler_id, SPOOLER_LEASE_SECONDS
+                ):
+                    job = await run_in_threadpool(queue.next_job, printer)
+                    if job is None:
+                        break
+                    await spool_queued_job(queue, job)
+        except asyncio.CancelledError:
+            raise
+        except Exception:  # noqa: BLE001
+            logger.exception("Spooler failed; retrying")
+        _spooler_wake.clear()
+        try:
+            await asyncio.wait_for(_spooler_wake.wait(), SPOOLER_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def keep_lease(queue: PrintQueue, printer: str) -> None:
+    while True:
+        await asyncio.sleep(SPOOLER_LEASE_SECONDS / 3)
+        await run_in_threadpool(
+            queue.acquire, printer, _spooler_id, SPOOLER_LEASE_SECONDS
+        )
+
+
+async def spool_queued_job(queue: PrintQueue, row: dict) -> None:
+    cfg = load_config()
+    meta = row["meta"]
+    job = _jobs.new(
+        meta["media"],
+        meta["lang"],
+        meta["rows"],
+        len(row["payload"]),
+        row["id"],
+        meta.get("client"),
+    )
+    # Waiting for the printer can outlast the lease.
+    heartbeat = asyncio.create_task(keep_lease(queue, row["printer"]))
+    try:
+        await wait_for_printer(cfg, Lang(meta["lang"]))
+        _jobs.start(
+            job,
+            (
+                meta.get("speed", cfg.get("epl_speed"))
+                if meta["lang"] == Lang.EPL.value
+                else None
+            ),
+        )
+        await run_in_threadpool(spool_raw, row["printer"], row["payload"])
+    except HTTPException as exc:
+        _jobs.fail(job, str(exc.detail))
+        state, result = "failed", {
+            "status_code": exc.status_code,
+            "detail": exc.detail,
+            "headers": exc.headers,
+        }
+    except Exception as exc:  # noqa: BLE001
+        logger.exception("Printing queued job %s failed", row["id"])
+        _jobs.fail(job, type(exc).__name__)
+        status = 502 if isinstance(exc, subprocess.CalledProcessError) else 500
+        state, result = "failed", {
+            "status_code": status,
+            "detail": "Printer error" if status == 502 else "Print failed",
+        }
+    else:
+        state, result = "spooled", {"eta": job.eta}
+    finally:
+        heartbeat.cancel()
+    await run_in_threadpool(queue.finish, row["id"], state, result)
+
+
+async def submit_payload(
+    payload,
+    media: Media,
+    lang: Lang,
+    cfg: dict,
+    rows: Optional[int] = None,
+    journal_id: Optional[str] = None,
+    job_id: Optional[str] = None,
+    client: Optional[str] = None,
+) -> dict:
+    """Spool an encoded payload, or just account for it in test mode.
+
+    The job is tracked from here on, as ``job_id`` if given; the result
+    carries its ``job_id`` and ``eta_seconds`` (estimated time until the
+    label is out). ``rows`` is the printed height in dots, defaulting to the
+    media's label height. Updates are pushed to ``client``'s event streams.
+
+    The payload is journaled first and marked off once spooled; a
+    ``journal_id`` means it is being replayed from the journal already. With
+    shared state it goes through the shared print queue instead.
+    """
+    nbytes = len(payload) if isinstance(payload, (bytes, bytearray)) else 0
+    rows = rows or MEDIA_DIMENSIONS[media][1] or 0
+    test_mode = bool(cfg.get("test_mode", False))
+    if not test_mode and get_print_queue() is not None:
+        return await submit_queued(payload, media, lang, cfg, rows, job_id, client)
+    job = _jobs.new(media.value, lang.value, rows, nbytes, job_id, client)
+    # Test mode prints nothing, so only replayed jobs need marking off.
+    journal = get_journal() if journal_id or not test_mode else None
+    if test_mode:
+        # In test mode, delay to simulate print time and skip spooling.
+        delay_ms = int(cfg.get("test_mode_delay_ms", 0) or 0)
+        if delay_ms > 0:
+            await asyncio.sleep(delay_ms / 1000)
+        _jobs.finish(job)
+        nbytes = nbytes or sum(len(c) for c in payload)
+        if journal is not None:
+            journal.mark(journal_id, "spooled")
+        return {
+            "status": "ok",
+            "mode": "test",
+            "bytes": nbytes,
+            "media": media.value,
+            "lang": lang.value,
+            "job_id": job.id,
+        }
+
+    printer_name = cfg.get("printer_name") or PRINTER_NAME
+    replay = journal_id is not None
+    if journal is not None and not replay:
+        meta = {"media": media.value, "lang": lang.value, "rows": rows}
+        payload = await run_in_threadpool(journal.record, job.id, meta, payload)
+        journal_id = job.id
+    try:
+        await wait_for_printer(cfg, lang)
+        _jobs.start(job, cfg.get("epl_speed") if lang == Lang.EPL else None)
+        await run_in_threadpool(spool_raw, printer_name, payload)
+    except HTTPException as exc:
+        _jobs.fail(job, str(exc.detail))
+        # The client is told; a replayed job stays for the next start.
+        if journal is not None and not replay:
+            journal.mark(journal_id, "failed")
+        raise
+    except Exception as exc:  # noqa: BLE001
+        _jobs.fail(job, type(exc).__name__)
+        if journal is not None:
+            journal.mark(journal_id, "failed")
+        raise
+    if journal is not None:
+        journal.mark(journal_id, "spooled")
+    return {
+        "status": "ok",
+        "job_id": job.id,
+        "eta_seconds": job.to_dict()["eta_seconds"],
+    }
+
+
+@app.get("/api/printer/status")
+async def get_printer_status() -> dict:
+    """Printer condition plus the jobs still queued or printing, with ETAs."""
+    cfg = load_config()
+    status = await printer_status(cfg)
+    refresh_jobs(status)
+    jobs = [job.to_dict() for job in _jobs.active()]
+    queue = get_print_queue()
+    if queue is not None:
+        # Jobs still in the shared queue, whichever worker took them.
+        known = {job["id"] for job in jobs}
+        jobs += [
+            queued_job_dict(row)
+            for row in await run_in_threadpool(queue.active)
+            if row["id"] not in known
+        ]
+    return {
+        "printer": status.to_dict() if status is not None else None,
+        "jobs": jobs,
+        "eta_seconds": round(_jobs.queue_eta(), 1),
+    }
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str) -> dict:
+    cfg = load_config()
+    refresh_jobs(await printer_status(cfg))
+    job = _jobs.get(job_id)
+    if job is not None:
+        return job.to_dict()
+    queue = get_print_queue()
+    row = await run_in_threadpool(queue.job, job_id) if queue is not None else None
+    if row is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return queued_job_dict(row)
+
+
+# While anyone is subscribed to events, the printer is polled this often and
+# changes are pushed; streams send a comment after this long without events
+# so proxies keep them open.
+EVENTS_PRINTER_INTERVAL = 2.0
+EVENTS_KEEPALIVE = 15.0
+# The latest "printer" event, replayed to new streams.
+_printer_event: Optional[dict] = None
+
+
+async def watch_printer() -> None:
+    """Poll the printer while there are event streams and push what changes.
+
+    Refreshing the jobs here also completes them (and pushes that) without
+    anyone polling ``/api/jobs``.
+    """
+    global _printer_event
+    while True:
+        await asyncio.sleep(EVENTS_PRINTER_INTERVAL)
+        if not _events.subscribers:
+            continue
+        try:
+            status = await printer_status(load_config())
+        except Exception:  # noqa: BLE001
+            logger.exception("Printer status poll failed")
+            continue
+        refresh_jobs(status)
+        event = {"printer": status.to_dict() if status is not None else None}
+        if event != _printer_event:
+            _printer_event = event
+            _events.publish("printer", event)
+
+
+@app.get("/api/events")
+async def stream_events(
+    request: Request, client: Optional[str] = None
+) -> StreamingResponse:
+    """Server-sent events for one kiosk.
+
+    ``client`` is the kiosk's ``X-Client-Id`` (its address if not given), or
+    ``*`` for every client's events. Events: ``job`` (state, ETA and
+    position of the kiosk's jobs), ``stage`` (render stage timings of its
+    prints), ``result`` (outcome of a ``wait=false`` print), ``queue`` and
+    ``printer`` for everyone, and ``resync`` after a stream fell behind.
+    """
+    client = client or client_key(request)
+    sub = _events.subscribe(None if client == "*" else client)
+
+    async def events():
+        try:
+            yield b"retry: 2000\n\n"
+            yield format_event("queue", queue_event())
+            if _printer_event is not None:
+                yield format_event("printer", _printer_event)
+            for job in _jobs.active():
+                if sub.wants(job.client):
+                    yield format_event("job", job_event(job))
+            while not await request.is_disconnected():
+                event = await sub.get(EVENTS_KEEPALIVE)
+                if event is None:
+                    yield b": keepalive\n\n"
+                    continue
+                event_id, kind, data = event
+                yield format_event(kind, data, event_id)
+        finally:
+            sub.close()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ---- Duplicate print suppression ----
+
+# How long an Idempotency-Key is remembered.
+IDEMPOTENCY_TTL = 24 * 3600
+# How long a duplicate waits on the original in another worker before taking
+# the job over; longer than a print can queue for imaging and the printer.
+DUPLICATE_WAIT_TIMEOUT = float(os.getenv("DITHERBOOTH_DUPLICATE_WAIT_TIMEOUT", "120"))
+# Finished (and in-flight) print jobs by Idempotency-Key and by content.
+_print_jobs = TTLCache(maxsize=256)
+
+
+def print_fingerprint(img_bytes: bytes, media: Media, lang: Lang) -> str:
+    return f"{hashlib.sha256(img_bytes).hexdigest()}:{media.value}:{lang.value}"
+
+
+def print_settings(cfg: dict, media: Media) -> tuple:
+    """The settings that change what an upload prints as, for duplicate detection."""
+    names = (
+        "epl_darkness",
+        "epl_speed",
+        "max_continuous_height_dots",
+        "auto_rotate",
+        "print_resample",
+        "adaptive_speed",
+    )
+    speed_tables = json.dumps(cfg.get("speed_tables") or {}, sort_keys=True)
+    return tuple(cfg.get(k) for k in names) + (speed_tables, tone_lut(cfg, media))
+
+
+async def print_once(
+    request: Request, fingerprint: str, cfg: dict, media: Media, job
+) -> tuple:
+    """Run the print coroutine ``job`` unless it is a repeat; ``(result, replayed)``.
+
+    A request repeating an ``Idempotency-Key`` header, or uploading the same
+    image for the same media, language and print settings within
+    ``print_dedup_seconds``,
+    gets the original job's result (waiting for it if it is still running)
+    instead of printing again. Failed jobs are forgotten so they can be
+    retried.
+    """
+    keys = []
+    idem_key = request.headers.get("Idempotency-Key")
+    if idem_key:
+        keys.append((("key", idem_key), IDEMPOTENCY_TTL))
+    window = float(cfg.get("print_dedup_seconds") or 0)
+    if window > 0:
+        # Printing the same upload again after a settings change is new work.
+        keys.append((("content", fingerprint, print_settings(cfg, media)), window))
+    if get_print_queue() is not None:
+        return await print_once_shared(keys, fingerprint, job)
+    for key, _ in keys:
+        entry = _print_jobs.get(key)
+        if entry is not None:
+            entry_fingerprint, job_future = entry
+            if entry_fingerprint != fingerprint:
+                raise HTTPException(
+                    status_code=422,
+                    detail="Idempotency-Key was used for a different request",
+                )
+            return await asyncio.shield(job_future), True
+
+    job_future = asyncio.get_running_loop().create_future()
+    for key, ttl in keys:
+        _print_jobs.put(key, (fingerprint, job_future), ttl)
+    try:
+        result = await job()
+    except BaseException as exc:
+        for key, _ in keys:
+            _print_jobs.pop(key)
+        if isinstance(exc, asyncio.CancelledError):
+            job_future.cancel()
+        else:
+            job_future.set_exception(exc)
+            # Mark it retrieved; duplicates waiting on it re-raise it.
+            job_future.exception()
+        raise
+    job_future.set_result(result)
+    return result, False
+
+
+async def print_once_shared(keys: list, fingerprint: str, job) -> tuple:
+    """:func:`print_once` with the keys claimed in the shared queue, across workers."""
+    queue = get_print_queue()
+    loop = asyncio.get_running_loop()
+    claimed = []
+    result = None
+    for key, ttl in keys:
+        skey = shared_key(key)
+        existing = await run_in_threadpool(queue.claim, skey, fingerprint, ttl)
+        while (
+            existing is not None
+            and existing["fingerprint"] == fingerprint
+            and existing["result"] is None
+        ):
+            # Wait for the original; if its worker died, the claim goes stale.
+            deadline = loop.time() + DUPLICATE_WAIT_TIMEOUT
+            result = None
+            while result is None and loop.time() < deadline:
+                await asyncio.sleep(SPOOLER_POLL_INTERVAL)
+                result = await run_in_threadpool(queue.claim_result, skey)
+            if result is not None:
+                existing = {"fingerprint": fingerprint, "result": result}
+            else:
+                existing = await run_in_threadpool(
+                    queue.claim, skey, fingerprint, ttl, DUPLICATE_WAIT_TIMEOUT
+                )
+        if existing is None:
+            claimed.append(skey)
+            continue
+        if existing["fingerprint"] != fingerprint:
+            error = {
+                "status_code": 422,
+                "detail": "Idempotency-Key was used for a different request",
+            }
+            for own in claimed:
+                await run_in_threadpool(queue.settle, own, {"error": error})
+            raise HTTPException(**error)
+        result = existing["result"]
+        break
+    if result is not None:
+        # A duplicate: keys claimed on the way get the original's outcome.
+        for own in claimed:
+            await run_in_threadpool(queue.settle, own, result)
+        if "error" in result:
+            raise HTTPException(**result["error"])
+        return result, True
+
+    try:
+        result = await job()
+    except BaseException as exc:
+        if isinstance(exc, HTTPException):
+            error = {"status_code": exc.status_code, "detail": exc.detail}
+        elif isinstance(exc, subprocess.CalledProcessError):
+            error = {"status_code": 502, "detail": "Printer error"}
+        else:
+            error = {"status_code": 500, "detail": "Print failed"}
+        for own in claimed:
+            await asyncio.shield(run_in_threadpool(queue.settle, own, {"error": error}))
+        raise
+    for own in claimed:
+        await run_in_threadpool(queue.settle, own, result)
+    return result, False
+
+
 @app.post("/print")
 async def print_image(
+    request: Request,
+    response: Response,
     file: UploadFile = File(...),
     media: Optional[Media] = Form(None),
     lang: Optional[Lang] = Form(None),
+    packed: bool = Form(False),
+    height: Optional[int] = Form(None),
+    wait: bool = Form(True),
 ) -> dict:
+    """Dither and print an image.
+
+    With ``packed=true`` the upload is a bitmap the client already dithered:
+    packed 1-bit rows (MSB first, set bit = white) at the media's exact
+    width, with its ``height`` in rows. It is checked and encoded as is,
+    skipping decoding and dithering.
+
+    Repeats (same ``Idempotency-Key``, or the same upload within
+    ``print_dedup_seconds``) return the original result with an
+    ``Idempotent-Replayed: true`` header and print nothing.
+
+    The result's ``rotated`` tells whether ``auto_rotate`` turned the image.
+
+    Progress is pushed to the client's ``/api/events`` streams as it goes.
+    With ``wait=false`` the upload is checked and accepted with ``202`` and
+    its ``job_id`` straight away; the result follows as a ``result`` event.
+    Such a job is only journaled once it is encoded, so a restart before
+    that loses it without a ``result`` event.
+    """
     try:
         cfg = load_config()
         # Fallback to configured defaults if not provided.
@@ -80,73 +1172,274 @@ async def print_image(
         # Simple upload size guard (10 MB)
         if len(img_bytes) > 10 * 1024 * 1024:
             raise HTTPException(status_code=413, detail="File too large")
-        width, fixed_height = MEDIA_DIMENSIONS[media_val]
-        # Conversion to 1-bit is CPU-intensive, so run it in a thread pool to
-        # avoid blocking the event loop.
-        # Resize to fit width and, if present, max label height (contain).
-        img = await run_in_threadpool(to_1bit, img_bytes, width, fixed_height)
-        if lang_val == Lang.EPL:
-            cfg_dark = cfg.get("epl_darkness")
-            cfg_speed = cfg.get("epl_speed")
-            if media_val in (Media.continuous58, Media.continuous80):
-                # Trim trailing white rows for continuous media to avoid
-                # unnecessary feed after content. Leave a tiny post-print
-                # spacing by setting a small form length (Q=16 ≈ 2 mm).
-                img = await run_in_threadpool(trim_bottom_white, img)
-                payload = img_to_epl_gw(
-                    img,
-                    y=0,
-                    gap=0,
-                    label_height=16,
-                    darkness=cfg_dark if cfg_dark is not None else None,
-                    speed=cfg_speed if cfg_speed is not None else None,
+        width, max_height = media_box(media_val, cfg)
+        if packed and cfg.get("auto_rotate", "off") in ROTATE_GOALS[1:]:
+            # A bitmap at the media width cannot be turned and still fit.
+            raise HTTPException(
+                status_code=400,
+                detail="auto_rotate is on: upload the image, not a packed bitmap",
+            )
+        client_raster = (
+            packed_raster(img_bytes, width, max_height, height) if packed else None
+        )
+        client = client_key(request)
+        job_id = uuid.uuid4().hex[:12]
+        stages = StageTimer(_events, job_id, client)
+
+        async def job() -> dict:
+            if wait:
+                check_rate(request, print_job=True)
+            if client_raster is not None:
+                # Already dithered: no imaging slot needed, just encoding.
+                raster = client_raster
+                job_cfg = adapt_speed(raster, lang_val, cfg)
+                stream = len(raster.data) > STREAM_MIN_BYTES
+                payload = await run_in_threadpool(
+                    encode_payload, raster, media_val, lang_val, job_cfg, stream
                 )
-            else:
-                # For fixed-size labels, start at y=0 and let the printer use
-                # calibrated gap; reduce darkness and speed to avoid thermal cutoffs.
-                payload = img_to_epl_gw(
-                    img,
-                    y=0,
-                    label_height=fixed_height,
-                    gap=None,
-                    darkness=cfg_dark if cfg_dark is not None else None,
-                    speed=cfg_speed if cfg_speed is not None else None,
+                stages.lap("encoded")
+                result = await submit_payload(
+                    payload,
+                    media_val,
+                    lang_val,
+                    job_cfg,
+                    raster.height,
+                    None,
+                    job_id,
+                    client,
                 )
-        else:
-            payload = img_to_zpl_gf(img)
-
-        if bool(cfg.get("test_mode", False)):
-            # In test mode, delay to simulate print time and skip spooling.
-            delay_ms = int(cfg.get("test_mode_delay_ms", 0) or 0)
-            if delay_ms > 0:
-                await asyncio.sleep(delay_ms / 1000)
-            return {
-                "status": "ok",
-                "mode": "test",
-                "bytes": len(payload) if isinstance(payload, (bytes, bytearray)) else len(payload.encode("utf-8")),
-                "media": media_val.value,
-                "lang": lang_val.value,
-            }
+                stages.lap("sent")
+                remember_print(result, raster, media_val, lang_val)
+                return {**result, "rotated": False}
+            async with imaging_slot(print_job=True):
+                stages.lap("admitted")
+                # Conversion to 1-bit is CPU-intensive, so run it in a thread pool to
+                # avoid blocking the event loop.
+                # Resize to fit width and, if present, max label height (contain).
+                lut = tone_lut(cfg, media_val)
+                profile = cfg.get("print_resample", DEFAULT_RESAMPLE)
+                rotate = await run_in_threadpool(
+                    choose_rotation, img_bytes, media_val, cfg
+                )
+                raster = await run_in_threadpool(
+                    get_raster, img_bytes, width, max_height, lut, profile, rotate
+                )
+                stages.lap("dithered")
+                # Sparse labels print faster; see DEFAULT_SPEED_TABLE.
+                job_cfg = adapt_speed(raster, lang_val, cfg)
+                stream = len(raster.data) > STREAM_MIN_BYTES
+                payload = await run_in_threadpool(
+                    encode_payload, raster, media_val, lang_val, job_cfg, stream
+                )
+                stages.lap("encoded")
+            # Waiting for the printer must not hold the slot previews need.
+            result = await submit_payload(
+                payload,
+                media_val,
+                lang_val,
+                job_cfg,
+                raster.height,
+                None,
+                job_id,
+                client,
+            )
+            stages.lap("sent")
+            remember_print(result, raster, media_val, lang_val)
+            return {**result, "rotated": rotate}
 
-        printer_name = cfg.get("printer_name") or PRINTER_NAME
-        await run_in_threadpool(spool_raw, printer_name, payload)
-        return {"status": "ok"}
+        fingerprint = print_fingerprint(img_bytes, media_val, lang_val)
+        if not wait:
+            # Refused before it is accepted, not as a failed job afterwards.
+            check_rate(request, print_job=True)
+            task = asyncio.create_task(
+                print_in_background(
+                    request, fingerprint, cfg, media_val, job, job_id, client
+                )
+            )
+            _background_prints.add(task)
+            task.add_done_callback(_background_prints.discard)
+            response.status_code = 202
+            return {"status": "accepted", "job_id": job_id}
+        result, replayed = await print_once(request, fingerprint, cfg, media_val, job)
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+        return result
     except HTTPException as exc:
         # Propagate intended HTTP errors (e.g., 413 size limit)
         raise exc
-    except UnidentifiedImageError as exc:
+    except Exception as exc:  # noqa: BLE001
+        raise print_error(exc) from exc
+
+
+def print_error(exc: Exception) -> HTTPException:
+    """The HTTP error a failed print is reported as; call while handling ``exc``."""
+    if isinstance(exc, HTTPException):
+        return exc
+    if isinstance(exc, UnsupportedImage):
+        return HTTPException(status_code=415, detail=str(exc))
+    if isinstance(exc, UnidentifiedImageError):
         logger.exception("Failed to process image")
-        raise HTTPException(status_code=400, detail="Invalid image file") from exc
-    except subprocess.CalledProcessError as exc:
+        return HTTPException(status_code=400, detail="Invalid image file")
+    if isinstance(exc, subprocess.CalledProcessError):
         logger.exception("Printing command failed")
-        raise HTTPException(status_code=502, detail="Printer error") from exc
+        return HTTPException(status_code=502, detail="Printer error")
+    logger.exception("Unexpected server error")
+    return HTTPException(status_code=500, detail="Internal server error")
+
+
+# Prints accepted with wait=false, kept referenced until they finish.
+_background_prints: set = set()
+
+
+async def print_in_background(
+    request: Request,
+    fingerprint: str,
+    cfg: dict,
+    media: Media,
+    job,
+    job_id: str,
+    client: str,
+) -> None:
+    """Run an accepted print and push its outcome as a ``result`` event."""
+    try:
+        result, replayed = await print_once(request, fingerprint, cfg, media, job)
     except Exception as exc:  # noqa: BLE001
-        logger.exception("Unexpected server error")
-        raise HTTPException(status_code=500, detail="Internal server error") from exc
+        error = print_error(exc)
+        data = {
+            "job_id": job_id,
+            "error": {"status_code": error.status_code, "detail": error.detail},
+        }
+    else:
+        data = {"job_id": job_id, "result": result, "replayed": replayed}
+    _events.publish("result", data, client)
+
+
+# ---- Recent prints ----
+
+# Prints kept for reprinting (0 turns it off), and the disk they may use.
+RECENT_PRINTS = int(os.getenv("DITHERBOOTH_RECENT_PRINTS", "20"))
+RECENT_MB = float(os.getenv("DITHERBOOTH_RECENT_MB", "64"))
+_recent: Optional[RecentPrints] = None
+# Prints being written to ``recent/``, kept referenced until they finish.
+_remembering: set = set()
+
+
+def get_recent() -> Optional[RecentPrints]:
+    global _recent
+    if RECENT_PRINTS > 0 and _recent is None:
+        _recent = RecentPrints(
+            get_config_path().parent / "recent",
+            RECENT_PRINTS,
+            int(RECENT_MB * 1024 * 1024),
+        )
+    return _recent
+
+
+def remember_print(
+    result: dict, raster: PackedRaster, media: Media, lang: Lang
+) -> None:
+    """Keep a printed raster for :func:`reprint`, after the response.
+
+    Test-mode prints are not kept. Failing to keep one is only logged.
+    """
+    recent = get_recent()
+    if recent is None or result.get("mode") == "test":
+        return
+
+    async def add() -> None:
+        try:
+            await run_in_threadpool(
+                recent.add, result["job_id"], raster, media.value, lang.value
+            )
+        except Exception:  # noqa: BLE001
+            logger.exception("Could not keep print %s for reprinting", result["job_id"])
+
+    task = asyncio.create_task(add())
+    _remembering.add(task)
+    task.add_done_callback(_remembering.discard)
+
+
+def recent_print(job_id: str):
+    recent = get_recent()
+    entry = recent.get(job_id) if recent is not None else None
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Print not found")
+    return recent, entry
+
+
+@app.get("/api/recent")
+async def list_recent(request: Request) -> dict:
+    """Recent prints, newest first, with thumbnail links.
+
+    These are guests' photos, so listing them needs the dev password.
+    """
+    check_dev_password(request)
+    recent = get_recent()
+    entries = await run_in_threadpool(recent.list) if recent is not None else []
+    return {
+        "prints": [
+            {**e.to_dict(), "thumbnail": f"/api/recent/{e.id}/thumbnail"}
+            for e in entries
+        ]
+    }
+
+
+@app.get("/api/recent/{job_id}/thumbnail")
+async def recent_thumbnail(job_id: str, request: Request) -> Response:
+    check_dev_password(request)
+    recent, entry = recent_print(job_id)
+    data = await run_in_threadpool(recent.thumbnail, entry)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Print not found")
+    return Response(
+        content=data,
+        media_type="image/png",
+        headers={"Cache-Control": "private, max-age=86400"},
+    )
+
+
+@app.post("/api/recent/{job_id}/reprint")
+async def reprint(job_id: str, request: Request) -> dict:
+    """Print a recent label again from its stored raster.
+
+    Nothing is decoded or dithered; the raster is encoded with the current
+    settings and spooled as a new job.
+    """
+    recent, entry = recent_print(job_id)
+    check_rate(request, print_job=True)
+    raster = await run_in_threadpool(recent.raster, entry)
+    if raster is None:
+        raise HTTPException(status_code=404, detail="Print not found")
+    cfg = load_config()
+    media, lang = Media(entry.media), Lang(entry.lang)
+    job_cfg = adapt_speed(raster, lang, cfg)
+    try:
+        stream = len(raster.data) > STREAM_MIN_BYTES
+        payload = await run_in_threadpool(
+            encode_payload, raster, media, lang, job_cfg, stream
+        )
+        result = await submit_payload(
+            payload, media, lang, job_cfg, raster.height, client=client_key(request)
+        )
+    except HTTPException:
+        raise
+    except Exception as exc:  # noqa: BLE001
+        raise print_error(exc) from exc
+    return {**result, "reprint_of": entry.id}
+
+
+@app.delete("/api/recent")
+async def clear_recent(request: Request) -> dict:
+    check_dev_password(request)
+    recent = get_recent()
+    if recent is not None:
+        await run_in_threadpool(recent.clear)
+    return {"status": "cleared"}
 
 
 # ---- Dev settings and configuration helpers ----
 
+
 def get_config_path() -> Path:
     # Allow tests or deployments to override the config file path.
     env_path = os.getenv("DITHERBOOTH_CONFIG_PATH")
@@ -171,6 +1464,39 @@ DEFAULT_CONFIG = {
     # EPL-specific tuning (optional). If None, omit commands.
     "epl_darkness": 8,
     "epl_speed": 2,
+    # Cap for continuous-roll output height in dots (≈1 m at 203dpi); taller
+    # images are scaled down to fit. None disables the cap.
+    "max_continuous_height_dots": 8000,
+    # Identical uploads (same image, media and language) within this many
+    # seconds print once; double taps and retries get the first result.
+    # 0 disables; Idempotency-Key headers work either way.
+    "print_dedup_seconds": 10,
+    # Build the first progressive preview frame from a photo's embedded EXIF
+    # thumbnail instead of decoding the whole image.
+    "preview_exif_thumbnail": True,
+    # Have browsers dither and pack prints themselves (see /print ``packed``),
+    # which takes the imaging work off the server when crowds are large.
+    "client_dither": False,
+    # Poll the printer (~HS on ZPL, ^ee on EPL, lpstat for CUPS queues) and
+    # hold jobs while it reports a problem or already has this many of ours.
+    # None: on, except for /dev/ devices (see polls_status)
+    "printer_status_poll": None,
+    "printer_max_pending_jobs": 4,
+    # 256-entry tone curves applied before dithering, by printer then media;
+    # set through /api/calibration.
+    "tone_curves": {},
+    # Resampling profile (fast, balanced or best) per endpoint. Previews made
+    # with the print profile are reused when the same image is printed.
+    "print_resample": DEFAULT_RESAMPLE,
+    "preview_resample": DEFAULT_RESAMPLE,
+    # Turn images 90° when that prints them larger ("area") or, on continuous
+    # media, shorter ("feed"); "off" keeps them upright.
+    "auto_rotate": "off",
+    # Pick EPL speed and darkness per label from its print density, with
+    # ``speed_tables`` (by printer; rows of [max density, speed, darkness])
+    # or DEFAULT_SPEED_TABLE.
+    "adaptive_speed": False,
+    "speed_tables": {},
     # Optional: override printer queue name; falls back to PRINTER_NAME env.
     # "printer_name": "Zebra_LP2844",
 }
@@ -194,7 +1520,9 @@ def load_config() -> dict:
 def write_config(cfg: dict) -> None:
     path = get_config_path()
     path.parent.mkdir(parents=True, exist_ok=True)
-    tmp_fd, tmp_path = tempfile.mkstemp(prefix="ditherbooth_config.", suffix=".json", dir=str(path.parent))
+    tmp_fd, tmp_path = tempfile.mkstemp(
+        prefix="ditherbooth_config.", suffix=".json", dir=str(path.parent)
+    )
     try:
         with os.fdopen(tmp_fd, "w") as f:
             json.dump(cfg, f, indent=2, default=str)
@@ -207,39 +1535,23 @@ def write_config(cfg: dict) -> None:
             pass
 
 
-def trim_bottom_white(img: Image.Image, margin: int = 6, min_density_ratio: float = 0.01) -> Image.Image:
+def trim_bottom_white(
+    img: Image.Image, margin: int = 6, min_density_ratio: float = 0.01
+) -> Image.Image:
     """Trim trailing white rows from a 1-bit image for continuous media.
 
     Scans from the bottom up to find the last row containing any black pixel
     (value 0). Returns a crop from the top to that row plus a small margin.
-    Ensures a minimum height of 1 row.
+    Ensures a minimum height of 1 row. See
+    :func:`ditherbooth.imaging.raster.trim_bottom_white` for the packed form.
     """
     if img.mode != "1":
         return img
-    width, height = img.size
-    pixels = img.load()
-    last_content = -1
-    # Consider a row "content" only if it has a modest number of black pixels
-    # to avoid sparse dither specks keeping long blank tails.
-    min_black = max(3, int(width * min_density_ratio))
-    for row in range(height - 1, -1, -1):
-        black_count = 0
-        # Count black pixels but stop early if threshold reached
-        for col in range(width):
-            if pixels[col, row] == 0:
-                black_count += 1
-                if black_count >= min_black:
-                    break
-        if black_count >= min_black:
-            last_content = row
-            break
-    if last_content == -1:
-        # No black pixels; keep a tiny height to avoid zero-length form
-        return img.crop((0, 0, width, 1))
-    new_h = min(height, max(1, last_content + 1 + margin))
-    if new_h >= height:
+    raster = PackedRaster.from_image(img)
+    trimmed = raster_ops.trim_bottom_white(raster, margin, min_density_ratio)
+    if trimmed.height >= img.height:
         return img
-    return img.crop((0, 0, width, new_h))
+    return img.crop((0, 0, img.width, trimmed.height))
 
 
 def check_dev_password(request: Request) -> None:
@@ -263,7 +1575,20 @@ async def public_config() -> dict:
         "lang_options": [l.value for l in Lang],
         "epl_darkness": cfg.get("epl_darkness"),
         "epl_speed": cfg.get("epl_speed"),
-        "media_dimensions": {m.value: {"width": w, "height": h} for m, (w, h) in MEDIA_DIMENSIONS.items()},
+        "media_dimensions": {
+            m.value: {"width": w, "height": h} for m, (w, h) in MEDIA_DIMENSIONS.items()
+        },
+        "max_continuous_height_dots": cfg.get("max_continuous_height_dots"),
+        "client_dither": bool(cfg.get("client_dither", False)),
+        # Whether a wait=false print's result reaches this client's event
+        # stream; with shared state the stream may be on another worker.
+        "async_prints": not SHARED_STATE,
+        # Packed uploads are refused while images may be turned.
+        "auto_rotate": cfg.get("auto_rotate", "off"),
+        # Applied before dithering, so client-dithered prints are calibrated too.
+        "tone_curves": {
+            m.value: list(tone_lut(cfg, m)) for m in Media if tone_lut(cfg, m)
+        },
     }
 
 
@@ -296,7 +1621,9 @@ async def put_dev_settings(request: Request) -> JSONResponse:
         try:
             return Media(val).value
         except Exception as exc:  # noqa: BLE001
-            raise HTTPException(status_code=400, detail="Invalid default_media") from exc
+            raise HTTPException(
+                status_code=400, detail="Invalid default_media"
+            ) from exc
 
     def coerce_lang(val):
         if val is None:
@@ -331,11 +1658,19 @@ async def put_dev_settings(request: Request) -> JSONResponse:
             cfg["printer_name"] = v
     if "test_mode_delay_ms" in payload:
         try:
-            val = int(payload["test_mode_delay_ms"]) if payload["test_mode_delay_ms"] is not None else 0
+            val = (
+                int(payload["test_mode_delay_ms"])
+                if payload["test_mode_delay_ms"] is not None
+                else 0
+            )
         except Exception as exc:  # noqa: BLE001
-            raise HTTPException(status_code=400, detail="test_mode_delay_ms must be an integer") from exc
+            raise HTTPException(
+                status_code=400, detail="test_mode_delay_ms must be an integer"
+            ) from exc
         if val < 0:
-            raise HTTPException(status_code=400, detail="test_mode_delay_ms must be >= 0")
+            raise HTTPException(
+                status_code=400, detail="test_mode_delay_ms must be >= 0"
+            )
         cfg["test_mode_delay_ms"] = val
 
     if "epl_darkness" in payload:
@@ -346,9 +1681,13 @@ async def put_dev_settings(request: Request) -> JSONResponse:
             try:
                 d = int(val)
             except Exception as exc:  # noqa: BLE001
-                raise HTTPException(status_code=400, detail="epl_darkness must be an integer or null") from exc
+                raise HTTPException(
+                    status_code=400, detail="epl_darkness must be an integer or null"
+                ) from exc
             if not (0 <= d <= 15):
-                raise HTTPException(status_code=400, detail="epl_darkness must be between 0 and 15")
+                raise HTTPException(
+                    status_code=400, detail="epl_darkness must be between 0 and 15"
+                )
             cfg["epl_darkness"] = d
 
     if "epl_speed" in payload:
@@ -359,23 +1698,154 @@ async def put_dev_settings(request: Request) -> JSONResponse:
             try:
                 s = int(val)
             except Exception as exc:  # noqa: BLE001
-                raise HTTPException(status_code=400, detail="epl_speed must be an integer or null") from exc
+                raise HTTPException(
+                    status_code=400, detail="epl_speed must be an integer or null"
+                ) from exc
             if not (1 <= s <= 6):
-                raise HTTPException(status_code=400, detail="epl_speed must be between 1 and 6")
+                raise HTTPException(
+                    status_code=400, detail="epl_speed must be between 1 and 6"
+                )
             cfg["epl_speed"] = s
 
+    if "max_continuous_height_dots" in payload:
+        val = payload["max_continuous_height_dots"]
+        if val is None or val == "":
+            cfg["max_continuous_height_dots"] = None
+        else:
+            try:
+                h = int(val)
+            except Exception as exc:  # noqa: BLE001
+                raise HTTPException(
+                    status_code=400,
+                    detail="max_continuous_height_dots must be an integer or null",
+                ) from exc
+            if h < 1:
+                raise HTTPException(
+                    status_code=400, detail="max_continuous_height_dots must be >= 1"
+                )
+            cfg["max_continuous_height_dots"] = h
+
+    for key in ("print_resample", "preview_resample"):
+        if key in payload:
+            if payload[key] not in RESAMPLE_PROFILES:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"{key} must be one of {', '.join(RESAMPLE_PROFILES)}",
+                )
+            cfg[key] = payload[key]
+    if "auto_rotate" in payload:
+        if payload["auto_rotate"] not in ROTATE_GOALS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"auto_rotate must be one of {', '.join(ROTATE_GOALS)}",
+            )
+        cfg["auto_rotate"] = payload["auto_rotate"]
+    if "adaptive_speed" in payload:
+        cfg["adaptive_speed"] = bool(payload["adaptive_speed"])
+    if "speed_tables" in payload:
+        cfg["speed_tables"] = parse_speed_tables(payload["speed_tables"])
+    if "client_dither" in payload:
+        cfg["client_dither"] = bool(payload["client_dither"])
+    if "preview_exif_thumbnail" in payload:
+        cfg["preview_exif_thumbnail"] = bool(payload["preview_exif_thumbnail"])
+    if "printer_status_poll" in payload:
+        poll = payload["printer_status_poll"]
+        cfg["printer_status_poll"] = None if poll is None else bool(poll)
+    if "printer_max_pending_jobs" in payload:
+        try:
+            val = (
+                int(payload["printer_max_pending_jobs"])
+                if payload["printer_max_pending_jobs"] is not None
+                else 0
+            )
+        except Exception as exc:  # noqa: BLE001
+            raise HTTPException(
+                status_code=400, detail="printer_max_pending_jobs must be an integer"
+            ) from exc
+        if val < 0:
+            raise HTTPException(
+                status_code=400, detail="printer_max_pending_jobs must be >= 0"
+            )
+        cfg["printer_max_pending_jobs"] = val
+
+    if "print_dedup_seconds" in payload:
+        try:
+            val = (
+                int(payload["print_dedup_seconds"])
+                if payload["print_dedup_seconds"] is not None
+                else 0
+            )
+        except Exception as exc:  # noqa: BLE001
+            raise HTTPException(
+                status_code=400, detail="print_dedup_seconds must be an integer"
+            ) from exc
+        if val < 0:
+            raise HTTPException(
+                status_code=400, detail="print_dedup_seconds must be >= 0"
+            )
+        cfg["print_dedup_seconds"] = val
+
     write_config(cfg)
     return JSONResponse({"status": "saved", "config": cfg})
 
 
+def parse_speed_tables(tables) -> dict:
+    """Check ``speed_tables``: rows of [max density, speed, darkness] per printer."""
+    error = HTTPException(
+        status_code=400,
+        detail="speed_tables must map printers to rows of [max density 0-1, speed 1-6, darkness 0-15]",
+    )
+    if not isinstance(tables, dict):
+        raise error
+    parsed = {}
+    for printer, rows in tables.items():
+        if not isinstance(rows, list) or not rows:
+            raise error
+        try:
+            rows = [
+                [float(density), int(speed), int(darkness)]
+                for density, speed, darkness in rows
+            ]
+        except (TypeError, ValueError) as exc:
+            raise error from exc
+        if not all(0 <= d <= 1 and 1 <= s <= 6 and 0 <= k <= 15 for d, s, k in rows):
+            raise error
+        parsed[printer] = sorted(rows)
+    return parsed
+
+
+RAW_BITMAP_TYPE = "application/octet-stream"
+
+
+def wants_raw_bitmap(request: Request) -> bool:
+    return RAW_BITMAP_TYPE in request.headers.get("accept", "")
+
+
+def raw_bitmap_response(img: Image.Image) -> Response:
+    """Packed 1-bit rows (MSB first, set bit = white) plus size headers."""
+    return Response(
+        content=pack_1bit(img),
+        media_type=RAW_BITMAP_TYPE,
+        headers={
+            "X-Width": str(img.width),
+            "X-Height": str(img.height),
+            "X-Row-Bytes": str((img.width + 7) // 8),
+        },
+    )
+
+
 @app.post("/preview")
 async def preview_image(
+    request: Request,
     file: UploadFile = File(...),
     media: Optional[Media] = Form(None),
 ) -> Response:
-    """Return a processed 1-bit PNG preview for the given image and media width.
+    """Return a processed 1-bit preview for the given image and media width.
 
-    Language does not affect dithering, so it's not needed here.
+    Clients sending ``Accept: application/octet-stream`` get the packed raw
+    bitmap (see :func:`raw_bitmap_response`); everyone else gets a PNG saved
+    with a fast zlib level. Language does not affect dithering, so it's not
+    needed here. ``X-Rotated`` says whether the image was turned.
     """
     try:
         cfg = load_config()
@@ -383,15 +1853,27 @@ async def preview_image(
         img_bytes = await file.read()
         if len(img_bytes) > 10 * 1024 * 1024:
             raise HTTPException(status_code=413, detail="File too large")
-        width, max_h = MEDIA_DIMENSIONS[media_val]
-        img = await run_in_threadpool(to_1bit, img_bytes, width, max_h)
-        # Ensure mode 1-bit, convert to PNG bytes
-        buf = io.BytesIO()
-        img.save(buf, format="PNG")
-        data = buf.getvalue()
-        return Response(content=data, media_type="image/png")
+        width, max_h = media_box(media_val, cfg)
+        check_rate(request, print_job=False)
+        async with imaging_slot(print_job=False):
+            lut = tone_lut(cfg, media_val)
+            profile = cfg.get("preview_resample", DEFAULT_RESAMPLE)
+            rotate = await run_in_threadpool(choose_rotation, img_bytes, media_val, cfg)
+            raster = await run_in_threadpool(
+                get_raster, img_bytes, width, max_h, lut, profile, rotate
+            )
+        img = raster.to_image()
+        if wants_raw_bitmap(request):
+            resp = raw_bitmap_response(img)
+        else:
+            data = await run_in_threadpool(png_bytes, img)
+            resp = Response(content=data, media_type="image/png")
+        resp.headers["X-Rotated"] = "true" if rotate else "false"
+        return resp
     except HTTPException as exc:
         raise exc
+    except UnsupportedImage as exc:
+        raise HTTPException(status_code=415, detail=str(exc)) from exc
     except UnidentifiedImageError as exc:
         logger.exception("Failed to process image for preview")
         raise HTTPException(status_code=400, detail="Invalid image file") from exc
@@ -400,8 +1882,353 @@ async def preview_image(
         raise HTTPException(status_code=500, detail="Internal server error") from exc
 
 
+# Latest preview token per client session. A newer request for the same
+# session replaces the token, and older in-flight previews stop before doing
+# any further work. Per process, so only within one worker.
+_preview_sessions: dict = {}
+_preview_tokens = itertools.count(1)
+
+
+def fast_preview(
+    img_bytes: bytes,
+    width: int,
+    max_h: Optional[int],
+    rotate: bool,
+    thumbnail: bool,
+    lut: Optional[tuple],
+) -> Image.Image:
+    """The quick :func:`to_1bit_ordered` frame, turned like the print when ``rotate``."""
+    if not rotate:
+        return to_1bit_ordered(img_bytes, width, max_h, thumbnail=thumbnail, lut=lut)
+    printed_w, printed_h = fit_size(upright_size(img_bytes)[::-1], width, max_h)
+    img = to_1bit_ordered(
+        img_bytes, printed_h, width, thumbnail=thumbnail, lut=lut
+    ).transpose(Image.Transpose.ROTATE_270)
+    # Centred on the media width, like the exact frame.
+    canvas = Image.new("1", (max(1, width // 2), img.height), 1)
+    canvas.paste(img, ((canvas.width - img.width) // 2, 0))
+    return canvas
+
+
+def _preview_frame(
+    stage: str, img: Image.Image, raw: bool = False, rotated: bool = False
+) -> bytes:
+    frame = {
+        "stage": stage,
+        "width": img.width,
+        "height": img.height,
+        "rotated": rotated,
+    }
+    if raw:
+        frame["bits"] = base64.b64encode(pack_1bit(img)).decode("ascii")
+    else:
+        frame["png"] = base64.b64encode(png_bytes(img)).decode("ascii")
+    return (json.dumps(frame) + "\n").encode()
+
+
+@app.post("/preview/progressive")
+async def preview_progressive(
+    request: Request,
+    file: UploadFile = File(...),
+    media: Optional[Media] = Form(None),
+    session: Optional[str] = Form(None),
+    encoding: Optional[str] = Form(None),
+) -> StreamingResponse:
+    """Stream a quick ordered-dither preview followed by the exact one.
+
+    The response is newline-delimited JSON; each line is a frame with
+    ``stage`` (``fast`` or ``final``), ``width``, ``height`` and a base64
+    ``png``, or base64 packed ``bits`` when ``encoding=raw``. When a newer
+    request arrives for the same ``session`` the stream ends early with a
+    ``cancelled`` frame instead of the final preview (also sent, with
+    ``"reason": "busy"``, when the server has no capacity for it). With
+    ``preview_exif_thumbnail`` on, the fast frame of a photo is scaled up
+    from its EXIF thumbnail. Frames carry ``rotated`` as ``X-Rotated`` does
+    on :func:`preview_image`.
+    """
+    if encoding not in (None, "png", "raw"):
+        raise HTTPException(status_code=400, detail="encoding must be png or raw")
+    raw = encoding == "raw"
+    token = next(_preview_tokens)
+    if session:
+        _preview_sessions[session] = token
+
+    def is_stale() -> bool:
+        return bool(session) and _preview_sessions.get(session) != token
+
+    def release() -> None:
+        if session and _preview_sessions.get(session) == token:
+            del _preview_sessions[session]
+
+    try:
+        cfg = load_config()
+        media_val = media or Media(cfg.get("default_media", Media.continuous58.value))
+        img_bytes = await file.read()
+        if len(img_bytes) > 10 * 1024 * 1024:
+            raise HTTPException(status_code=413, detail="File too large")
+        width, max_h = media_box(media_val, cfg)
+        check_rate(request, print_job=False)
+        async with imaging_slot(print_job=False):
+            thumbnail = bool(cfg.get("preview_exif_thumbnail", True))
+            lut = tone_lut(cfg, media_val)
+            rotate = await run_in_threadpool(choose_rotation, img_bytes, media_val, cfg)
+            fast = await run_in_threadpool(
+                fast_preview, img_bytes, width, max_h, rotate, thumbnail, lut
+            )
+    except HTTPException:
+        release()
+        raise
+    except UnsupportedImage as exc:
+        release()
+        raise HTTPException(status_code=415, detail=str(exc)) from exc
+    except UnidentifiedImageError as exc:
+        release()
+        logger.exception("Failed to process image for preview")
+        raise HTTPException(status_code=400, detail="Invalid image file") from exc
+    except Exception as exc:  # noqa: BLE001
+        release()
+        logger.exception("Unexpected server error in preview")
+        raise HTTPException(status_code=500, detail="Internal server error") from exc
+
+    async def frames():
+        try:
+            yield _preview_frame("fast", fast, raw, rotate)
+            if is_stale() or await request.is_disconnected():
+                yield b'{"stage": "cancelled"}\n'
+                return
+            try:
+                async with imaging_slot(print_job=False):
+                    profile = cfg.get("preview_resample", DEFAULT_RESAMPLE)
+                    raster = await run_in_threadpool(
+                        get_raster, img_bytes, width, max_h, lut, profile, rotate
+                    )
+            except HTTPException:
+                yield b'{"stage": "cancelled", "reason": "busy"}\n'
+                return
+            img = raster.to_image()
+            if is_stale():
+                yield b'{"stage": "cancelled"}\n'
+                return
+            yield _preview_frame("final", img, raw, rotate)
+        except Exception:  # noqa: BLE001
+            logger.exception("Unexpected server error in progressive preview")
+            yield b'{"stage": "error"}\n'
+        finally:
+            release()
+
+    return StreamingResponse(frames(), media_type="application/x-ndjson")
+
+
+# ---- Tone calibration ----
+
+
+def printer_key(cfg: dict) -> str:
+    return cfg.get("printer_name") or PRINTER_NAME
+
+
+def tone_lut(cfg: dict, media: Media) -> Optional[tuple]:
+    """Calibrated tone curve for the configured printer and ``media``, if any."""
+    lut = (cfg.get("tone_curves") or {}).get(printer_key(cfg), {}).get(media.value)
+    return tuple(lut) if lut else None
+
+
+def save_tone_lut(cfg: dict, media: Media, lut: Optional[list]) -> None:
+    # Rebuilt rather than updated in place: the dicts may be DEFAULT_CONFIG's.
+    curves = dict(cfg.get("tone_curves") or {})
+    printer_curves = {
+        k: v for k, v in curves.get(printer_key(cfg), {}).items() if k != media.value
+    }
+    if lut is not None:
+        printer_curves[media.value] = lut
+    curves[printer_key(cfg)] = printer_curves
+    cfg["tone_curves"] = curves
+    write_config(cfg)
+
+
+@app.get("/api/calibration")
+async def get_calibration(request: Request) -> dict:
+    check_dev_password(request)
+    cfg = load_config()
+    return {
+        "printer": printer_key(cfg),
+        "wedge_levels": list(WEDGE_LEVELS),
+        "curves": (cfg.get("tone_curves") or {}).get(printer_key(cfg), {}),
+    }
+
+
+@app.post("/api/calibration/{media}/wedge")
+async def print_step_wedge(media: Media, request: Request) -> Response:
+    """Print the uncorrected step wedge to measure ``media`` on this printer.
+
+    Optional JSON body: ``lang``, and ``print: false`` to get the wedge back
+    as a PNG instead. Steps are numbered from the darkest.
+    """
+    check_dev_password(request)
+    raw_body = await request.body()
+    try:
+        body = json.loads(raw_body) if raw_body else {}
+    except json.JSONDecodeError as exc:
+        raise HTTPException(status_code=400, detail="Invalid JSON") from exc
+    cfg = load_config()
+    try:
+        lang_val = Lang(body.get("lang") or cfg.get("default_lang", Lang.EPL.value))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="Invalid lang") from exc
+    width, fixed_height = MEDIA_DIMENSIONS[media]
+    # About 55 mm of continuous media.
+    wedge = step_wedge(width, fixed_height or 440).convert("1")
+    if not body.get("print", True):
+        return Response(content=png_bytes(wedge), media_type="image/png")
+    check_rate(request, print_job=True)
+    raster = await run_in_threadpool(PackedRaster.from_image, wedge)
+    payload = await run_in_threadpool(encode_payload, raster, media, lang_val, cfg)
+    try:
+        result = await submit_payload(payload, media, lang_val, cfg, raster.height)
+    except subprocess.CalledProcessError as exc:
+        logger.exception("Printing command failed")
+        raise HTTPException(status_code=502, detail="Printer error") from exc
+    return JSONResponse({**result, "wedge_levels": list(WEDGE_LEVELS)})
+
+
+@app.put("/api/calibration/{media}")
+async def set_calibration(media: Media, request: Request) -> dict:
+    """Store the tone curve for ``media`` on the configured printer.
+
+    JSON body, one of: ``response`` (lightness 0-100 measured on each wedge
+    step, darkest first), ``gamma`` (a chosen curve; above 1 lightens), or a
+    ready-made 256-entry ``lut``.
+    """
+    check_dev_password(request)
+    try:
+        body = await request.json()
+    except json.JSONDecodeError as exc:
+        raise HTTPException(status_code=400, detail="Invalid JSON") from exc
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="Invalid payload")
+    try:
+        if "response" in body:
+            lut = lut_from_response([float(v) for v in body["response"]])
+        elif "gamma" in body:
+            lut = lut_from_gamma(float(body["gamma"]))
+        elif "lut" in body:
+            lut = [int(v) for v in body["lut"]]
+            if len(lut) != 256 or not all(0 <= v <= 255 for v in lut):
+                raise ValueError("lut must be 256 values from 0 to 255")
+        else:
+            raise ValueError("Provide response, gamma or lut")
+    except (TypeError, ValueError) as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    cfg = load_config()
+    save_tone_lut(cfg, media, lut)
+    return {"printer": printer_key(cfg), "media": media.value, "lut": lut}
+
+
+@app.delete("/api/calibration/{media}")
+async def delete_calibration(media: Media, request: Request) -> dict:
+    check_dev_password(request)
+    cfg = load_config()
+    save_tone_lut(cfg, media, None)
+    return {"status": "deleted"}
+
+
+# ---- Profiling ----
+
+# Requests the profiler captures: everything that decodes, dithers or encodes.
+PROFILED_PATHS = ("/print", "/preview", "/preview/progressive")
+PROFILE_MAX_REQUESTS = 1000
+# Per process: with several workers, arm and read it on the same one.
+_profiler: Optional[SamplingProfiler] = None
+app.add_middleware(ProfileMiddleware, profiler=lambda: _profiler, paths=PROFILED_PATHS)
+
+
+@app.post("/api/dev/profile")
+async def start_profile(request: Request) -> dict:
+    """Sample stacks during the next print and preview requests.
+
+    Optional JSON body: ``requests`` to capture (default 10) and
+    ``interval_ms`` between samples (default 5). The result is fetched from
+    ``/api/dev/profile/result``.
+    """
+    global _profiler
+    check_dev_password(request)
+    raw_body = await request.body()
+    try:
+        body = json.loads(raw_body) if raw_body else {}
+    except json.JSONDecodeError as exc:
+        raise HTTPException(status_code=400, detail="Invalid JSON") from exc
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="Invalid payload")
+    try:
+        requests = int(body.get("requests", 10))
+        interval_ms = float(body.get("interval_ms", 5))
+    except (TypeError, ValueError) as exc:
+        raise HTTPException(
+            status_code=400, detail="requests and interval_ms must be numbers"
+        ) from exc
+    if not 1 <= requests <= PROFILE_MAX_REQUESTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"requests must be between 1 and {PROFILE_MAX_REQUESTS}",
+        )
+    if not 1 <= interval_ms <= 1000:
+        raise HTTPException(
+            status_code=400, detail="interval_ms must be between 1 and 1000"
+        )
+    if _profiler is not None and _profiler.state != "done":
+        raise HTTPException(
+            status_code=409, detail="A profile is already being captured"
+        )
+    _profiler = SamplingProfiler(requests, interval_ms / 1000)
+    return _profiler.to_dict()
+
+
+@app.get("/api/dev/profile")
+async def get_profile(request: Request) -> dict:
+    check_dev_password(request)
+    return _profiler.to_dict() if _profiler is not None else {"state": "idle"}
+
+
+@app.delete("/api/dev/profile")
+async def stop_profile(request: Request) -> dict:
+    """Stop capturing before the requests are done; the result is kept."""
+    check_dev_password(request)
+    if _profiler is None:
+        raise HTTPException(status_code=404, detail="No profile")
+    _profiler.stop()
+    return _profiler.to_dict()
+
+
+@app.get("/api/dev/profile/result")
+async def get_profile_result(request: Request, format: str = "speedscope") -> Response:
+    """The samples so far, as ``speedscope`` JSON or ``collapsed`` stacks."""
+    check_dev_password(request)
+    if _profiler is None:
+        raise HTTPException(status_code=404, detail="No profile")
+    stamp = datetime.fromtimestamp(
+        _profiler.started_at or time.time(), timezone.utc
+    ).strftime("%Y%m%dT%H%M%SZ")
+    if format == "speedscope":
+        filename = f"ditherbooth-{stamp}.speedscope.json"
+        return JSONResponse(
+            _profiler.speedscope(f"ditherbooth {stamp}"),
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
+    if format == "collapsed":
+        return Response(
+            content=_profiler.collapsed(),
+            media_type="text/plain",
+            headers={
+                "Content-Disposition": f'attachment; filename="ditherbooth-{stamp}.folded"'
+            },
+        )
+    raise HTTPException(
+        status_code=400, detail="format must be speedscope or collapsed"
+    )
+
+
 # ---- Template CRUD ----
 
+
 def get_templates_dir() -> Path:
     return get_config_path().parent / "templates"
 
@@ -415,7 +2242,13 @@ async def list_templates() -> list:
     for f in sorted(tpl_dir.glob("*.json")):
         try:
             data = json.loads(f.read_text())
-            templates.append({"id": data["id"], "name": data["name"], "created_at": data.get("created_at")})
+            templates.append(
+                {
+                    "id": data["id"],
+                    "name": data["name"],
+                    "created_at": data.get("created_at"),
+                }
+            )
         except Exception:  # noqa: BLE001
             continue
     return templates
@@ -446,15 +2279,194 @@ async def create_template(request: Request) -> dict:
     return tpl
 
 
-@app.get("/api/templates/{template_id}")
-async def get_template(template_id: str) -> dict:
-    tpl_dir = get_templates_dir()
-    path = tpl_dir / f"{template_id}.json"
+def read_template(template_id: str) -> dict:
+    path = get_templates_dir() / f"{template_id}.json"
     if not path.exists():
         raise HTTPException(status_code=404, detail="Template not found")
     return json.loads(path.read_text())
 
 
+@app.get("/api/templates/{template_id}")
+async def get_template(template_id: str) -> dict:
+    return read_template(template_id)
+
+
+def render_template_raster(
+    tpl: dict, width: int, height: Optional[int], max_height: Optional[int] = None
+) -> PackedRaster:
+    # Templates are immutable once created, so the id identifies the pixels.
+    key = ("template", tpl["id"], width, height, max_height)
+    raster = _raster_cache.get(key)
+    if raster is None:
+        from ditherbooth.imaging.render import render_canvas
+
+        img = render_canvas(tpl["canvas_json"], width, height, max_height)
+        raster = PackedRaster.from_image(img)
+        _raster_cache.put(key, raster)
+    return raster
+
+
+# Native (command-based) encodings of templates; the rasterized remainder
+# (images and the like) is rendered once per template, language and size.
+_native_labels = LRUCache(maxsize=8)
+
+
+def get_native_label(
+    tpl: dict, lang: Lang, width: int, height: Optional[int], max_height: Optional[int]
+) -> Optional["NativeLabel"]:
+    """Native label for ``tpl``, or ``None`` to fall back to the raster path."""
+    from ditherbooth.printer.vector import NativeLabel, NativeUnsupported
+
+    key = (tpl["id"], lang.value, width, height, max_height)
+    label = _native_labels.get(key)
+    if label is None:
+        try:
+            label = NativeLabel(
+                tpl["canvas_json"], lang.value, width, height, max_height
+            )
+        except NativeUnsupported:
+            return None
+        _native_labels.put(key, label)
+    return label
+
+
+def encode_native_payload(
+    label: "NativeLabel",
+    media: Media,
+    lang: Lang,
+    cfg: dict,
+    row: Optional[dict] = None,
+) -> bytes:
+    """Native counterpart of :func:`encode_payload`, with the same placement."""
+    if lang == Lang.ZPL:
+        return label.to_zpl(row)
+    if media in (Media.continuous58, Media.continuous80):
+        # Native commands already end at the content; the form is that long.
+        gap, label_height = 0, label.height
+    else:
+        gap, label_height = None, MEDIA_DIMENSIONS[media][1]
+    return label.to_epl(
+        row,
+        y=0,
+        gap=gap,
+        label_height=label_height,
+        darkness=cfg.get("epl_darkness"),
+        speed=cfg.get("epl_speed"),
+    )
+
+
+def wants_native(body: dict, tpl: dict) -> bool:
+    """Use native commands when asked to, and by default for barcodes."""
+    from ditherbooth.printer.vector import has_barcodes
+
+    return bool(body.get("native", has_barcodes(tpl["canvas_json"])))
+
+
+async def read_render_body(request: Request) -> dict:
+    raw_body = await request.body()
+    try:
+        body = json.loads(raw_body) if raw_body else {}
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="Invalid payload") from exc
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="Invalid payload")
+    return body
+
+
+@app.post("/api/templates/{template_id}/render")
+async def render_template(template_id: str, request: Request) -> Response:
+    """Render a saved template server-side at printer resolution.
+
+    Optional JSON body: ``media`` and ``lang`` (config defaults otherwise) and
+    ``print``. Without ``print`` the 1-bit image is returned as PNG, or as the
+    packed raw bitmap with ``Accept: application/octet-stream``; with
+    ``print: true`` it is sent to the printer like ``/print``. ``native: true``
+    (the default for templates with barcodes) prints text, boxes, lines and
+    barcodes with printer commands and rasterizes only the rest.
+    """
+    tpl = read_template(template_id)
+    return await render_label(tpl, await read_render_body(request), request)
+
+
+@app.post("/api/render")
+async def render_canvas_json(request: Request) -> Response:
+    """Like :func:`render_template`, for an unsaved ``canvas_json`` in the body.
+
+    The designer uses this for canvases with barcodes, which the browser
+    only shows as their data.
+    """
+    body = await read_render_body(request)
+    canvas_json = body.get("canvas_json")
+    if not isinstance(canvas_json, dict):
+        raise HTTPException(status_code=400, detail="canvas_json is required")
+    # The content identifies the pixels, as a template's id does.
+    digest = hashlib.sha256(
+        json.dumps(canvas_json, sort_keys=True).encode()
+    ).hexdigest()
+    return await render_label(
+        {"id": f"canvas-{digest}", "canvas_json": canvas_json}, body, request
+    )
+
+
+async def render_label(tpl: dict, body: dict, request: Request) -> Response:
+    cfg = load_config()
+    try:
+        media_val = Media(
+            body.get("media") or cfg.get("default_media", Media.continuous58.value)
+        )
+        lang_val = Lang(body.get("lang") or cfg.get("default_lang", Lang.EPL.value))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="Invalid media or lang") from exc
+    width, max_height = media_box(media_val, cfg)
+    # Fixed labels render at their full size; continuous media fit the content.
+    height = MEDIA_DIMENSIONS[media_val][1]
+    print_job = bool(body.get("print"))
+    check_rate(request, print_job)
+    try:
+        async with imaging_slot(print_job):
+            label = None
+            if print_job and wants_native(body, tpl):
+                label = await run_in_threadpool(
+                    get_native_label, tpl, lang_val, width, height, max_height
+                )
+            if label is not None:
+                payload = await run_in_threadpool(
+                    encode_native_payload, label, media_val, lang_val, cfg
+                )
+                job_cfg, label_rows, encoding = cfg, label.height, "native"
+            else:
+                raster = await run_in_threadpool(
+                    render_template_raster, tpl, width, height, max_height
+                )
+                if print_job:
+                    job_cfg = adapt_speed(raster, lang_val, cfg)
+                    payload = await run_in_threadpool(
+                        encode_payload, raster, media_val, lang_val, job_cfg
+                    )
+                    label_rows, encoding = raster.height, "raster"
+        if print_job:
+            # Spooled outside the slot, so waiting for the printer doesn't block previews.
+            result = await submit_payload(
+                payload, media_val, lang_val, job_cfg, label_rows
+            )
+            return JSONResponse({**result, "encoding": encoding})
+        img = raster.to_image()
+        if wants_raw_bitmap(request):
+            return raw_bitmap_response(img)
+        data = await run_in_threadpool(png_bytes, img)
+        return Response(content=data, media_type="image/png")
+    except HTTPException as exc:
+        raise exc
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except subprocess.CalledProcessError as exc:
+        logger.exception("Printing command failed")
+        raise HTTPException(status_code=502, detail="Printer error") from exc
+    except Exception as exc:  # noqa: BLE001
+        logger.exception("Unexpected server error rendering template")
+        raise HTTPException(status_code=500, detail="Internal server error") from exc
+
+
 @app.delete("/api/templates/{template_id}")
 async def delete_template(template_id: str) -> dict:
     tpl_dir = get_templates_dir()
@@ -463,3 +2475,177 @@ async def delete_template(template_id: str) -> dict:
         raise HTTPException(status_code=404, detail="Template not found")
     path.unlink()
     return {"status": "deleted"}
+
+
+# ---- Mail merge ----
+
+MERGE_MAX_ROWS = 1000
+# Renderers hold a template's pre-dithered static background.
+_merge_renderers = LRUCache(maxsize=8)
+
+
+def get_merge_renderer(
+    tpl: dict, width: int, height: Optional[int], max_height: Optional[int]
+) -> "MergeRenderer":
+    key = (tpl["id"], width, height, max_height)
+    renderer = _merge_renderers.get(key)
+    if renderer is None:
+        from ditherbooth.imaging.render import MergeRenderer
+
+        renderer = MergeRenderer(tpl["canvas_json"], width, height, max_height)
+        _merge_renderers.put(key, renderer)
+    return renderer
+
+
+def parse_merge_rows(body: dict) -> list:
+    """Rows from ``rows`` (list of objects) or ``csv`` (text with a header)."""
+    if "csv" in body:
+        if not isinstance(body["csv"], str):
+            raise HTTPException(status_code=400, detail="csv must be a string")
+        rows = list(csv.DictReader(io.StringIO(body["csv"])))
+    else:
+        rows = body.get("rows")
+        if not isinstance(rows, list) or not all(isinstance(r, dict) for r in rows):
+            raise HTTPException(
+                status_code=400, detail="rows must be a list of objects"
+            )
+    if not rows:
+        raise HTTPException(status_code=400, detail="No rows to print")
+    if len(rows) > MERGE_MAX_ROWS:
+        raise HTTPException(
+            status_code=400, detail=f"At most {MERGE_MAX_ROWS} rows per job"
+        )
+    return rows
+
+
+def render_merge_payload(
+    renderer, row: dict, media: Media, lang: Lang, cfg: dict
+) -> tuple:
+    """Render and encode one merged label.
+
+    Returns ``(payload, cfg, rows)``: the settings it was encoded with, speed
+    adapted to its density, and its height in rows, for the job's ETA.
+    """
+    from ditherbooth.printer.vector import NativeLabel
+
+    if isinstance(renderer, NativeLabel):
+        payload = encode_native_payload(renderer, media, lang, cfg, row)
+        return payload, cfg, renderer.height
+    raster = PackedRaster.from_image(renderer.render(row))
+    job_cfg = adapt_speed(raster, lang, cfg)
+    return encode_payload(raster, media, lang, job_cfg), job_cfg, raster.height
+
+
+@app.post("/api/templates/{template_id}/merge")
+async def merge_template(template_id: str, request: Request) -> StreamingResponse:
+    """Print one label per data row, filling ``{{column}}`` text placeholders.
+
+    JSON body: ``rows`` (list of objects) or ``csv`` (text with a header row),
+    plus optional ``media``, ``lang`` and ``native`` (see the render endpoint;
+    placeholders also fill barcode data). Labels are spooled one by one and the
+    response streams newline-delimited JSON progress: a ``started`` line with
+    the total, one line per label, then ``done`` (or ``error`` on the failing
+    label, which stops the job).
+    """
+    tpl = read_template(template_id)
+    try:
+        body = await request.json()
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="Invalid payload") from exc
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="Invalid payload")
+    rows = parse_merge_rows(body)
+    cfg = load_config()
+    try:
+        media_val = Media(
+            body.get("media") or cfg.get("default_media", Media.continuous58.value)
+        )
+        lang_val = Lang(body.get("lang") or cfg.get("default_lang", Lang.EPL.value))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="Invalid media or lang") from exc
+    width, max_height = media_box(media_val, cfg)
+    height = MEDIA_DIMENSIONS[media_val][1]
+    check_rate(request, print_job=True)
+    try:
+        renderer = None
+        if wants_native(body, tpl):
+            renderer = await run_in_threadpool(
+                get_native_label, tpl, lang_val, width, height, max_height
+            )
+        encoding = "raster" if renderer is None else "native"
+        if renderer is None:
+            renderer = await run_in_threadpool(
+                get_merge_renderer, tpl, width, height, max_height
+            )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+    async def progress():
+        total = len(rows)
+        started = {
+            "status": "started",
+            "total": total,
+            "fields": renderer.fields,
+            "encoding": encoding,
+        }
+        yield (json.dumps(started) + "\n").encode()
+        for index, row in enumerate(rows):
+            try:
+                async with imaging_slot(print_job=True):
+                    payload, job_cfg, label_rows = await run_in_threadpool(
+                        render_merge_payload, renderer, row, media_val, lang_val, cfg
+                    )
+                result = await submit_payload(
+                    payload, media_val, lang_val, job_cfg, label_rows
+                )
+            except HTTPException as exc:
+                yield (
+                    json.dumps(
+                        {
+                            "status": "error",
+                            "index": index,
+                            "total": total,
+                            "detail": exc.detail,
+                        }
+                    )
+                    + "\n"
+                ).encode()
+                return
+            except subprocess.CalledProcessError:
+                logger.exception("Printing command failed")
+                yield (
+                    json.dumps(
+                        {
+                            "status": "error",
+                            "index": index,
+                            "total": total,
+                            "detail": "Printer error",
+                        }
+                    )
+                    + "\n"
+                ).encode()
+                return
+            except Exception:  # noqa: BLE001
+                logger.exception("Unexpected server error in merge job")
+                yield (
+                    json.dumps(
+                        {
+                            "status": "error",
+                            "index": index,
+                            "total": total,
+                            "detail": "Internal server error",
+                        }
+                    )
+                    + "\n"
+                ).encode()
+                return
+            printed = {
+                "status": "printed",
+                "index": index,
+                "total": total,
+                "job_id": result["job_id"],
+            }
+            yield (json.dumps(printed) + "\n").encode()
+        yield (json.dumps({"status": "done", "printed": total}) + "\n").encode()
+
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
@@ -0,0 +1,254 @@
+"""Convert a folder of images to printer files ahead of time, on all cores.
+
+Each image is dithered for the media and encoded as the server would print
+it, and written next to a preview PNG as ``<name>.epl``/``<name>.zpl`` in
+the output directory. The files can be spooled right away (``--spool``) or
+later with the ``spool`` command, without processing the images again.
+
+Usage:
+    python -m ditherbooth.batch convert INPUT... --media M --lang L [--out DIR] [--jobs N] [--spool]
+    python -m ditherbooth.batch spool FILE_OR_DIR... [--printer NAME]
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, Optional
+
+from ditherbooth.app import (
+    Lang,
+    Media,
+    adapt_speed,
+    choose_rotation,
+    encode_payload,
+    get_raster,
+    load_config,
+    media_box,
+    printer_key,
+    tone_lut,
+)
+from ditherbooth.imaging.decode import UnsupportedImage
+from ditherbooth.imaging.raster import png_bytes
+from ditherbooth.printer.cups import spool_raw
+
+IMAGE_SUFFIXES = {
+    ".jpg",
+    ".jpeg",
+    ".png",
+    ".webp",
+    ".gif",
+    ".bmp",
+    ".tif",
+    ".tiff",
+    ".avif",
+    ".heic",
+    ".heif",
+}
+PAYLOAD_SUFFIXES = {".epl", ".zpl"}
+STAGES = ("read", "dither", "encode", "write")
+
+
+def find_files(inputs: Iterable[str], suffixes: set) -> list:
+    """Files named by ``inputs`` (files, directories or glob patterns), sorted
+    by name within each input and without repeats."""
+    found = []
+    for pattern in inputs:
+        path = Path(pattern)
+        if path.is_dir():
+            matches = sorted(
+                p
+                for p in path.iterdir()
+                if p.is_file() and p.suffix.lower() in suffixes
+            )
+        elif path.is_file():
+            matches = [path]
+        else:
+            matches = sorted(
+                Path(p)
+                for p in glob.glob(pattern)
+                if Path(p).suffix.lower() in suffixes
+            )
+        for match in matches:
+            if match not in found:
+                found.append(match)
+    return found
+
+
+def convert(
+    path: Path, out_dir: Path, media: str, lang: str, cfg: dict, preview: bool = True
+) -> dict:
+    """Convert one image; returns its output path, size and stage timings in ms.
+
+    Runs in a worker process, so everything it needs is passed in, as plain
+    values that pickle.
+    """
+    media, lang = Media(media), Lang(lang)
+    timings = {}
+    start = time.perf_counter()
+
+    def lap(stage: str) -> None:
+        nonlocal start
+        now = time.perf_counter()
+        timings[stage] = (now - start) * 1000
+        start = now
+
+    img_bytes = path.read_bytes()
+    lap("read")
+    width, max_height = media_box(media, cfg)
+    rotate = choose_rotation(img_bytes, media, cfg)
+    raster = get_raster(
+        img_bytes,
+        width,
+        max_height,
+        tone_lut(cfg, media),
+        cfg.get("print_resample"),
+        rotate,
+    )
+    lap("dither")
+    payload = encode_payload(raster, media, lang, adapt_speed(raster, lang, cfg))
+    lap("encode")
+    out = out_dir / f"{path.stem}.{lang.value.lower()}"
+    out.write_bytes(payload)
+    if preview:
+        (out_dir / f"{path.stem}.png").write_bytes(png_bytes(raster.to_image()))
+    lap("write")
+    return {
+        "output": out,
+        "bytes": len(payload),
+        "rows": raster.height,
+        "timings": timings,
+    }
+
+
+def _row(name: str, timings: dict, extra: str = "") -> str:
+    cells = "".join(f"{timings.get(stage, 0.0):>10.1f}" for stage in STAGES)
+    return f"{name:<32}{cells}  {extra}".rstrip()
+
+
+def run_convert(args: argparse.Namespace) -> int:
+    files = find_files(args.inputs, IMAGE_SUFFIXES)
+    if not files:
+        print("No images found", file=sys.stderr)
+        return 1
+    cfg = load_config()
+    if args.printer:
+        cfg["printer_name"] = args.printer
+    out_dir = Path(args.out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    names = [p.stem for p in files]
+    clashes = sorted({n for n in names if names.count(n) > 1})
+    if clashes:
+        print(
+            f"Images would overwrite each other's output: {', '.join(clashes)}",
+            file=sys.stderr,
+        )
+        return 1
+
+    jobs = [
+        (p, out_dir, args.media, args.lang, cfg, not args.no_preview) for p in files
+    ]
+    totals = dict.fromkeys(STAGES + ("spool",), 0.0)
+    failed = 0
+    started = time.perf_counter()
+    print(f"{'image':<32}" + "".join(f"{stage + ' ms':>10}" for stage in STAGES))
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        # Results are taken in input order, so spooling as they arrive prints
+        # in order while later images are still being converted.
+        futures = [pool.submit(convert, *job) for job in jobs]
+        for path, future in zip(files, futures):
+            try:
+                result = future.result()
+            except (UnsupportedImage, OSError, ValueError) as exc:
+                failed += 1
+                print(f"{path.name:<32}failed: {exc}")
+                continue
+            timings = result["timings"]
+            if args.spool:
+                spool_start = time.perf_counter()
+                spool_raw(printer_key(cfg), result["output"].read_bytes())
+                timings["spool"] = (time.perf_counter() - spool_start) * 1000
+            for stage, ms in timings.items():
+                totals[stage] += ms
+            extra = f"{result['rows']} rows, {result['bytes']} bytes"
+            if "spool" in timings:
+                extra += f", spooled in {timings['spool']:.1f} ms"
+            print(_row(path.name, timings, extra))
+    wall = time.perf_counter() - started
+    done = len(files) - failed
+    print(_row("total (cpu)", totals))
+    print(
+        f"{done} of {len(files)} images in {wall:.2f} s with {args.jobs or os.cpu_count()} workers",
+        end="",
+    )
+    print(f", {done / wall:.1f} images/s" if wall > 0 else "")
+    return 1 if failed else 0
+
+
+def run_spool(args: argparse.Namespace) -> int:
+    files = find_files(args.inputs, PAYLOAD_SUFFIXES)
+    if not files:
+        print("No .epl or .zpl files found", file=sys.stderr)
+        return 1
+    printer = args.printer or printer_key(load_config())
+    for path in files:
+        start = time.perf_counter()
+        spool_raw(printer, path.read_bytes())
+        print(
+            f"{path.name:<32}spooled in {(time.perf_counter() - start) * 1000:.1f} ms"
+        )
+    return 0
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m ditherbooth.batch", description=__doc__.splitlines()[0]
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    conv = commands.add_parser(
+        "convert", help="dither and encode images into printer files"
+    )
+    conv.add_argument(
+        "inputs", nargs="+", help="image files, directories or glob patterns"
+    )
+    conv.add_argument("--media", required=True, choices=[m.value for m in Media])
+    conv.add_argument(
+        "--lang", default=Lang.EPL.value, choices=[lang.value for lang in Lang]
+    )
+    conv.add_argument("--out", default="ditherbooth-batch", help="output directory")
+    conv.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="worker processes (default: one per core)",
+    )
+    conv.add_argument("--no-preview", action="store_true", help="skip the preview PNGs")
+    conv.add_argument(
+        "--spool", action="store_true", help="also print each file, in input order"
+    )
+    conv.add_argument(
+        "--printer", help="printer to spool to (default: configured printer)"
+    )
+    conv.set_defaults(run=run_convert)
+
+    spool = commands.add_parser(
+        "spool", help="print previously converted files in order"
+    )
+    spool.add_argument(
+        "inputs", nargs="+", help=".epl/.zpl files, directories or glob patterns"
+    )
+    spool.add_argument(
+        "--printer", help="printer to spool to (default: configured printer)"
+    )
+    spool.set_defaults(run=run_spool)
+
+    args = parser.parse_args(argv)
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""Server-sent events: job, queue and printer updates pushed to kiosks.
+
+Each kiosk keeps one ``GET /api/events`` stream open instead of waiting on a
+long ``/print`` request per job or polling ``/api/jobs``. Events are
+published from the event loop or from worker threads; every subscriber has a
+bounded buffer, and one that falls behind gets a ``resync`` event (fetch
+``/api/printer/status`` again) in place of what it missed.
+"""
+
+import asyncio
+from collections import deque
+import itertools
+import json
+import threading
+import time
+from typing import Optional
+
+
+def format_event(kind: str, data: dict, event_id: Optional[int] = None) -> bytes:
+    """One ``text/event-stream`` message."""
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {kind}\ndata: {json.dumps(data)}\n\n".encode()
+
+
+class Subscription:
+    """Events for one stream: all broadcasts, plus those for ``client``."""
+
+    def __init__(self, hub: "EventHub", client: Optional[str], buffer: int):
+        self.hub = hub
+        self.client = client
+        self.buffer = buffer
+        self._events: deque = deque()
+        self._ready = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+
+    def wants(self, client: Optional[str]) -> bool:
+        return client is None or self.client is None or client == self.client
+
+    def _put(self, event: tuple) -> None:
+        if len(self._events) >= self.buffer:
+            self._events.clear()
+            event = (event[0], "resync", {})
+        self._events.append(event)
+        self._ready.set()
+
+    def put(self, event: tuple) -> None:
+        if threading.get_ident() == self.hub.loop_thread:
+            self._put(event)
+        else:
+            self._loop.call_soon_threadsafe(self._put, event)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[tuple]:
+        """The next ``(id, kind, data)``, or ``None`` if ``timeout`` passes first."""
+        while not self._events:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self._events.popleft()
+
+    def close(self) -> None:
+        self.hub.unsubscribe(self)
+
+
+class EventHub:
+    def __init__(self, buffer: int = 256):
+        self.buffer = buffer
+        self.loop_thread: Optional[int] = None
+        self._subscribers: set = set()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self, client: Optional[str] = None) -> Subscription:
+        """Start receiving events; call from the event loop and ``close()`` after."""
+        self.loop_thread = threading.get_ident()
+        sub = Subscription(self, client, self.buffer)
+        with self._lock:
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def publish(self, kind: str, data: dict, client: Optional[str] = None) -> None:
+        """Send ``data`` to every stream, or only to ``client``'s streams
+        (and unfiltered ones) when given."""
+        with self._lock:
+            event = (next(self._ids), kind, data)
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            if sub.wants(client):
+                sub.put(event)
+
+
+class StageTimer:
+    """Publishes a job's ``stage`` events, each with the milliseconds since
+    the previous one (or since the timer was made)."""
+
+    def __init__(self, hub: EventHub, job_id: str, client: Optional[str] = None):
+        self.hub = hub
+        self.job_id = job_id
+        self.client = client
+        self._last = time.perf_counter()
+
+    def lap(self, stage: str) -> None:
+        now = time.perf_counter()
+        ms = round((now - self._last) * 1000, 1)
+        self._last = now
+        self.hub.publish(
+            "stage", {"job_id": self.job_id, "stage": stage, "ms": ms}, self.client
+        )
@@ -0,0 +1,93 @@
+"""Barcode symbols as module patterns, for rasterized previews and prints.
+
+Printers draw barcodes themselves when a label is sent with native commands
+(see :mod:`ditherbooth.printer.vector`); these patterns are what the raster
+path draws in their place. Code 128 is encoded here, switching to code set C
+for runs of digits as printers' automatic mode does. QR codes need the
+optional ``segno`` package.
+"""
+
+from typing import Optional
+
+# Bar and space widths of Code 128 symbols 0-106 (103-105 start A/B/C, 106 stop).
+_CODE128 = (
+    "212222 222122 222221 121223 121322 131222 122213 122312 132212 221213 "
+    "221312 231212 112232 122132 122231 113222 123122 123221 223211 221132 "
+    "221231 213212 223112 312131 311222 321122 321221 312212 322112 322211 "
+    "212123 212321 232121 111323 131123 131321 112313 132113 132311 211313 "
+    "231113 231311 112133 112331 132131 113123 113321 133121 313121 211331 "
+    "231131 213113 213311 213131 311123 311321 331121 312113 312311 332111 "
+    "314111 221411 431111 111224 111422 121124 121421 141122 141221 112214 "
+    "112412 122114 122411 142112 142211 241211 221114 413111 241112 134111 "
+    "111242 121142 121241 114212 124112 124211 411212 421112 421211 212141 "
+    "214121 412121 111143 111341 131141 114113 114311 411113 411311 113141 "
+    "114131 311141 411131 211412 211214 211232 2331112"
+).split()
+_START_B, _START_C, _CODE_B, _CODE_C, _STOP = 104, 105, 100, 99, 106
+
+
+def _digit_run(data: str, start: int) -> int:
+    end = start
+    while end < len(data) and data[end].isdigit():
+        end += 1
+    return end - start
+
+
+def code128_symbols(data: str) -> list:
+    """Symbol values for ``data``, from start code to stop code.
+
+    Set B covers printable ASCII; even runs of four or more digits (and
+    all-digit data of even length) are packed two to a symbol in set C.
+    """
+    if not data:
+        raise ValueError("Barcode data is empty")
+    if any(not 32 <= ord(c) < 127 for c in data):
+        raise ValueError("Code 128 data must be printable ASCII")
+    run = _digit_run(data, 0)
+    use_c = run % 2 == 0 and (run >= 4 or run == len(data))
+    symbols = [_START_C if use_c else _START_B]
+    i = 0
+    while i < len(data):
+        run = _digit_run(data, i)
+        if use_c and run < 2:
+            symbols.append(_CODE_B)
+            use_c = False
+        elif not use_c and run >= 4 and run % 2 == 0:
+            # An odd run gets one digit in set B first, then comes back here.
+            symbols.append(_CODE_C)
+            use_c = True
+        if use_c:
+            symbols.append(int(data[i : i + 2]))
+            i += 2
+        else:
+            symbols.append(ord(data[i]) - 32)
+            i += 1
+    checksum = symbols[0] + sum(n * v for n, v in enumerate(symbols[1:], 1))
+    return symbols + [checksum % 103, _STOP]
+
+
+def code128_modules(data: str) -> list:
+    """The symbol as one bool per module, ``True`` for a bar."""
+    modules = []
+    for value in code128_symbols(data):
+        for n, width in enumerate(_CODE128[value]):
+            modules.extend([n % 2 == 0] * int(width))
+    return modules
+
+
+def qr_matrix(data: str, error: str = "Q") -> list:
+    """Rows of bools (``True`` dark) for a QR code without its quiet zone."""
+    try:
+        import segno
+    except ImportError as exc:
+        raise ValueError("Rendering QR codes needs the segno package") from exc
+    if not data:
+        raise ValueError("Barcode data is empty")
+    qr = segno.make_qr(data, error=error, boost_error=False)
+    return [[bool(v) for v in row] for row in qr.matrix_iter(border=0)]
+
+
+def qr_magnification(width: float, height: float, module: Optional[int] = None) -> int:
+    """Dots per QR module, as the native ``^BQ`` command is given it."""
+    # Roughly 25 modules for short data (QR version 2).
+    return int(module or min(10, max(1, round(min(width, height) / 25))))
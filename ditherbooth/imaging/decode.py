@@ -0,0 +1,103 @@
+"""Open uploaded images by their magic bytes.
+
+Phones send JPEG, HEIC (iPhone) and WebP (Android) as often as PNG. The
+format is sniffed from the first bytes so Pillow only tries the one decoder
+that applies, and a missing optional decoder (HEIC needs ``pillow-heif``) is
+reported as such instead of as a broken file.
+"""
+
+import io
+from typing import Optional
+
+from PIL import ExifTags, Image, UnidentifiedImageError
+
+# ISO BMFF ``ftyp`` brands: HEIF stills from phones, and AVIF.
+_HEIF_BRANDS = {b"heic", b"heix", b"heim", b"heis", b"hevc", b"hevx", b"mif1", b"msf1"}
+_AVIF_BRANDS = {b"avif", b"avis"}
+
+# EXIF IFD1 tags locating the embedded JPEG thumbnail.
+_THUMB_OFFSET, _THUMB_LENGTH = 0x0201, 0x0202
+
+
+class UnsupportedImage(ValueError):
+    """A recognized image format this install has no decoder for."""
+
+
+def sniff_format(data: bytes) -> Optional[str]:
+    """Pillow format name from the leading magic bytes, or ``None``."""
+    if data.startswith(b"\xff\xd8\xff"):
+        return "JPEG"
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "PNG"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "WEBP"
+    if data.startswith((b"GIF87a", b"GIF89a")):
+        return "GIF"
+    if data.startswith(b"BM"):
+        return "BMP"
+    if data.startswith((b"II*\x00", b"MM\x00*")):
+        return "TIFF"
+    if data[4:8] == b"ftyp":
+        # Major brand, then the compatible brands up to the end of the box.
+        box_end = int.from_bytes(data[:4], "big")
+        brands = {data[8:12]} | {
+            data[i : i + 4] for i in range(16, min(box_end, len(data)), 4)
+        }
+        if brands & _AVIF_BRANDS:
+            return "AVIF"
+        if brands & _HEIF_BRANDS:
+            return "HEIF"
+    return None
+
+
+def _heif_available() -> bool:
+    if "HEIF" in Image.OPEN:
+        return True
+    try:
+        from pillow_heif import register_heif_opener
+    except ImportError:
+        return False
+    register_heif_opener()
+    return True
+
+
+def open_image(data: bytes) -> Image.Image:
+    """Open ``data`` lazily with the decoder its magic bytes call for.
+
+    Formats that aren't sniffed fall back to Pillow's own detection. Raises
+    :class:`UnsupportedImage` for a known format without a decoder here, and
+    ``UnidentifiedImageError`` for anything else Pillow can't read.
+    """
+    fmt = sniff_format(data)
+    if fmt == "HEIF" and not _heif_available():
+        raise UnsupportedImage("HEIC images need the pillow-heif package")
+    if fmt is not None and fmt not in Image.OPEN:
+        Image.init()
+        if fmt not in Image.OPEN:
+            raise UnsupportedImage(
+                f"{fmt} images are not supported by this Pillow build"
+            )
+    return Image.open(io.BytesIO(data), formats=[fmt] if fmt else None)
+
+
+def exif_thumbnail(img: Image.Image) -> Optional[Image.Image]:
+    """The preview JPEG embedded in a JPEG's EXIF data, if there is one.
+
+    It is usually 160x120, so decoding it costs next to nothing. The
+    thumbnail is not rotated; the main image's EXIF orientation applies.
+    """
+    raw = img.info.get("exif")
+    if img.format != "JPEG" or not raw:
+        return None
+    try:
+        ifd1 = img.getexif().get_ifd(ExifTags.IFD.IFD1)
+        offset, length = ifd1.get(_THUMB_OFFSET), ifd1.get(_THUMB_LENGTH)
+        if not offset or not length:
+            return None
+        # Offsets count from the TIFF header, after the "Exif\0\0" marker.
+        start = 6 + offset if raw.startswith(b"Exif\x00\x00") else offset
+        thumb = Image.open(io.BytesIO(raw[start : start + length]), formats=["JPEG"])
+        thumb.load()
+    except (OSError, SyntaxError, UnidentifiedImageError, ValueError):
+        return None
+    return thumb
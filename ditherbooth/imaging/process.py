@@ -1,5 +1,167 @@
-import io
-from PIL import Image, ImageOps
+from typing import Iterator, Sequence
+from PIL import Image, ImageChops
+
+from ditherbooth.imaging.decode import exif_thumbnail, open_image
+from ditherbooth.imaging.tone import apply_lut
+
+# 4x4 Bayer matrix used for the quick ordered-dither preview.
+_BAYER_4 = (0, 8, 2, 10, 12, 4, 14, 6, 3, 11, 1, 9, 15, 7, 13, 5)
+
+# Outputs taller than this are resized and dithered in horizontal strips so
+# very long continuous-roll images never exist as full 8-bit copies.
+BANDED_MIN_ROWS = 2048
+BAND_ROWS = 256
+# Floyd–Steinberg only carries error downwards, one row at a time. Pillow's
+# dither cannot be seeded with an error row, so instead of carrying it over,
+# each strip re-dithers this many rows of the previous strip first (and
+# discards them): it reaches the boundary with a settled error state rather
+# than none. That is not the exact state a one-pass dither would have: dots
+# differ, but the density of the rows after the boundary matches and no seam
+# shows.
+BAND_OVERLAP_ROWS = 32
+# Resampling profiles, fastest first, as (filter, reducing_gap):
+# - fast: integer ``reduce`` as far as it goes, then bilinear;
+# - balanced: box ``reduce`` to within 2x of the output, then Lanczos;
+# - best: Lanczos over the full-size image.
+RESAMPLE_PROFILES = {
+    "fast": (Image.BILINEAR, 1.0),
+    "balanced": (Image.LANCZOS, 2.0),
+    "best": (Image.LANCZOS, None),
+}
+DEFAULT_RESAMPLE = "best"
+
+# Decoders that can scale while decoding (JPEG DCT scaling) stop at this
+# multiple of the output size, leaving the final resize enough pixels to
+# filter; the same margin Pillow's ``thumbnail`` uses.
+DRAFT_GAP = 2
+# An EXIF thumbnail stands in for the image only if its aspect ratio is this
+# close; some cameras letterbox it to 4:3.
+THUMBNAIL_ASPECT_TOLERANCE = 0.02
+
+
+def _fit(
+    size: tuple[int, int], target_width_dots: int, max_height_dots: int | None
+) -> tuple[int, int]:
+    width, height = size
+    # Compute scale to fit width and optional height
+    sx = target_width_dots / width
+    if max_height_dots:
+        sy = max_height_dots / height
+        scale = min(sx, sy)
+    else:
+        scale = sx
+    return max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+
+
+# EXIF orientation -> transpose that displays the image upright.
+_ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+def _upright_size(img: Image.Image, orientation: int) -> tuple[int, int]:
+    # EXIF orientations 5-8 swap width and height
+    return (img.height, img.width) if orientation in (5, 6, 7, 8) else img.size
+
+
+def _same_aspect(a: tuple[int, int], b: tuple[int, int]) -> bool:
+    return abs(a[0] * b[1] / (a[1] * b[0]) - 1) <= THUMBNAIL_ASPECT_TOLERANCE
+
+
+def _open_gray(
+    img_bytes: bytes,
+    target_width_dots: int,
+    max_height_dots: int | None,
+    thumbnail: bool = False,
+) -> tuple[Image.Image, tuple[int, int]]:
+    """Decode to upright grayscale without intermediate full-size copies.
+
+    Returns the image and the size it fits to, computed from the full-size
+    header. JPEGs are decoded straight to grayscale at a reduced scale (no
+    less than ``DRAFT_GAP`` times that size); with ``thumbnail`` their EXIF
+    thumbnail is used instead when it has the right shape.
+    """
+    with open_image(img_bytes) as img:
+        orientation = img.getexif().get(0x0112, 1)
+        width, height = _upright_size(img, orientation)
+        fitted = _fit((width, height), target_width_dots, max_height_dots)
+        source = img
+        thumb = exif_thumbnail(img) if thumbnail else None
+        if thumb is not None and _same_aspect(thumb.size, img.size):
+            source = thumb
+        else:
+            draft_w, draft_h = fitted if (width, height) == img.size else fitted[::-1]
+            img.draft("L", (draft_w * DRAFT_GAP, draft_h * DRAFT_GAP))
+        if source.mode == "L":
+            source.load()
+            gray = source
+        else:
+            gray = source.convert("L")
+    method = _ORIENTATION_TRANSPOSE.get(orientation)
+    return (gray.transpose(method) if method is not None else gray), fitted
+
+
+def upright_size(img_bytes: bytes) -> tuple[int, int]:
+    """Width and height of the image as displayed, read from the header only."""
+    with open_image(img_bytes) as img:
+        return _upright_size(img, img.getexif().get(0x0112, 1))
+
+
+def fit_size(
+    size: tuple[int, int], target_width_dots: int, max_height_dots: int | None = None
+) -> tuple[int, int]:
+    """Size an image of ``size`` is scaled to by :func:`to_1bit`."""
+    return _fit(size, target_width_dots, max_height_dots)
+
+
+def fitted_height(
+    img_bytes: bytes, target_width_dots: int, max_height_dots: int | None = None
+) -> int:
+    """Output height :func:`to_1bit` would produce, read from the header only."""
+    return _fit(upright_size(img_bytes), target_width_dots, max_height_dots)[1]
+
+
+def _resize(
+    img: Image.Image, size: tuple[int, int], profile: str, box: tuple | None = None
+) -> Image.Image:
+    try:
+        resample, reducing_gap = RESAMPLE_PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"Unknown resample profile: {profile}") from None
+    return img.resize(size, resample, box=box, reducing_gap=reducing_gap)
+
+
+def _fit_gray(
+    img_bytes: bytes,
+    target_width_dots: int,
+    max_height_dots: int | None,
+    center_x: bool,
+    profile: str,
+    thumbnail: bool = False,
+    lut: Sequence[int] | None = None,
+) -> Image.Image:
+    """Decode, orient and scale an image onto a white grayscale canvas.
+
+    A tone ``lut`` is applied to the scaled image only, so the canvas margin
+    stays paper white.
+    """
+    img, (new_w, new_h) = _open_gray(
+        img_bytes, target_width_dots, max_height_dots, thumbnail
+    )
+    img = apply_lut(_resize(img, (new_w, new_h), profile), lut)
+    if new_w == target_width_dots:
+        return img
+    # Paste onto a canvas of the target width; top-aligned vertically
+    canvas = Image.new("L", (target_width_dots, new_h), 255)
+    x_off = ((target_width_dots - new_w) // 2) if center_x else 0
+    canvas.paste(img, (x_off, 0))
+    return canvas
 
 
 def to_1bit(
@@ -7,6 +169,8 @@ def to_1bit(
     target_width_dots: int,
     max_height_dots: int | None = None,
     center_x: bool = True,
+    lut: Sequence[int] | None = None,
+    profile: str = DEFAULT_RESAMPLE,
 ) -> Image.Image:
     """Convert to 1-bit B/W sized to the printer width and optional max height.
 
@@ -15,24 +179,104 @@ def to_1bit(
     ``max_height_dots`` while preserving aspect ratio. The result is pasted on
     a white canvas of width ``target_width_dots`` and height equal to the
     resized image's height (no bottom padding), then converted to 1-bit using
-    Pillow's default Floyd–Steinberg dithering.
+    Pillow's default Floyd–Steinberg dithering. A tone ``lut`` (see
+    :mod:`ditherbooth.imaging.tone`) is applied just before dithering.
+    ``profile`` names one of :data:`RESAMPLE_PROFILES`.
     """
+    canvas = _fit_gray(
+        img_bytes, target_width_dots, max_height_dots, center_x, profile, lut=lut
+    )
+    return canvas.convert("1")
 
-    with Image.open(io.BytesIO(img_bytes)) as img:
-        img = ImageOps.exif_transpose(img)
-        img = img.convert("L")
-        # Compute scale to fit width and optional height
-        sx = target_width_dots / img.width
-        if max_height_dots:
-            sy = max_height_dots / img.height
-            scale = min(sx, sy)
-        else:
-            scale = sx
-        new_w = max(1, int(round(img.width * scale)))
-        new_h = max(1, int(round(img.height * scale)))
-        img = img.resize((new_w, new_h), Image.LANCZOS)
-        # Paste onto a canvas of the target width; top-aligned vertically
-        canvas = Image.new("L", (target_width_dots, new_h), 255)
-        x_off = ((target_width_dots - new_w) // 2) if center_x else 0
-        canvas.paste(img, (x_off, 0))
-        return canvas.convert("1")
+
+def _bayer_threshold(size: tuple[int, int]) -> Image.Image:
+    tile = Image.new("L", (4, 4))
+    tile.putdata([v * 16 + 8 for v in _BAYER_4])
+    width, height = size
+    strip = Image.new("L", (width, 4))
+    for x in range(0, width, 4):
+        strip.paste(tile, (x, 0))
+    out = Image.new("L", size)
+    for y in range(0, height, 4):
+        out.paste(strip, (0, y))
+    return out
+
+
+def to_1bit_ordered(
+    img_bytes: bytes,
+    target_width_dots: int,
+    max_height_dots: int | None = None,
+    center_x: bool = True,
+    scale: int = 2,
+    thumbnail: bool = False,
+    lut: Sequence[int] | None = None,
+) -> Image.Image:
+    """Quick, low-resolution 1-bit preview using ordered (Bayer) dithering.
+
+    Output is ``1/scale`` of the printer resolution and uses the "fast"
+    resampling profile, so it is only meant as a first frame while the exact
+    Floyd–Steinberg result from :func:`to_1bit` is being computed. With
+    ``thumbnail``, a JPEG's embedded EXIF thumbnail is scaled up instead of
+    decoding the photo, when it has one.
+    """
+    width = max(1, target_width_dots // scale)
+    max_h = max(1, max_height_dots // scale) if max_height_dots else None
+    canvas = _fit_gray(img_bytes, width, max_h, center_x, "fast", thumbnail, lut)
+    # A pixel is white where it is brighter than the matrix threshold.
+    diff = ImageChops.subtract(canvas, _bayer_threshold(canvas.size))
+    return diff.point([0] + [255] * 255, "1")
+
+
+def _reduce_source(img: Image.Image, size: tuple[int, int]) -> Image.Image:
+    """Box-reduce ``img`` to within ``DRAFT_GAP`` times ``size``.
+
+    JPEGs already decode that small (see :func:`_open_gray`); this does the
+    same for other formats, so a large source is not kept at full size.
+    """
+    factor = min(
+        img.width // (size[0] * DRAFT_GAP), img.height // (size[1] * DRAFT_GAP)
+    )
+    return img.reduce(factor) if factor > 1 else img
+
+
+def iter_1bit_bands(
+    img_bytes: bytes,
+    target_width_dots: int,
+    max_height_dots: int | None = None,
+    center_x: bool = True,
+    band_rows: int = BAND_ROWS,
+    overlap_rows: int = BAND_OVERLAP_ROWS,
+    lut: Sequence[int] | None = None,
+    profile: str = DEFAULT_RESAMPLE,
+) -> Iterator[Image.Image]:
+    """Yield the :func:`to_1bit` result as 1-bit strips of ``band_rows`` rows.
+
+    Only the source, reduced to at most ``DRAFT_GAP`` times the output size,
+    and one strip are held while strips are made; the full-size decode is
+    dropped first. Each strip is resized straight from the source (``resize``
+    with a source box, which samples across the box edge so there is no seam)
+    and dithered together with ``overlap_rows`` rows of the previous strip,
+    which settles the error-diffusion state before the boundary. Tone matches
+    the one-pass result; individual dots do not.
+    """
+    img, (new_w, new_h) = _open_gray(img_bytes, target_width_dots, max_height_dots)
+    img = _reduce_source(img, (new_w, new_h))
+    x_off = ((target_width_dots - new_w) // 2) if center_x else 0
+    scale_y = img.height / new_h
+    for top in range(0, new_h, band_rows):
+        bottom = min(new_h, top + band_rows)
+        start = max(0, top - overlap_rows)
+        strip = _resize(
+            img,
+            (new_w, bottom - start),
+            profile,
+            box=(0, start * scale_y, img.width, bottom * scale_y),
+        )
+        strip = apply_lut(strip, lut)
+        if new_w != target_width_dots:
+            canvas = Image.new("L", (target_width_dots, bottom - start), 255)
+            canvas.paste(strip, (x_off, 0))
+            strip = canvas
+        yield strip.convert("1").crop(
+            (0, top - start, target_width_dots, bottom - start)
+        )
@@ -0,0 +1,182 @@
+from dataclasses import dataclass
+from functools import cached_property
+import io
+from typing import Iterable
+from PIL import Image
+
+# Fast zlib level for preview PNGs. 1-bit label art compresses almost as well
+# at level 1 as at the default level 6, at a fraction of the encode time.
+PREVIEW_PNG_LEVEL = 1
+
+# Number of set (white) bits in each byte value.
+_POPCOUNT = bytes(bin(i).count("1") for i in range(256))
+
+# Bit transpose of 8x8 blocks: _TRANSPOSE_8[r][v] is byte ``v``, as row ``r``
+# of a block, spread into the 8 transposed rows (one byte each, first row in
+# the top byte). OR-ing the entries for a block's 8 rows gives its transpose.
+_TRANSPOSE_8 = tuple(
+    tuple(
+        sum(1 << (8 * (7 - bit) + 7 - r) for bit in range(8) if v & (0x80 >> bit))
+        for v in range(256)
+    )
+    for r in range(8)
+)
+
+
+def pack_1bit(img: Image.Image) -> bytes:
+    """Return the packed rows of a 1-bit image.
+
+    Each row is padded to whole bytes, pixels are stored MSB first and a set
+    bit means white. This is the layout used by EPL ``GW`` and ZPL ``^GF``.
+    """
+    if img.mode != "1":
+        raise ValueError("Image must be 1-bit")
+    return img.tobytes()
+
+
+def png_bytes(img: Image.Image, compress_level: int = PREVIEW_PNG_LEVEL) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", compress_level=compress_level)
+    return buf.getvalue()
+
+
+@dataclass(frozen=True)
+class PackedRaster:
+    """A 1-bit image stored as packed rows (see :func:`pack_1bit`).
+
+    This is the printer-ready body shared by the EPL and ZPL encoders, so it
+    can be cached and re-wrapped with different headers without touching
+    pixels again.
+    """
+
+    width: int
+    height: int
+    data: bytes
+
+    @classmethod
+    def from_image(cls, img: Image.Image) -> "PackedRaster":
+        return cls(img.width, img.height, pack_1bit(img))
+
+    @classmethod
+    def from_bands(cls, bands: Iterable[Image.Image]) -> "PackedRaster":
+        """Pack 1-bit strips as they are produced, keeping only packed rows."""
+        width = height = 0
+        parts = []
+        for band in bands:
+            width = band.width
+            height += band.height
+            parts.append(pack_1bit(band))
+        return cls(width, height, b"".join(parts))
+
+    @property
+    def row_bytes(self) -> int:
+        return (self.width + 7) // 8
+
+    @cached_property
+    def hex(self) -> bytes:
+        """Uppercase ASCII hex of the packed rows, as used by ZPL ``^GFA``."""
+        return self.data.hex().upper().encode()
+
+    def to_image(self) -> Image.Image:
+        return Image.frombytes("1", (self.width, self.height), self.data)
+
+    def row(self, index: int) -> bytes:
+        start = index * self.row_bytes
+        return self.data[start : start + self.row_bytes]
+
+    def black_in_row(self, index: int) -> int:
+        # Padding bits are 0 and therefore never counted as white.
+        return self.width - sum(self.row(index).translate(_POPCOUNT))
+
+    def crop_rows(self, height: int) -> "PackedRaster":
+        return PackedRaster(self.width, height, self.data[: height * self.row_bytes])
+
+    def white_row(self) -> bytes:
+        # Padding bits stay 0, as Pillow leaves them.
+        pad = self.row_bytes * 8 - self.width
+        return b"\xff" * (self.row_bytes - 1) + bytes([(0xFF << pad) & 0xFF])
+
+
+def band_density(raster: PackedRaster, band_rows: int = 64) -> list:
+    """Share of black dots in each band of ``band_rows`` rows, top to bottom.
+
+    Counted straight from the packed bytes with a popcount table.
+    """
+    step = band_rows * raster.row_bytes
+    densities = []
+    for start in range(0, len(raster.data), step):
+        band = raster.data[start : start + step]
+        dots = len(band) // raster.row_bytes * raster.width
+        densities.append((dots - sum(band.translate(_POPCOUNT))) / dots)
+    return densities
+
+
+def center_rows(raster: PackedRaster, height: int) -> PackedRaster:
+    """Pad ``raster`` with white rows above and below to ``height`` rows."""
+    extra = height - raster.height
+    if extra <= 0:
+        return raster
+    white = raster.white_row()
+    top = extra // 2
+    return PackedRaster(
+        raster.width, height, white * top + raster.data + white * (extra - top)
+    )
+
+
+def rotate_90(raster: PackedRaster, clockwise: bool = True) -> PackedRaster:
+    """Turn a packed raster by 90 degrees without unpacking it to pixels.
+
+    Works on 8x8 blocks: every input byte column is transposed 8 rows at a
+    time with table lookups into 8 output rows. Turning clockwise is the
+    transpose of the upside-down raster; anticlockwise, the transpose
+    upside down.
+    """
+    row_bytes = raster.row_bytes
+    rows = [raster.row(i) for i in range(raster.height)]
+    if clockwise:
+        rows.reverse()
+    # Whole blocks; the zero padding rows become output padding bits.
+    rows += [bytes(row_bytes)] * (-len(rows) % 8)
+    data = b"".join(rows)
+    out_width, out_height = raster.height, raster.width
+    out_row_bytes = (out_width + 7) // 8
+    t0, t1, t2, t3, t4, t5, t6, t7 = _TRANSPOSE_8
+    out_rows = []
+    for col in range(row_bytes):
+        column = data[col::row_bytes]
+        blocks = b"".join(
+            (t0[a] | t1[b] | t2[c] | t3[d] | t4[e] | t5[f] | t6[g] | t7[h]).to_bytes(
+                8, "big"
+            )
+            for a, b, c, d, e, f, g, h in zip(*(column[r::8] for r in range(8)))
+        )
+        # Byte 8k + j of ``blocks`` belongs to output row 8 * col + j.
+        out_rows.extend(blocks[j::8] for j in range(8))
+    out_rows = out_rows[:out_height]
+    if not clockwise:
+        out_rows.reverse()
+    return PackedRaster(out_width, out_height, b"".join(out_rows))
+
+
+def trim_bottom_white(
+    raster: PackedRaster, margin: int = 6, min_density_ratio: float = 0.01
+) -> PackedRaster:
+    """Trim trailing white rows from a packed raster for continuous media.
+
+    Scans from the bottom up to find the last row with a modest number of
+    black pixels (sparse dither specks don't count) and keeps everything up to
+    it plus a small margin. Keeps at least one row.
+    """
+    min_black = max(3, int(raster.width * min_density_ratio))
+    last_content = -1
+    for row in range(raster.height - 1, -1, -1):
+        if raster.black_in_row(row) >= min_black:
+            last_content = row
+            break
+    if last_content == -1:
+        # No black pixels; keep a tiny height to avoid zero-length form
+        return raster.crop_rows(1)
+    new_h = min(raster.height, max(1, last_content + 1 + margin))
+    if new_h >= raster.height:
+        return raster
+    return raster.crop_rows(new_h)
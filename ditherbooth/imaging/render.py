@@ -0,0 +1,473 @@
+"""Render designer (Fabric.js) canvas JSON straight to a 1-bit label.
+
+Text, rectangles, circles, lines and barcodes are drawn natively at 1-bit so
+they stay crisp; only embedded images are Floyd–Steinberg dithered. Coordinates are in
+printer dots, matching the designer canvas which is sized to the media.
+"""
+
+import base64
+import binascii
+from functools import lru_cache
+import io
+import math
+import os
+from pathlib import Path
+import re
+from typing import Optional
+
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+from ditherbooth.imaging.barcode import code128_modules, qr_magnification, qr_matrix
+
+# ``{{column}}`` placeholders in text objects, filled per row by MergeRenderer.
+PLACEHOLDER = re.compile(r"\{\{\s*([^{}]+?)\s*\}\}")
+_TEXT_TYPES = ("i-text", "text", "textbox")
+
+# Fabric.js text metrics (fabric.Text defaults)
+_FONT_SIZE_MULT = 1.13
+_FONT_SIZE_FRACTION = 0.222
+
+# Font file candidates per designer font family, tried in order. Bare file
+# names are looked up by Pillow in the usual system font directories.
+FONT_FILES = {
+    "arial": ["arial.ttf", "Arial.ttf", "LiberationSans-Regular.ttf", "DejaVuSans.ttf"],
+    "courier new": [
+        "cour.ttf",
+        "Courier New.ttf",
+        "LiberationMono-Regular.ttf",
+        "DejaVuSansMono.ttf",
+    ],
+    "georgia": ["georgia.ttf", "Georgia.ttf", "DejaVuSerif.ttf"],
+    "impact": ["impact.ttf", "Impact.ttf", "DejaVuSans-Bold.ttf"],
+    "times new roman": [
+        "times.ttf",
+        "Times New Roman.ttf",
+        "LiberationSerif-Regular.ttf",
+        "DejaVuSerif.ttf",
+    ],
+    "comic sans ms": ["comic.ttf", "Comic Sans MS.ttf", "DejaVuSans.ttf"],
+}
+BOLD_FONT_FILES = {
+    "arial": [
+        "arialbd.ttf",
+        "Arial Bold.ttf",
+        "LiberationSans-Bold.ttf",
+        "DejaVuSans-Bold.ttf",
+    ],
+    "courier new": [
+        "courbd.ttf",
+        "Courier New Bold.ttf",
+        "LiberationMono-Bold.ttf",
+        "DejaVuSansMono-Bold.ttf",
+    ],
+    "georgia": ["georgiab.ttf", "Georgia Bold.ttf", "DejaVuSerif-Bold.ttf"],
+    "times new roman": [
+        "timesbd.ttf",
+        "Times New Roman Bold.ttf",
+        "LiberationSerif-Bold.ttf",
+        "DejaVuSerif-Bold.ttf",
+    ],
+    "comic sans ms": ["comicbd.ttf", "Comic Sans MS Bold.ttf", "DejaVuSans-Bold.ttf"],
+}
+
+
+@lru_cache(maxsize=64)
+def load_font(family: str, size: int, bold: bool = False) -> ImageFont.ImageFont:
+    """Find a TrueType font for a designer font family.
+
+    ``DITHERBOOTH_FONTS_DIR`` is searched first, then the system font
+    directories; Pillow's bundled font is the last resort.
+    """
+    key = (family or "arial").lower()
+    names = (BOLD_FONT_FILES.get(key, []) if bold else []) + FONT_FILES.get(
+        key, [f"{family}.ttf"]
+    )
+    fonts_dir = os.getenv("DITHERBOOTH_FONTS_DIR")
+    candidates = [str(Path(fonts_dir) / n) for n in names] if fonts_dir else []
+    for name in candidates + names:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size=size)
+
+
+def parse_color(value) -> Optional[int]:
+    """Map a CSS color to a 1-bit ink (0 black, 255 white); None if unpainted."""
+    if not value or not isinstance(value, str) or value == "transparent":
+        return None
+    try:
+        rgba = ImageColor.getrgb(value)
+    except ValueError:
+        return None
+    if len(rgba) == 4 and rgba[3] < 128:
+        return None
+    r, g, b = rgba[:3]
+    return 0 if (r * 299 + g * 587 + b * 114) / 1000 < 128 else 255
+
+
+def decode_image_src(src: str) -> Optional[Image.Image]:
+    """Open an embedded ``data:`` URL image; remote URLs are not fetched."""
+    if not isinstance(src, str) or not src.startswith("data:") or "," not in src:
+        return None
+    header, data = src.split(",", 1)
+    try:
+        raw = base64.b64decode(data) if header.endswith(";base64") else data.encode()
+        img = Image.open(io.BytesIO(raw))
+        img.load()
+        return img
+    except (binascii.Error, OSError, ValueError):
+        return None
+
+
+def _dims(obj: dict) -> tuple[float, float]:
+    """Scaled bounding-box size, including the stroke like Fabric does."""
+    sw = (
+        float(obj.get("strokeWidth") or 0)
+        if obj.get("type") not in _TEXT_TYPES
+        else 0.0
+    )
+    w = (float(obj.get("width") or 0) + sw) * abs(float(obj.get("scaleX", 1) or 1))
+    h = (float(obj.get("height") or 0) + sw) * abs(float(obj.get("scaleY", 1) or 1))
+    return w, h
+
+
+def _center(obj: dict, dw: float, dh: float) -> tuple[float, float]:
+    ox = {"left": 0.5, "center": 0.0, "right": -0.5}.get(
+        obj.get("originX", "left"), 0.5
+    ) * dw
+    oy = {"top": 0.5, "center": 0.0, "bottom": -0.5}.get(
+        obj.get("originY", "top"), 0.5
+    ) * dh
+    theta = math.radians(float(obj.get("angle") or 0))
+    cx = float(obj.get("left") or 0) + ox * math.cos(theta) - oy * math.sin(theta)
+    cy = float(obj.get("top") or 0) + ox * math.sin(theta) + oy * math.cos(theta)
+    return cx, cy
+
+
+def object_box(obj: dict) -> tuple[float, float, float, float]:
+    """Unrotated ``(x, y, width, height)`` of an object's box in dots."""
+    dw, dh = _dims(obj)
+    cx, cy = _center(obj, dw, dh)
+    return cx - dw / 2, cy - dh / 2, dw, dh
+
+
+def object_bounds(obj: dict) -> tuple[int, int, int, int]:
+    """``(left, top, right, bottom)`` of an object after rotation, in dots."""
+    dw, dh = _dims(obj)
+    cx, cy = _center(obj, dw, dh)
+    theta = math.radians(float(obj.get("angle") or 0))
+    half_w = (abs(dw * math.cos(theta)) + abs(dh * math.sin(theta))) / 2
+    half_h = (abs(dw * math.sin(theta)) + abs(dh * math.cos(theta))) / 2
+    return (
+        math.floor(cx - half_w),
+        math.floor(cy - half_h),
+        math.ceil(cx + half_w),
+        math.ceil(cy + half_h),
+    )
+
+
+def line_height(obj: dict) -> float:
+    """Distance between text baselines in dots, as Fabric lays them out."""
+    sy = abs(float(obj.get("scaleY", 1) or 1))
+    return (
+        float(obj.get("fontSize") or 40)
+        * _FONT_SIZE_MULT
+        * float(obj.get("lineHeight") or 1.16)
+        * sy
+    )
+
+
+def is_visible(obj: dict) -> bool:
+    return (
+        isinstance(obj, dict)
+        and obj.get("visible", True)
+        and float(obj.get("opacity", 1) or 0) >= 0.5
+    )
+
+
+def _draw_text(obj: dict, dw: float, dh: float) -> tuple[Image.Image, Image.Image]:
+    sx = abs(float(obj.get("scaleX", 1) or 1))
+    sy = abs(float(obj.get("scaleY", 1) or 1))
+    font_size = float(obj.get("fontSize") or 40)
+    bold = str(obj.get("fontWeight", "normal")) in ("bold", "700", "800", "900")
+    font = load_font(
+        obj.get("fontFamily") or "Arial", max(1, round(font_size * sy)), bold
+    )
+    # Draw at vertical scale, then stretch horizontally if scaleX differs.
+    w = max(1, math.ceil(dw / sx * sy))
+    h = max(1, math.ceil(dh))
+    ink = parse_color(obj.get("fill", "#000000"))
+    layer = Image.new("1", (w, h), 255)
+    mask = Image.new("1", (w, h), 0)
+    draw_layer, draw_mask = ImageDraw.Draw(layer), ImageDraw.Draw(mask)
+    line_h = line_height(obj)
+    align = obj.get("textAlign", "left")
+    for i, line in enumerate(str(obj.get("text", "")).split("\n")):
+        baseline = i * line_h + font_size * (_FONT_SIZE_MULT - _FONT_SIZE_FRACTION) * sy
+        line_w = draw_layer.textlength(line, font=font)
+        x = {"center": (w - line_w) / 2, "right": w - line_w}.get(align, 0)
+        if ink is not None:
+            draw_layer.text((x, baseline), line, fill=ink, font=font, anchor="ls")
+            draw_mask.text((x, baseline), line, fill=255, font=font, anchor="ls")
+    if abs(sx - sy) > 1e-6:
+        size = (max(1, math.ceil(dw)), h)
+        layer, mask = layer.resize(size, Image.NEAREST), mask.resize(
+            size, Image.NEAREST
+        )
+    return layer, mask
+
+
+def _draw_barcode(obj: dict, dw: float, dh: float) -> tuple[Image.Image, Image.Image]:
+    """Bars as the printer draws them: from the object's top-left, ``dh`` tall
+    (Code 128), or ``barcodeModule`` dots per module (QR)."""
+    data = str(obj.get("text", "")).replace("\n", "")
+    if obj["barcode"] == "qr":
+        mag = qr_magnification(dw, dh, obj.get("barcodeModule"))
+        rows = qr_matrix(data)
+        layer = Image.new("1", (len(rows[0]), len(rows)), 255)
+        layer.putdata([0 if dark else 255 for row in rows for dark in row])
+        layer = layer.resize((layer.width * mag, layer.height * mag), Image.NEAREST)
+    else:
+        module = int(obj.get("barcodeModule") or 2)
+        bars = code128_modules(data)
+        layer = Image.new("1", (len(bars), 1), 255)
+        layer.putdata([0 if bar else 255 for bar in bars])
+        layer = layer.resize((layer.width * module, max(1, round(dh))), Image.NEAREST)
+    return layer, Image.new("1", layer.size, 255)
+
+
+def _draw_shape(obj: dict, dw: float, dh: float) -> tuple[Image.Image, Image.Image]:
+    w, h = max(1, math.ceil(dw)), max(1, math.ceil(dh))
+    sx = abs(float(obj.get("scaleX", 1) or 1))
+    sy = abs(float(obj.get("scaleY", 1) or 1))
+    fill = parse_color(obj.get("fill"))
+    stroke = parse_color(obj.get("stroke"))
+    sw = float(obj.get("strokeWidth") or 0)
+    stroke_px = max(1, round(sw * min(sx, sy))) if stroke is not None and sw > 0 else 0
+    layer = Image.new("1", (w, h), 255)
+    mask = Image.new("1", (w, h), 0)
+    box = (0, 0, w - 1, h - 1)
+    kind = obj.get("type")
+    for img, fill_v, stroke_v in ((layer, fill, stroke), (mask, 255, 255)):
+        draw = ImageDraw.Draw(img)
+        fill_ink = fill_v if fill is not None else None
+        stroke_ink = stroke_v if stroke_px else None
+        if kind == "line":
+            x1, y1 = (
+                float(obj.get("x1") or 0) * sx + dw / 2,
+                float(obj.get("y1") or 0) * sy + dh / 2,
+            )
+            x2, y2 = (
+                float(obj.get("x2") or 0) * sx + dw / 2,
+                float(obj.get("y2") or 0) * sy + dh / 2,
+            )
+            if stroke_ink is not None:
+                draw.line((x1, y1, x2, y2), fill=stroke_ink, width=stroke_px)
+        elif kind in ("circle", "ellipse"):
+            draw.ellipse(box, fill=fill_ink, outline=stroke_ink, width=stroke_px)
+        elif obj.get("rx"):
+            radius = round(float(obj["rx"]) * sx)
+            draw.rounded_rectangle(
+                box, radius, fill=fill_ink, outline=stroke_ink, width=stroke_px
+            )
+        else:
+            draw.rectangle(box, fill=fill_ink, outline=stroke_ink, width=stroke_px)
+    return layer, mask
+
+
+def _draw_image(
+    obj: dict, dw: float, dh: float
+) -> Optional[tuple[Image.Image, Image.Image]]:
+    src = decode_image_src(obj.get("src", ""))
+    if src is None:
+        return None
+    crop_x, crop_y = int(obj.get("cropX") or 0), int(obj.get("cropY") or 0)
+    cw, ch = int(obj.get("width") or src.width), int(obj.get("height") or src.height)
+    if (crop_x, crop_y, cw, ch) != (0, 0, src.width, src.height):
+        src = src.crop((crop_x, crop_y, crop_x + cw, crop_y + ch))
+    size = (max(1, round(dw)), max(1, round(dh)))
+    if src.mode in ("RGBA", "LA") or (src.mode == "P" and "transparency" in src.info):
+        rgba = src.convert("RGBA").resize(size, Image.LANCZOS)
+        mask = rgba.getchannel("A").point([0] * 128 + [255] * 128, "1")
+        white = Image.new("RGBA", size, (255, 255, 255, 255))
+        gray = Image.alpha_composite(white, rgba).convert("L")
+    else:
+        gray = src.convert("L").resize(size, Image.LANCZOS)
+        mask = Image.new("1", size, 255)
+    return gray.convert("1"), mask
+
+
+def _render_object(
+    obj: dict,
+) -> Optional[tuple[Image.Image, Image.Image, float, float]]:
+    kind = obj.get("type")
+    dw, dh = _dims(obj)
+    if obj.get("barcode") and kind in _TEXT_TYPES:
+        if float(obj.get("angle") or 0) % 360:
+            raise ValueError("Rotated barcodes are not supported")
+        x, y, _, _ = object_box(obj)
+        layer, mask = _draw_barcode(obj, dw, dh)
+        return layer, mask, x, y
+    if kind in _TEXT_TYPES:
+        drawn = _draw_text(obj, dw, dh)
+    elif kind in ("rect", "circle", "ellipse", "line"):
+        drawn = _draw_shape(obj, dw, dh)
+    elif kind == "image":
+        drawn = _draw_image(obj, dw, dh)
+    else:
+        return None
+    if drawn is None:
+        return None
+    layer, mask = drawn
+    if obj.get("flipX"):
+        layer, mask = layer.transpose(Image.Transpose.FLIP_LEFT_RIGHT), mask.transpose(
+            Image.Transpose.FLIP_LEFT_RIGHT
+        )
+    if obj.get("flipY"):
+        layer, mask = layer.transpose(Image.Transpose.FLIP_TOP_BOTTOM), mask.transpose(
+            Image.Transpose.FLIP_TOP_BOTTOM
+        )
+    angle = float(obj.get("angle") or 0) % 360
+    if angle:
+        # Fabric angles are clockwise; Pillow's are counter-clockwise.
+        layer = layer.rotate(-angle, Image.NEAREST, expand=True, fillcolor=255)
+        mask = mask.rotate(-angle, Image.NEAREST, expand=True, fillcolor=0)
+    cx, cy = _center(obj, dw, dh)
+    return layer, mask, cx - layer.width / 2, cy - layer.height / 2
+
+
+def content_height(canvas_json: dict) -> int:
+    """Bottom edge of the lowest visible object, for media without a height."""
+    bottom = 1
+    for obj in canvas_json.get("objects") or []:
+        if not is_visible(obj):
+            continue
+        bottom = max(bottom, object_bounds(obj)[3])
+    return bottom
+
+
+def render_canvas(
+    canvas_json: dict,
+    width: int,
+    height: Optional[int] = None,
+    max_height: Optional[int] = None,
+) -> Image.Image:
+    """Render Fabric.js canvas JSON to a 1-bit image ``width`` dots wide.
+
+    Without ``height`` (continuous media) the label is as tall as its content,
+    which must not exceed ``max_height``. Objects are painted in order, so
+    later objects cover earlier ones. Raises ``ValueError`` for unusable input.
+    """
+    if not isinstance(canvas_json, dict):
+        raise ValueError("canvas_json must be an object")
+    if not height:
+        height = content_height(canvas_json)
+        if max_height and height > max_height:
+            raise ValueError("Rendered label is taller than the maximum height")
+    background = parse_color(canvas_json.get("background"))
+    out = Image.new("1", (width, height), 255 if background is None else background)
+    for obj in canvas_json.get("objects") or []:
+        if not is_visible(obj):
+            continue
+        rendered = _render_object(obj)
+        if rendered is None:
+            continue
+        layer, mask, x, y = rendered
+        out.paste(layer, (round(x), round(y)), mask)
+    return out
+
+
+def fill_placeholders(text: str, row: dict) -> str:
+    return PLACEHOLDER.sub(lambda m: str(row.get(m.group(1), "")), text)
+
+
+def is_dynamic(obj: dict) -> bool:
+    return obj.get("type") in _TEXT_TYPES and bool(
+        PLACEHOLDER.search(str(obj.get("text", "")))
+    )
+
+
+def merge_text(obj: dict, row: dict) -> dict:
+    text = fill_placeholders(str(obj.get("text", "")), row)
+    merged = dict(obj, text=text)
+    if obj.get("type") != "textbox":
+        # Like Fabric, auto-sized text grows to fit its new content.
+        bold = str(obj.get("fontWeight", "normal")) in ("bold", "700", "800", "900")
+        font = load_font(
+            obj.get("fontFamily") or "Arial",
+            max(1, round(float(obj.get("fontSize") or 40))),
+            bold,
+        )
+        merged["width"] = max(
+            [1.0] + [font.getlength(line) for line in text.split("\n")]
+        )
+    return merged
+
+
+def _overlaps(a: tuple, b: tuple) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+class MergeRenderer:
+    """Render one template for many data rows (mail merge).
+
+    Every object without a ``{{placeholder}}`` is rendered once into a cached,
+    already 1-bit background. Each row then only renders its placeholder texts
+    and re-applies the static objects stacked above them, so the per-label
+    cost is proportional to the changing regions.
+    """
+
+    def __init__(
+        self,
+        canvas_json: dict,
+        width: int,
+        height: Optional[int] = None,
+        max_height: Optional[int] = None,
+    ):
+        if not isinstance(canvas_json, dict):
+            raise ValueError("canvas_json must be an object")
+        objects = [o for o in canvas_json.get("objects") or [] if is_visible(o)]
+        self.dynamic = [(i, o) for i, o in enumerate(objects) if is_dynamic(o)]
+        dynamic_idx = {i for i, _ in self.dynamic}
+        static = dict(
+            canvas_json,
+            objects=[o for i, o in enumerate(objects) if i not in dynamic_idx],
+        )
+        self.background = render_canvas(
+            static, width, height or content_height(canvas_json), max_height
+        )
+        first = self.dynamic[0][0] if self.dynamic else len(objects)
+        self._overlays = []
+        for i, obj in enumerate(objects):
+            if i > first and i not in dynamic_idx:
+                rendered = _render_object(obj)
+                if rendered is not None:
+                    layer, mask, x, y = rendered
+                    pos = (round(x), round(y))
+                    box = (pos[0], pos[1], pos[0] + layer.width, pos[1] + layer.height)
+                    self._overlays.append((i, layer, mask, pos, box))
+
+    @property
+    def fields(self) -> list:
+        names = []
+        for _, obj in self.dynamic:
+            for name in PLACEHOLDER.findall(str(obj.get("text", ""))):
+                if name not in names:
+                    names.append(name)
+        return names
+
+    def render(self, row: dict) -> Image.Image:
+        out = self.background.copy()
+        for i, obj in self.dynamic:
+            rendered = _render_object(merge_text(obj, row))
+            if rendered is None:
+                continue
+            layer, mask, x, y = rendered
+            pos = (round(x), round(y))
+            out.paste(layer, pos, mask)
+            box = (pos[0], pos[1], pos[0] + layer.width, pos[1] + layer.height)
+            for j, o_layer, o_mask, o_pos, o_box in self._overlays:
+                if j > i and _overlaps(box, o_box):
+                    out.paste(o_layer, o_pos, o_mask)
+        return out
@@ -0,0 +1,78 @@
+"""Tone curves that compensate for a thermal printer's dot gain.
+
+A step wedge of known gray levels is printed, and how light each step came
+out is measured (or judged by eye) on a 0-100 scale. :func:`lut_from_response`
+inverts that response into a 256-entry lookup table, applied with
+``Image.point`` before dithering, so the printed tones come out evenly spaced.
+"""
+
+from typing import Optional, Sequence
+
+from PIL import Image
+
+# Gray levels of the printed wedge, black to white.
+WEDGE_STEPS = 11
+WEDGE_LEVELS = tuple(round(i * 255 / (WEDGE_STEPS - 1)) for i in range(WEDGE_STEPS))
+
+
+def step_wedge(width: int, height: int) -> Image.Image:
+    """Grayscale wedge of :data:`WEDGE_LEVELS` as numbered horizontal bands."""
+    # Only calibration draws; ``process`` imports this module on every start.
+    from PIL import ImageDraw
+
+    img = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(img)
+    band = height / WEDGE_STEPS
+    for i, level in enumerate(WEDGE_LEVELS):
+        top, bottom = round(i * band), round((i + 1) * band)
+        # The number sits in a white box on the left so it stays readable.
+        draw.rectangle((0, top, width, bottom), fill=level)
+        draw.rectangle((0, top, 40, bottom - 1), fill=255)
+        draw.text((6, top + 2), str(i + 1), fill=0)
+    return img
+
+
+def lut_from_gamma(gamma: float) -> list:
+    """LUT for a plain gamma curve; above 1 lightens midtones."""
+    if gamma <= 0:
+        raise ValueError("gamma must be positive")
+    return [round(255 * (i / 255) ** (1 / gamma)) for i in range(256)]
+
+
+def lut_from_response(response: Sequence[float]) -> list:
+    """LUT that makes the measured wedge ``response`` print linearly.
+
+    ``response`` has one lightness value (0 black to 100 white) per wedge
+    step, darkest step first. Noise in the measurements is smoothed by
+    forcing the response to be non-decreasing.
+    """
+    if len(response) != WEDGE_STEPS:
+        raise ValueError(f"response needs {WEDGE_STEPS} values, one per wedge step")
+    values = []
+    for value in response:
+        if not 0 <= value <= 100:
+            raise ValueError("response values must be between 0 and 100")
+        values.append(max(values[-1], float(value)) if values else float(value))
+    low, high = values[0], values[-1]
+    if high <= low:
+        raise ValueError("response must get lighter from the first step to the last")
+    lut = []
+    step = 0
+    for i in range(256):
+        # Printed lightness wanted for input i, then the input level that
+        # produces it, interpolated between the wedge steps around it.
+        target = low + (high - low) * i / 255
+        while step < WEDGE_STEPS - 2 and values[step + 1] < target:
+            step += 1
+        lo, hi = values[step], values[step + 1]
+        frac = (target - lo) / (hi - lo) if hi > lo else 0.0
+        level = WEDGE_LEVELS[step] + frac * (
+            WEDGE_LEVELS[step + 1] - WEDGE_LEVELS[step]
+        )
+        lut.append(min(255, max(0, round(level))))
+    return lut
+
+
+def apply_lut(img: Image.Image, lut: Optional[Sequence[int]]) -> Image.Image:
+    """``img`` through ``lut``; unchanged without one."""
+    return img.point(list(lut)) if lut else img
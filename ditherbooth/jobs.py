@@ -0,0 +1,183 @@
+"""Print job tracking with estimated and printer-confirmed completion.
+
+Spooling returns as soon as the printer (or CUPS) has the data, long before
+the label is out. Each job therefore gets an ETA from a print-speed model,
+and is marked done either when the printer reports it has no more of our
+jobs pending, or when its ETA passes if the printer can't tell us. Printer
+confirmed completions also calibrate the model.
+"""
+
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+import threading
+import time
+from typing import Callable, Optional
+import uuid
+
+DPI = 203
+# EPL speed settings S1-S6 in inches per second (LP2844 family).
+EPL_SPEED_IPS = {1: 1.5, 2: 2.0, 3: 2.5, 4: 3.5, 5: 4.0, 6: 5.0}
+DEFAULT_IPS = 2.0
+# Label feed, gap sensing and head warm-up per job.
+LABEL_OVERHEAD_S = 0.5
+# Conservative raw throughput of the USB/serial/TCP link.
+LINK_BYTES_PER_S = 200_000
+
+
+def print_seconds(rows: int, nbytes: int = 0, speed: Optional[int] = None) -> float:
+    """Modelled time for the printer to receive and print ``rows`` dot rows."""
+    ips = EPL_SPEED_IPS.get(speed, DEFAULT_IPS) if speed is not None else DEFAULT_IPS
+    return LABEL_OVERHEAD_S + rows / (DPI * ips) + nbytes / LINK_BYTES_PER_S
+
+
+@dataclass
+class Job:
+    id: str
+    media: str
+    lang: str
+    rows: int
+    bytes: int
+    submitted_at: float
+    # queued -> printing -> done, or failed
+    state: str = "queued"
+    started_at: Optional[float] = None
+    eta: Optional[float] = None
+    finished_at: Optional[float] = None
+    # "printer" when the printer confirmed it, "estimate" when the ETA passed
+    completion: Optional[str] = None
+    error: Optional[str] = None
+    # Who submitted it (``X-Client-Id`` or address), for pushed updates
+    client: Optional[str] = None
+
+    def to_dict(self, now: Optional[float] = None) -> dict:
+        now = time.time() if now is None else now
+        data = asdict(self)
+        del data["client"]
+        data["eta_seconds"] = (
+            round(max(0.0, self.eta - now), 1) if self.state == "printing" else None
+        )
+        return data
+
+
+class JobTracker:
+    """Recent jobs, in submission order (the printer prints them in order).
+
+    ``on_change`` is called with each job after it is added or changes state.
+    """
+
+    def __init__(
+        self, history: int = 200, on_change: Optional[Callable[[Job], None]] = None
+    ):
+        self.history = history
+        self.speed_scale = 1.0
+        self.on_change = on_change
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _changed(self, *jobs: Job) -> None:
+        if self.on_change is not None:
+            for job in jobs:
+                self.on_change(job)
+
+    def new(
+        self,
+        media: str,
+        lang: str,
+        rows: int,
+        nbytes: int = 0,
+        job_id: Optional[str] = None,
+        client: Optional[str] = None,
+    ) -> Job:
+        job = Job(
+            job_id or uuid.uuid4().hex[:12],
+            media,
+            lang,
+            rows,
+            nbytes,
+            time.time(),
+            client=client,
+        )
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history:
+                self._jobs.popitem(last=False)
+        self._changed(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def _printing(self) -> list:
+        return [j for j in self._jobs.values() if j.state == "printing"]
+
+    def start(self, job: Job, speed: Optional[int] = None) -> None:
+        """The job is being sent; it starts printing after the ones ahead."""
+        now = time.time()
+        with self._lock:
+            ahead = max([now] + [j.eta for j in self._printing()])
+            job.state = "printing"
+            job.started_at = now
+            job.eta = (
+                ahead + print_seconds(job.rows, job.bytes, speed) * self.speed_scale
+            )
+        self._changed(job)
+
+    def finish(self, job: Job) -> None:
+        """Done without printing to a real device (test mode)."""
+        with self._lock:
+            job.state = "done"
+            job.finished_at = time.time()
+            job.completion = "test"
+        self._changed(job)
+
+    def fail(self, job: Job, error: str) -> None:
+        with self._lock:
+            job.state = "failed"
+            job.finished_at = time.time()
+            job.error = error
+        self._changed(job)
+
+    def refresh(self, pending: Optional[int] = None) -> None:
+        """Mark finished jobs done.
+
+        ``pending`` is how many jobs the printer (or CUPS queue) still holds,
+        when it can say; the oldest of ours beyond that are complete.
+        Otherwise jobs complete when their ETA passes.
+        """
+        now = time.time()
+        with self._lock:
+            printing = self._printing()
+            if pending is None:
+                done = [job for job in printing if job.eta <= now]
+                for job in done:
+                    self._complete(job, job.eta, "estimate")
+            else:
+                done = printing[: max(0, len(printing) - pending)]
+                for job in done:
+                    self._complete(job, now, "printer")
+                    self._calibrate(job, now)
+        self._changed(*done)
+
+    def _complete(self, job: Job, when: float, how: str) -> None:
+        job.state = "done"
+        job.finished_at = when
+        job.completion = how
+
+    def _calibrate(self, job: Job, now: float) -> None:
+        predicted = job.eta - job.started_at
+        if predicted > 0:
+            ratio = (now - job.started_at) / predicted
+            self.speed_scale = min(
+                4.0, max(0.25, 0.8 * self.speed_scale + 0.2 * ratio * self.speed_scale)
+            )
+
+    def in_printer(self) -> int:
+        return len(self._printing())
+
+    def active(self) -> list:
+        return [j for j in self._jobs.values() if j.state in ("queued", "printing")]
+
+    def queue_eta(self) -> float:
+        """Seconds until everything sent so far should be printed."""
+        now = time.time()
+        return max([0.0] + [j.eta - now for j in self._printing()])
@@ -0,0 +1,287 @@
+"""Append-only on-disk journal of print jobs, for recovery after a restart.
+
+Every job's encoded payload is written to the journal before it is spooled,
+and marked off once the printer (or CUPS) has it. If the process dies in
+between, the jobs that were accepted but never handed over are found again
+on the next start and printed. Streamed payloads are written chunk by chunk
+just ahead of spooling, so the printer gets the first bytes at once; a
+streamed job cut off before its last chunk is not replayed.
+
+Records are a JSON header line, followed for ``data`` records by ``size``
+payload bytes with a CRC32 to detect a torn final write::
+
+    {"op": "job", "id": ..., "meta": {...}}
+    {"op": "data", "id": ..., "size": n, "crc": c}  + n bytes   (one or more)
+    {"op": "end", "id": ...}                        payload complete
+    {"op": "spooled"|"failed", "id": ...}           finished
+
+Writes are not synced one by one: a background thread fsyncs at most every
+``sync_interval`` seconds, so a power cut loses at most that much.
+"""
+
+import json
+import logging
+import os
+import threading
+import zlib
+from typing import Iterable, Iterator, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+Payload = Union[bytes, bytearray, str, Iterable[bytes]]
+
+
+class _Entry:
+    def __init__(self, meta: dict):
+        self.meta = meta
+        # (offset, size) of each data chunk in the file
+        self.chunks: list = []
+        self.complete = False
+
+
+class JobJournal:
+    """Journal at ``path``; call :meth:`open` before use.
+
+    The file is rewritten with only the unfinished jobs once it grows past
+    ``compact_bytes``.
+    """
+
+    def __init__(
+        self, path, sync_interval: float = 0.1, compact_bytes: int = 16 * 1024 * 1024
+    ):
+        self.path = str(path)
+        self.sync_interval = sync_interval
+        self.compact_bytes = compact_bytes
+        self._entries: dict = {}
+        self._fd: Optional[int] = None
+        self._size = 0
+        self._lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._closed = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+    # ---- Startup ----
+
+    def open(self) -> list:
+        """Load the journal and return the ids of jobs left to print."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        valid_end = self._scan()
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        # Drop a record torn by a crash mid-write.
+        os.ftruncate(self._fd, valid_end)
+        self._size = valid_end
+        # Jobs whose payload was never fully written were never spooled.
+        self._entries = {job_id: e for job_id, e in self._entries.items() if e.complete}
+        if self._size > self.compact_bytes or (self._size and not self._entries):
+            self._compact()
+        self._flusher = threading.Thread(
+            target=self._flush_loop, name="journal-fsync", daemon=True
+        )
+        self._flusher.start()
+        return list(self._entries)
+
+    def _scan(self) -> int:
+        """Index the existing file; returns the offset after the last good record."""
+        self._entries = {}
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return 0
+        with f:
+            good = 0
+            while True:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    rec = json.loads(line)
+                    job_id, op = rec["id"], rec["op"]
+                except (ValueError, KeyError, TypeError):
+                    break
+                if op == "data":
+                    offset = f.tell()
+                    data = f.read(rec["size"])
+                    if len(data) != rec["size"] or zlib.crc32(data) != rec["crc"]:
+                        break
+                    if job_id in self._entries:
+                        self._entries[job_id].chunks.append((offset, rec["size"]))
+                elif op == "job":
+                    self._entries[job_id] = _Entry(rec.get("meta", {}))
+                elif op == "end" and job_id in self._entries:
+                    self._entries[job_id].complete = True
+                elif op in ("spooled", "failed"):
+                    self._entries.pop(job_id, None)
+                good = f.tell()
+        return good
+
+    # ---- Writing ----
+
+    def _write(self, header: dict, data: bytes = b"") -> int:
+        """Append one record; returns where its data starts. Lock held."""
+        line = (json.dumps(header, separators=(",", ":")) + "\n").encode()
+        os.write(self._fd, line + data)
+        start = self._size + len(line)
+        self._size = start + len(data)
+        self._dirty.set()
+        return start
+
+    def record(self, job_id: str, meta: dict, payload: Payload) -> Payload:
+        """Journal a job's payload for spooling, and return what to spool.
+
+        Bytes are written before this returns and handed back. A stream of
+        chunks is handed back wrapped: each chunk is written as the spooler
+        takes it, and the job is complete once the stream is used up.
+        """
+        entry = _Entry(meta)
+        with self._lock:
+            self._entries[job_id] = entry
+            self._write({"op": "job", "id": job_id, "meta": meta})
+        if isinstance(payload, (bytes, bytearray, str)):
+            for chunk in _chunks(payload):
+                self._append(job_id, entry, chunk)
+            self._end(job_id, entry)
+            return payload
+        return self._tee(job_id, entry, payload)
+
+    def _tee(self, job_id: str, entry: _Entry, chunks: Iterable[bytes]):
+        for chunk in chunks:
+            self._append(job_id, entry, chunk)
+            yield chunk
+        self._end(job_id, entry)
+
+    def _append(self, job_id: str, entry: _Entry, chunk: bytes) -> None:
+        header = {
+            "op": "data",
+            "id": job_id,
+            "size": len(chunk),
+            "crc": zlib.crc32(chunk),
+        }
+        with self._lock:
+            entry.chunks.append((self._write(header, chunk), len(chunk)))
+
+    def _end(self, job_id: str, entry: _Entry) -> None:
+        with self._lock:
+            # Marked off meanwhile (the spool failed): nothing to complete.
+            if self._entries.get(job_id) is not entry:
+                return
+            self._write({"op": "end", "id": job_id})
+            entry.complete = True
+
+    def mark(self, job_id: str, state: str) -> None:
+        """Record that a job was ``spooled`` or ``failed``; it won't be replayed."""
+        with self._lock:
+            if self._entries.pop(job_id, None) is None:
+                return
+            self._write({"op": state, "id": job_id})
+            if self._size > self.compact_bytes:
+                self._compact()
+
+    # ---- Reading ----
+
+    def meta(self, job_id: str) -> dict:
+        return self._entries[job_id].meta
+
+    def read(self, job_id: str) -> Iterator[bytes]:
+        """The job's payload chunks, read back from the journal file."""
+        chunks = list(self._entries[job_id].chunks)
+        # Opened now, not on first read: a compaction in between replaces the
+        # file, but this handle keeps the one the offsets refer to.
+        return _read_chunks(open(self.path, "rb", buffering=0), chunks)
+
+    # ---- Maintenance ----
+
+    def _compact(self) -> None:
+        """Rewrite the file with only unfinished jobs. Lock held (or startup)."""
+        tmp = self.path + ".tmp"
+        src = os.open(self.path, os.O_RDONLY)
+        out = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        old_fd, old_size = self._fd, self._size
+        try:
+            self._fd, self._size = out, 0
+            moved = {}
+            for job_id, entry in self._entries.items():
+                self._write({"op": "job", "id": job_id, "meta": entry.meta})
+                moved[job_id] = []
+                for offset, size in entry.chunks:
+                    data = os.pread(src, size, offset)
+                    header = {
+                        "op": "data",
+                        "id": job_id,
+                        "size": size,
+                        "crc": zlib.crc32(data),
+                    }
+                    moved[job_id].append((self._write(header, data), size))
+                if entry.complete:
+                    self._write({"op": "end", "id": job_id})
+            os.fsync(out)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.close(out)
+            self._fd, self._size = old_fd, old_size
+            raise
+        finally:
+            os.close(src)
+        for job_id, chunks in moved.items():
+            self._entries[job_id].chunks = chunks
+        if old_fd is not None:
+            os.close(old_fd)
+        _fsync_dir(self.path)
+
+    def _flush_loop(self) -> None:
+        while not self._closed.is_set():
+            self._dirty.wait()
+            # Let writes arriving close together share one fsync.
+            self._closed.wait(self.sync_interval)
+            self.sync()
+
+    def sync(self) -> None:
+        with self._lock:
+            if self._fd is None or not self._dirty.is_set():
+                return
+            self._dirty.clear()
+            # Synced through a duplicate, outside the lock, so writers don't
+            # wait for the disk and a compaction can swap the file meanwhile.
+            fd = os.dup(self._fd)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def close(self) -> None:
+        self._closed.set()
+        self._dirty.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.sync()
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+
+def _chunks(payload: Payload) -> Iterator[bytes]:
+    if isinstance(payload, str):
+        yield payload.encode()
+    elif isinstance(payload, (bytes, bytearray)):
+        yield bytes(payload)
+    else:
+        yield from payload
+
+
+def _read_chunks(f, chunks: list) -> Iterator[bytes]:
+    with f:
+        for offset, size in chunks:
+            yield os.pread(f.fileno(), size, offset)
+
+
+def _fsync_dir(path: str) -> None:
+    try:
+        fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
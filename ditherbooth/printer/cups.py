@@ -1,19 +1,92 @@
 import os
+import socket
 import subprocess
 import tempfile
-from typing import Union
+import threading
+from typing import Iterable, Iterator, Union
 
+Payload = Union[bytes, str, Iterable[Union[bytes, str]]]
 
-def spool_raw(printer_name: str, payload: Union[bytes, str]) -> None:
-    data = payload.encode() if isinstance(payload, str) else payload
+_printer_locks: dict = {}
+_printer_locks_guard = threading.Lock()
+
+
+def printer_lock(printer_name: str) -> threading.Lock:
+    """The lock held while anything is written to ``printer_name``.
+
+    Streamed jobs reach the printer chunk by chunk, so two jobs (or a job and
+    a status query) sent at once would interleave on a device.
+    """
+    with _printer_locks_guard:
+        return _printer_locks.setdefault(printer_name, threading.Lock())
+
+
+def _chunks(payload: Payload) -> Iterator[bytes]:
+    if isinstance(payload, str):
+        yield payload.encode()
+    elif isinstance(payload, (bytes, bytearray, memoryview)):
+        yield bytes(payload)
+    else:
+        for chunk in payload:
+            yield chunk.encode() if isinstance(chunk, str) else chunk
+
+
+def _spool_tcp(address: str, payload: Payload) -> None:
+    host, _, port = address.rpartition(":")
+    with socket.create_connection((host, int(port or 9100)), timeout=30) as sock:
+        for chunk in _chunks(payload):
+            sock.sendall(chunk)
+
+
+def _spool_lpr_stream(printer_name: str, payload: Payload) -> None:
+    cmd = ["lpr", "-P", printer_name]
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+    try:
+        for chunk in _chunks(payload):
+            proc.stdin.write(chunk)
+        proc.stdin.close()
+    except BrokenPipeError:
+        # lpr exited early; its return code below says why
+        pass
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    returncode = proc.wait(timeout=30)
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd)
+
+
+def spool_raw(printer_name: str, payload: Payload) -> None:
+    """Send a raw EPL/ZPL payload to a printer.
+
+    ``printer_name`` is a device path (``/dev/usb/lp0``), a raw TCP address
+    (``tcp://host:9100``) or a CUPS queue name. ``payload`` may be bytes, str
+    or an iterable of chunks (as yielded by the ``iter_*`` encoders); chunks
+    are written as they are produced, so the payload never has to exist in
+    memory as a whole. Jobs for the same printer are sent one at a time.
+    """
+    with printer_lock(printer_name):
+        _spool(printer_name, payload)
+
+
+def _spool(printer_name: str, payload: Payload) -> None:
     if printer_name.startswith("/dev/"):
         with open(printer_name, "wb") as dev:
-            dev.write(data)
-    else:
+            for chunk in _chunks(payload):
+                dev.write(chunk)
+    elif printer_name.startswith("tcp://"):
+        _spool_tcp(printer_name[len("tcp://") :], payload)
+    elif isinstance(payload, (bytes, bytearray, str)):
+        data = payload.encode() if isinstance(payload, str) else payload
         with tempfile.NamedTemporaryFile(delete=False) as tmp:
             tmp.write(data)
             tmp_path = tmp.name
         try:
-            subprocess.run(["lpr", "-P", printer_name, tmp_path], check=True, timeout=30)
+            subprocess.run(
+                ["lpr", "-P", printer_name, tmp_path], check=True, timeout=30
+            )
         finally:
             os.unlink(tmp_path)
+    else:
+        _spool_lpr_stream(printer_name, payload)
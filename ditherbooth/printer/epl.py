@@ -1,36 +1,18 @@
-import math
-from typing import Optional
+from typing import Iterator, Optional
 from PIL import Image
 
+from ditherbooth.imaging.raster import PackedRaster
 
-def img_to_epl_gw(
-    img: Image.Image,
-    x: int = 20,
-    y: int = 20,
+
+def epl_header(
+    width: int,
+    height: int,
     gap: Optional[int] = 24,
     label_height: Optional[int] = None,
     darkness: Optional[int] = None,
     speed: Optional[int] = None,
 ) -> bytes:
-    if img.mode != "1":
-        raise ValueError("Image must be 1-bit")
-    width, height = img.size
-    row_bytes = math.ceil(width / 8)
-    pixels = img.load()
-    data = bytearray()
-    for row in range(height):
-        byte = 0
-        bit_count = 0
-        for col in range(width):
-            # Set bit for white pixel; 0-bit prints black on many EPL devices
-            if pixels[col, row] == 255:
-                byte |= 1 << (7 - (bit_count % 8))
-            bit_count += 1
-            if bit_count % 8 == 0:
-                data.append(byte)
-                byte = 0
-        if bit_count % 8 != 0:
-            data.append(byte)
+    """Compose the ``N``/``D``/``S``/``q``/``Q`` job header."""
     target_height = label_height or height
     header_parts = ["N"]
     if darkness is not None:
@@ -42,6 +24,54 @@ def img_to_epl_gw(
         header_parts.append(f"Q{target_height}")
     else:
         header_parts.append(f"Q{target_height},{gap}")
-    header = ("\n".join(header_parts) + "\n").encode()
-    command = f"GW{x},{y},{row_bytes},{height},".encode()
-    return header + command + bytes(data) + b"\nP1\n"
+    return ("\n".join(header_parts) + "\n").encode()
+
+
+def iter_raster_to_epl_gw(
+    raster: PackedRaster,
+    x: int = 20,
+    y: int = 20,
+    gap: Optional[int] = 24,
+    label_height: Optional[int] = None,
+    darkness: Optional[int] = None,
+    speed: Optional[int] = None,
+    band_rows: int = 256,
+) -> Iterator[bytes]:
+    """Yield an EPL job as chunks: header and ``GW``, row bands, ``P1``."""
+    header = epl_header(raster.width, raster.height, gap, label_height, darkness, speed)
+    yield header + f"GW{x},{y},{raster.row_bytes},{raster.height},".encode()
+    step = band_rows * raster.row_bytes
+    for start in range(0, len(raster.data), step):
+        yield raster.data[start : start + step]
+    yield b"\nP1\n"
+
+
+def raster_to_epl_gw(
+    raster: PackedRaster,
+    x: int = 20,
+    y: int = 20,
+    gap: Optional[int] = 24,
+    label_height: Optional[int] = None,
+    darkness: Optional[int] = None,
+    speed: Optional[int] = None,
+) -> bytes:
+    """Wrap an already packed raster in an EPL header, ``GW`` and ``P1``."""
+    return b"".join(
+        iter_raster_to_epl_gw(raster, x, y, gap, label_height, darkness, speed)
+    )
+
+
+def img_to_epl_gw(
+    img: Image.Image,
+    x: int = 20,
+    y: int = 20,
+    gap: Optional[int] = 24,
+    label_height: Optional[int] = None,
+    darkness: Optional[int] = None,
+    speed: Optional[int] = None,
+) -> bytes:
+    if img.mode != "1":
+        raise ValueError("Image must be 1-bit")
+    # Set bit for white pixel; 0-bit prints black on many EPL devices
+    raster = PackedRaster.from_image(img)
+    return raster_to_epl_gw(raster, x, y, gap, label_height, darkness, speed)
@@ -0,0 +1,186 @@
+"""Query printer status over the same link jobs are sent on.
+
+ZPL printers answer ``~HS`` (host status) with paper-out, pause, head-open
+and buffer flags. EPL printers only report an error code (``^ee``). CUPS
+queues are asked with ``lpstat`` for the printer state and pending jobs.
+"""
+
+from dataclasses import asdict, dataclass, field
+import os
+import select
+import socket
+import subprocess
+import time
+from typing import Optional
+
+from ditherbooth.printer.cups import printer_lock
+
+STX, ETX = b"\x02", b"\x03"
+
+
+@dataclass
+class PrinterStatus:
+    """Printer condition; ``None`` fields are not reported by the link."""
+
+    online: bool
+    source: str
+    paper_out: Optional[bool] = None
+    head_open: Optional[bool] = None
+    paused: Optional[bool] = None
+    buffer_full: Optional[bool] = None
+    # Jobs received but not yet printed (ZPL formats, or queued CUPS jobs).
+    pending_jobs: Optional[int] = None
+    error: Optional[str] = None
+    checked_at: float = field(default_factory=time.time)
+
+    @property
+    def blocking(self) -> list:
+        """Reported conditions under which sending more jobs is pointless."""
+        names = ("paper_out", "head_open", "paused", "buffer_full")
+        return [name for name in names if getattr(self, name)]
+
+    @property
+    def problems(self) -> list:
+        found = self.blocking
+        if not self.online:
+            found.insert(0, "offline")
+        if self.error:
+            found.append(self.error)
+        return found
+
+    @property
+    def ready(self) -> bool:
+        return not self.problems
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "ready": self.ready, "problems": self.problems}
+
+
+def parse_host_status(data: bytes) -> PrinterStatus:
+    """Parse a ZPL ``~HS`` reply: three STX…ETX framed, comma-separated strings."""
+    frames = [f.strip(STX + b"\r\n") for f in data.split(ETX) if f.strip(b"\r\n")]
+    if len(frames) < 2:
+        raise ValueError("Incomplete ~HS reply")
+    first = frames[0].decode("ascii", "replace").split(",")
+    second = frames[1].decode("ascii", "replace").split(",")
+    if len(first) < 6 or len(second) < 3:
+        raise ValueError("Malformed ~HS reply")
+    # String 1: comm settings, paper out, pause, label length, formats in
+    # buffer, buffer full, ...; string 2: function settings, unused, head up.
+    return PrinterStatus(
+        online=True,
+        source="zpl",
+        paper_out=first[1].strip() == "1",
+        paused=first[2].strip() == "1",
+        pending_jobs=int(first[4]),
+        buffer_full=first[5].strip() == "1",
+        head_open=second[2].strip() == "1",
+    )
+
+
+def parse_epl_error(data: bytes) -> PrinterStatus:
+    """Parse an EPL ``^ee`` reply: a two-digit error code, ``00`` for none."""
+    code = data.decode("ascii", "replace").strip()[:2]
+    if not code.isdigit():
+        raise ValueError("Malformed ^ee reply")
+    return PrinterStatus(
+        online=True, source="epl", error=None if code == "00" else f"error {code}"
+    )
+
+
+def parse_lpstat(printer_out: str, jobs_out: str) -> PrinterStatus:
+    """Combine ``lpstat -p <queue>`` and ``lpstat -o <queue>`` output."""
+    disabled = "disabled" in printer_out
+    reason = None
+    if disabled:
+        # The reason, if any, is on the indented line below.
+        lines = [l.strip() for l in printer_out.splitlines()[1:] if l.strip()]
+        reason = lines[0] if lines else None
+    return PrinterStatus(
+        online=bool(printer_out.strip()) and not disabled,
+        source="cups",
+        paused=disabled,
+        pending_jobs=len([l for l in jobs_out.splitlines() if l.strip()]),
+        error=reason,
+    )
+
+
+def _complete(reply: bytes, lang: str) -> bool:
+    return reply.count(ETX) >= 3 if lang == "ZPL" else reply.endswith(b"\n")
+
+
+def _exchange_tcp(address: str, query: bytes, lang: str, timeout: float) -> bytes:
+    host, _, port = address.rpartition(":")
+    reply = b""
+    with socket.create_connection((host, int(port or 9100)), timeout=timeout) as sock:
+        sock.sendall(query)
+        while not _complete(reply, lang):
+            chunk = sock.recv(1024)
+            if not chunk:
+                break
+            reply += chunk
+    return reply
+
+
+def _exchange_device(path: str, query: bytes, lang: str, timeout: float) -> bytes:
+    fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+    reply = b""
+    try:
+        os.write(fd, query)
+        deadline = time.monotonic() + timeout
+        while not _complete(reply, lang):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                break
+            chunk = os.read(fd, 1024)
+            if not chunk:
+                break
+            reply += chunk
+    finally:
+        os.close(fd)
+    return reply
+
+
+def _query_cups(printer_name: str, timeout: float) -> PrinterStatus:
+    printer = subprocess.run(
+        ["lpstat", "-p", printer_name], capture_output=True, text=True, timeout=timeout
+    )
+    jobs = subprocess.run(
+        ["lpstat", "-o", printer_name], capture_output=True, text=True, timeout=timeout
+    )
+    return parse_lpstat(printer.stdout, jobs.stdout)
+
+
+def query_status(printer_name: str, lang: str, timeout: float = 2.0) -> PrinterStatus:
+    """Ask the printer (or its CUPS queue) how it is doing.
+
+    Never raises: an unreachable or silent printer is reported offline with
+    the reason in ``error``. A printer that a job is being sent to is not
+    asked (the query would land in the job's data); it is reported online,
+    with nothing else known.
+    """
+    try:
+        if printer_name.startswith(("/dev/", "tcp://")):
+            query = b"~HS" if lang == "ZPL" else b"\n^ee\n"
+            lock = printer_lock(printer_name)
+            if not lock.acquire(blocking=False):
+                return PrinterStatus(online=True, source=lang.lower())
+            try:
+                if printer_name.startswith("tcp://"):
+                    reply = _exchange_tcp(
+                        printer_name[len("tcp://") :], query, lang, timeout
+                    )
+                else:
+                    reply = _exchange_device(printer_name, query, lang, timeout)
+            finally:
+                lock.release()
+            if not reply:
+                return PrinterStatus(
+                    online=False, source=lang.lower(), error="no status reply"
+                )
+            return parse_host_status(reply) if lang == "ZPL" else parse_epl_error(reply)
+        return _query_cups(printer_name, timeout)
+    except (OSError, ValueError, subprocess.SubprocessError) as exc:
+        return PrinterStatus(
+            online=False, source="unavailable", error=str(exc) or type(exc).__name__
+        )
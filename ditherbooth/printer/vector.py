@@ -0,0 +1,342 @@
+"""Encode designer canvases with printer-native EPL/ZPL commands.
+
+Text, boxes, straight lines and barcodes become resident-font, line and
+barcode commands, so a typical text label is a few hundred bytes instead of a
+full-width ``GW``/``^GF`` graphic. Objects the printer cannot draw itself
+(images, rotated shapes, white ink) are rendered with :func:`render_canvas`
+and sent as a single graphic cropped to its ink.
+
+Barcodes are text objects with a ``barcode`` property (``"code128"`` or
+``"qr"``) whose text is the encoded data; ``barcodeModule`` optionally sets
+the narrow bar width (Code 128) or magnification (QR) in dots.
+"""
+
+import math
+from typing import Iterator, Optional
+
+from PIL import ImageChops
+
+from ditherbooth.imaging.barcode import qr_magnification
+from ditherbooth.imaging.raster import PackedRaster
+from ditherbooth.imaging.render import (
+    PLACEHOLDER,
+    content_height,
+    is_visible,
+    line_height,
+    merge_text,
+    object_bounds,
+    object_box,
+    parse_color,
+    render_canvas,
+)
+from ditherbooth.printer.epl import epl_header
+from ditherbooth.printer.zpl import zpl_graphic_field
+
+BARCODE_TYPES = ("code128", "qr")
+_TEXT_TYPES = ("i-text", "text", "textbox")
+
+# EPL resident fonts 1-4 at 203 dpi: (cell width, cell height) in dots.
+EPL_FONTS = {1: (8, 12), 2: (10, 16), 3: (12, 20), 4: (14, 24)}
+EPL_MAX_MULT = 6
+
+
+class NativeUnsupported(ValueError):
+    """The canvas cannot be expressed with native printer commands."""
+
+
+def has_barcodes(canvas_json: dict) -> bool:
+    objects = canvas_json.get("objects") if isinstance(canvas_json, dict) else None
+    return any(isinstance(o, dict) and o.get("barcode") for o in objects or [])
+
+
+def _scale(obj: dict) -> tuple[float, float]:
+    return abs(float(obj.get("scaleX", 1) or 1)), abs(float(obj.get("scaleY", 1) or 1))
+
+
+def _stroke_ink(obj: dict) -> Optional[int]:
+    return (
+        parse_color(obj.get("stroke"))
+        if float(obj.get("strokeWidth") or 0) > 0
+        else None
+    )
+
+
+def _native_kind(obj: dict, lang: str) -> Optional[str]:
+    """Which native command draws ``obj``; ``None`` to rasterize it."""
+    kind = obj.get("type")
+    angle = float(obj.get("angle") or 0) % 360
+    if obj.get("barcode"):
+        if kind not in _TEXT_TYPES or obj["barcode"] not in BARCODE_TYPES:
+            raise NativeUnsupported(f"Unknown barcode type: {obj['barcode']}")
+        if angle:
+            raise NativeUnsupported("Rotated barcodes are not supported")
+        if obj["barcode"] == "qr" and lang != "ZPL":
+            raise NativeUnsupported("QR codes need ZPL")
+        return "barcode"
+    if angle or obj.get("flipX") or obj.get("flipY"):
+        return None
+    if kind in _TEXT_TYPES:
+        return "text" if parse_color(obj.get("fill", "#000000")) == 0 else None
+    fill, stroke = parse_color(obj.get("fill")), _stroke_ink(obj)
+    # The printer only adds black; white ink has to knock out a raster.
+    if 255 in (fill, stroke) or (fill is None and stroke is None):
+        return None
+    if kind == "rect":
+        return "box" if lang == "ZPL" or not obj.get("rx") else None
+    if kind == "line":
+        straight = obj.get("x1") == obj.get("x2") or obj.get("y1") == obj.get("y2")
+        return "line" if straight and stroke is not None else None
+    if kind in ("circle", "ellipse") and lang == "ZPL":
+        return "ellipse"
+    return None
+
+
+def _dots(value: float) -> int:
+    return max(0, int(round(value)))
+
+
+def _epl_font(size: float) -> tuple[int, int]:
+    """Resident font and multiplier whose cell height is closest to ``size``."""
+    return min(
+        ((font, mult) for font in EPL_FONTS for mult in range(1, EPL_MAX_MULT + 1)),
+        key=lambda fm: (abs(EPL_FONTS[fm[0]][1] * fm[1] - size), fm[1]),
+    )
+
+
+def _epl_quote(text: str) -> str:
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _zpl_field(text: str) -> str:
+    # ^FH makes "_" the hex escape, so the command characters can be sent.
+    escaped = text.replace("_", "_5F").replace("^", "_5E").replace("~", "_7E")
+    return f"^FH^FD{escaped}^FS"
+
+
+def _line_ink(obj: dict) -> tuple[float, float, float, float]:
+    """Ink rectangle of a horizontal or vertical line (its box minus the caps)."""
+    x, y, w, h = object_box(obj)
+    sx, sy = _scale(obj)
+    sw = float(obj.get("strokeWidth") or 0)
+    if obj.get("y1") == obj.get("y2"):
+        return x + sw * sx / 2, y, w - sw * sx, h
+    return x, y + sw * sy / 2, w, h - sw * sy
+
+
+def _epl_commands(obj: dict, kind: str, ox: int, oy: int) -> Iterator[str]:
+    x, y, w, h = object_box(obj)
+    x, y = x + ox, y + oy
+    sx, sy = _scale(obj)
+    if kind == "text":
+        font, vmult = _epl_font(float(obj.get("fontSize") or 40) * sy)
+        hmult = min(EPL_MAX_MULT, max(1, round(vmult * sx / sy)))
+        advance = EPL_FONTS[font][0] * hmult
+        align = obj.get("textAlign", "left")
+        step = line_height(obj)
+        for i, line in enumerate(str(obj.get("text", "")).split("\n")):
+            slack = w - advance * len(line)
+            lx = x + {"center": slack / 2, "right": slack}.get(align, 0)
+            yield f"A{_dots(lx)},{_dots(y + i * step)},0,{font},{hmult},{vmult},N,{_epl_quote(line)}"
+    elif kind == "barcode":
+        module = int(obj.get("barcodeModule") or 2)
+        data = str(obj.get("text", "")).replace("\n", "")
+        yield f"B{_dots(x)},{_dots(y)},0,1,{module},{module},{max(1, _dots(h))},N,{_epl_quote(data)}"
+    elif kind == "line":
+        lx, ly, lw, lh = _line_ink(obj)
+        yield f"LO{_dots(lx + ox)},{_dots(ly + oy)},{max(1, _dots(lw))},{max(1, _dots(lh))}"
+    elif kind == "box":
+        if parse_color(obj.get("fill")) == 0:
+            yield f"LO{_dots(x)},{_dots(y)},{max(1, _dots(w))},{max(1, _dots(h))}"
+        else:
+            t = max(1, _dots(float(obj.get("strokeWidth") or 0) * min(sx, sy)))
+            yield f"X{_dots(x)},{_dots(y)},{t},{_dots(x + w)},{_dots(y + h)}"
+
+
+def _zpl_commands(obj: dict, kind: str, ox: int, oy: int) -> Iterator[str]:
+    x, y, w, h = object_box(obj)
+    x, y = x + ox, y + oy
+    sx, sy = _scale(obj)
+    if kind == "text":
+        height = max(1, _dots(float(obj.get("fontSize") or 40) * sy))
+        width = max(1, _dots(height * sx / sy))
+        align = {"center": "C", "right": "R"}.get(obj.get("textAlign", "left"))
+        block = f"^FB{max(1, _dots(w))},1,0,{align}" if align else ""
+        step = line_height(obj)
+        for i, line in enumerate(str(obj.get("text", "")).split("\n")):
+            yield f"^FO{_dots(x)},{_dots(y + i * step)}{block}^A0N,{height},{width}{_zpl_field(line)}"
+    elif kind == "barcode":
+        data = str(obj.get("text", "")).replace("\n", "")
+        if obj["barcode"] == "qr":
+            mag = qr_magnification(w, h, obj.get("barcodeModule"))
+            yield f"^FO{_dots(x)},{_dots(y)}^BQN,2,{mag}{_zpl_field('QA,' + data)}"
+        else:
+            module = int(obj.get("barcodeModule") or 2)
+            yield f"^FO{_dots(x)},{_dots(y)}^BY{module}^BCN,{max(1, _dots(h))},N,N,N{_zpl_field(data)}"
+    elif kind == "line":
+        lx, ly, lw, lh = _line_ink(obj)
+        lw, lh = max(1, _dots(lw)), max(1, _dots(lh))
+        yield f"^FO{_dots(lx + ox)},{_dots(ly + oy)}^GB{lw},{lh},{min(lw, lh)},B,0^FS"
+    elif kind in ("box", "ellipse"):
+        bw, bh = max(1, _dots(w)), max(1, _dots(h))
+        if parse_color(obj.get("fill")) == 0:
+            t = min(bw, bh) if kind == "box" else math.ceil(min(bw, bh) / 2)
+        else:
+            t = max(1, _dots(float(obj.get("strokeWidth") or 0) * min(sx, sy)))
+        if kind == "ellipse":
+            yield f"^FO{_dots(x)},{_dots(y)}^GE{bw},{bh},{t},B^FS"
+        else:
+            # Corner rounding is 0-8, in eighths of half the shorter side.
+            rx = float(obj.get("rx") or 0) * min(sx, sy)
+            rounding = min(8, round(16 * rx / min(bw, bh)))
+            yield f"^FO{_dots(x)},{_dots(y)}^GB{bw},{bh},{t},B,{rounding}^FS"
+
+
+def _overlaps(a: tuple, b: tuple) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+class NativeLabel:
+    """A canvas split into native printer commands and one raster graphic.
+
+    The graphic (everything the printer cannot draw itself) is rendered once
+    when the label is built. :meth:`to_epl` / :meth:`to_zpl` then only format
+    commands, optionally filling ``{{column}}`` placeholders from a data row,
+    so a mail merge re-encodes text without touching pixels.
+
+    Raises :class:`NativeUnsupported` when the native output would differ
+    from the rendered label: a black background, or a rasterized object
+    covering a native one beneath it (the printer can only add black).
+    """
+
+    def __init__(
+        self,
+        canvas_json: dict,
+        lang: str,
+        width: int,
+        height: Optional[int] = None,
+        max_height: Optional[int] = None,
+    ):
+        if not isinstance(canvas_json, dict):
+            raise ValueError("canvas_json must be an object")
+        if parse_color(canvas_json.get("background")) == 0:
+            raise NativeUnsupported("Dark backgrounds need a raster")
+        self.lang = lang
+        self.width = width
+        self.height = height or content_height(canvas_json)
+        if not height and max_height and self.height > max_height:
+            raise ValueError("Rendered label is taller than the maximum height")
+        self.objects: list = []
+        raster_objects: list = []
+        native_bounds: list = []
+        for obj in canvas_json.get("objects") or []:
+            if not is_visible(obj):
+                continue
+            kind = _native_kind(obj, lang)
+            bounds = object_bounds(obj)
+            if kind is None:
+                if obj.get("type") in _TEXT_TYPES and PLACEHOLDER.search(
+                    str(obj.get("text", ""))
+                ):
+                    raise NativeUnsupported(
+                        "Placeholders are only supported in plain text"
+                    )
+                if any(_overlaps(bounds, b) for b in native_bounds):
+                    raise NativeUnsupported("A rasterized object covers native content")
+                raster_objects.append(obj)
+                continue
+            if kind == "text" and PLACEHOLDER.search(str(obj.get("text", ""))):
+                # Filled text can grow to the right edge of the label.
+                bounds = (bounds[0], bounds[1], width, bounds[3])
+            native_bounds.append(bounds)
+            self.objects.append((obj, kind))
+        self.graphic: Optional[tuple[int, int, PackedRaster]] = None
+        if raster_objects:
+            img = render_canvas({"objects": raster_objects}, width, self.height)
+            bbox = ImageChops.invert(img).getbbox()
+            if bbox:
+                self.graphic = (
+                    bbox[0],
+                    bbox[1],
+                    PackedRaster.from_image(img.crop(bbox)),
+                )
+
+    @property
+    def fields(self) -> list:
+        names = []
+        for obj, _ in self.objects:
+            for name in PLACEHOLDER.findall(str(obj.get("text", ""))):
+                if name not in names:
+                    names.append(name)
+        return names
+
+    def _objects(self, row: Optional[dict]) -> Iterator[tuple[dict, str]]:
+        for obj, kind in self.objects:
+            yield (
+                (merge_text(obj, row), kind)
+                if row is not None and kind != "box"
+                else (obj, kind)
+            )
+
+    def to_epl(
+        self,
+        row: Optional[dict] = None,
+        x: int = 20,
+        y: int = 20,
+        gap: Optional[int] = 24,
+        label_height: Optional[int] = None,
+        darkness: Optional[int] = None,
+        speed: Optional[int] = None,
+    ) -> bytes:
+        parts = [
+            epl_header(self.width, self.height, gap, label_height, darkness, speed)
+        ]
+        if self.graphic is not None:
+            gx, gy, raster = self.graphic
+            parts.append(
+                f"GW{x + gx},{y + gy},{raster.row_bytes},{raster.height},".encode()
+            )
+            parts.append(raster.data + b"\n")
+        for obj, kind in self._objects(row):
+            for command in _epl_commands(obj, kind, x, y):
+                parts.append(command.encode("latin-1", "replace") + b"\n")
+        parts.append(b"P1\n")
+        return b"".join(parts)
+
+    def to_zpl(self, row: Optional[dict] = None, x: int = 20, y: int = 20) -> bytes:
+        parts = [b"^XA^CI28"]
+        if self.graphic is not None:
+            gx, gy, raster = self.graphic
+            parts.append(
+                zpl_graphic_field(raster, x + gx, y + gy) + raster.hex + b"^FS"
+            )
+        for obj, kind in self._objects(row):
+            for command in _zpl_commands(obj, kind, x, y):
+                parts.append(command.encode())
+        parts.append(b"^XZ")
+        return b"".join(parts)
+
+
+def canvas_to_epl(
+    canvas_json: dict,
+    width: int,
+    height: Optional[int] = None,
+    x: int = 20,
+    y: int = 20,
+    gap: Optional[int] = 24,
+    label_height: Optional[int] = None,
+    darkness: Optional[int] = None,
+    speed: Optional[int] = None,
+) -> bytes:
+    return NativeLabel(canvas_json, "EPL", width, height).to_epl(
+        None, x, y, gap, label_height, darkness, speed
+    )
+
+
+def canvas_to_zpl(
+    canvas_json: dict,
+    width: int,
+    height: Optional[int] = None,
+    x: int = 20,
+    y: int = 20,
+) -> bytes:
+    return NativeLabel(canvas_json, "ZPL", width, height).to_zpl(None, x, y)
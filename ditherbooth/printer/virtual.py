@@ -0,0 +1,639 @@
+"""A virtual label printer, to stand in for a real one without the hardware.
+
+It listens on a TCP port (as a ``tcp://host:port`` printer) or on a
+pseudo-terminal (a ``/dev/pts/N`` device path, like a serial printer). It
+parses the EPL and ZPL jobs it receives, checks them, decodes their graphics
+back into label images, and answers ``~HS`` and ``^ee`` status queries.
+
+Receiving is throttled to the link bandwidth, and each label takes as long
+to print as the speed model in :mod:`ditherbooth.jobs` says for its length
+and speed setting, so queueing and throughput behave as with a real printer.
+``time_scale`` speeds the clock up (or down) for tests.
+
+Usage: python -m ditherbooth.printer.virtual [--port N | --pty] [--out DIR]
+"""
+
+import argparse
+from dataclasses import dataclass, field
+import os
+import queue
+import re
+import select
+import socket
+import socketserver
+import threading
+import time
+import tty
+from pathlib import Path
+from typing import Callable, Optional
+
+from PIL import Image
+
+from ditherbooth.jobs import (
+    DEFAULT_IPS,
+    DPI,
+    EPL_SPEED_IPS,
+    LABEL_OVERHEAD_S,
+    LINK_BYTES_PER_S,
+)
+
+# 4.09" print head of the LP2844 / GK420 family.
+HEAD_DOTS = 832
+# Labels the printer holds before it stops reading, as its receive buffer fills.
+BUFFER_LABELS = 8
+# ZPL ^PR speed letters, in inches per second.
+ZPL_SPEED_LETTERS = {"A": 2, "B": 3, "C": 4, "D": 6, "E": 8}
+
+_EPL_GW = re.compile(rb"GW(\d+),(\d+),(\d+),(\d+),")
+_EPL_GW_PARTIAL = re.compile(rb"G(W[\d,]*)?")
+_ZPL_NO_ARGS = {b"^XA", b"^XZ", b"^FS", b"~HS"}
+
+
+class PayloadError(ValueError):
+    """A job the printer could not make sense of; it is discarded."""
+
+
+@dataclass
+class Label:
+    """One printed label (all of its copies)."""
+
+    lang: str
+    image: Image.Image
+    # Printed length in dots: the label length or the content, if longer.
+    rows: int
+    copies: int = 1
+    ips: float = DEFAULT_IPS
+    darkness: Optional[int] = None
+    # Commands not rendered here: text, barcodes and lines the printer draws
+    # itself, and settings the model ignores.
+    native: list = field(default_factory=list)
+    warnings: list = field(default_factory=list)
+
+    @property
+    def print_seconds(self) -> float:
+        return self.copies * (LABEL_OVERHEAD_S + self.rows / (DPI * self.ips))
+
+
+def _graphic(width_bytes: int, rows: int, data: bytes) -> Image.Image:
+    # Set bits are white, as the encoders pack them.
+    return Image.frombytes("1", (width_bytes * 8, rows), data)
+
+
+def _compose(
+    graphics: list,
+    width: Optional[int],
+    length: Optional[int],
+    head_dots: int,
+    warnings: list,
+) -> tuple:
+    """Paste the graphics onto the label; returns (image, printed rows)."""
+    width = min(width or max([x + g.width for x, _, g in graphics] + [1]), head_dots)
+    bottom = max([y + g.height for _, y, g in graphics] + [0])
+    rows = max(length or 0, bottom, 1)
+    image = Image.new("1", (width, rows), 1)
+    for x, y, g in graphics:
+        if x + g.width > width:
+            warnings.append(
+                f"graphic at x={x} is {x + g.width - width} dots wider than the label and was clipped"
+            )
+        image.paste(g, (x, y))
+    return image, rows
+
+
+class EplParser:
+    """Incremental EPL parser: lines, with ``GW`` binary data inline."""
+
+    lang = "EPL"
+
+    def __init__(self, head_dots: int = HEAD_DOTS):
+        self.head_dots = head_dots
+        self.buf = bytearray()
+        self.width: Optional[int] = None
+        self.length: Optional[int] = None
+        self.speed: Optional[int] = None
+        self.darkness: Optional[int] = None
+        self._clear()
+
+    def _clear(self) -> None:
+        self.graphics: list = []
+        self.native: list = []
+        self.started = False
+
+    def idle(self) -> bool:
+        return not self.buf and not self.started
+
+    def feed(self, data: bytes) -> list:
+        """Parse what has arrived; returns finished labels and status replies."""
+        self.buf += data
+        out = []
+        while self.buf:
+            if self.buf.startswith(b"GW") or self.buf == b"G":
+                match = _EPL_GW.match(self.buf)
+                if match is None:
+                    if not _EPL_GW_PARTIAL.fullmatch(self.buf):
+                        self.buf.clear()
+                        raise PayloadError("malformed GW command")
+                    break
+                x, y, width_bytes, rows = (int(v) for v in match.groups())
+                end = match.end() + width_bytes * rows
+                if len(self.buf) < end:
+                    break
+                self.graphics.append(
+                    (
+                        x,
+                        y,
+                        _graphic(width_bytes, rows, bytes(self.buf[match.end() : end])),
+                    )
+                )
+                self.started = True
+                del self.buf[:end]
+                continue
+            newline = self.buf.find(b"\n")
+            if newline < 0:
+                break
+            line = bytes(self.buf[:newline]).strip(b"\r").decode("latin-1")
+            del self.buf[: newline + 1]
+            item = self._command(line)
+            if item is not None:
+                out.append(item)
+        return out
+
+    def _command(self, line: str):
+        if not line:
+            return None
+        if line == "^ee":
+            return b"00\r\n"
+        self.started = True
+        op, args = line[:1], line[1:]
+        try:
+            if op == "N":
+                self._clear()
+                self.started = True
+            elif op == "D" and args.isdigit():
+                self.darkness = int(args)
+                if not 0 <= self.darkness <= 15:
+                    raise PayloadError(f"darkness D{args} out of range 0-15")
+            elif op == "S" and args.isdigit():
+                self.speed = int(args)
+                if self.speed not in EPL_SPEED_IPS:
+                    raise PayloadError(f"unsupported speed S{args}")
+            elif op == "q":
+                self.width = int(args)
+            elif op == "Q":
+                self.length = int(args.split(",")[0])
+            elif op == "P":
+                return self._label(int(args.split(",")[0] or 1))
+            else:
+                self.native.append(line)
+        except ValueError as exc:
+            if isinstance(exc, PayloadError):
+                raise
+            raise PayloadError(f"malformed command {line!r}") from None
+        return None
+
+    def _label(self, copies: int) -> Label:
+        warnings: list = []
+        image, rows = _compose(
+            self.graphics, self.width, self.length, self.head_dots, warnings
+        )
+        label = Label(
+            "EPL",
+            image,
+            rows,
+            copies,
+            EPL_SPEED_IPS.get(self.speed, DEFAULT_IPS),
+            self.darkness,
+            self.native,
+            warnings,
+        )
+        self._clear()
+        return label
+
+
+class ZplParser:
+    """Incremental ZPL parser: ``^``/``~`` commands, ``^XA`` to ``^XZ``."""
+
+    lang = "ZPL"
+
+    def __init__(self, head_dots: int = HEAD_DOTS):
+        self.head_dots = head_dots
+        self.buf = bytearray()
+        # How far the unfinished command in ``buf`` has been searched for its end.
+        self._scanned = 1
+        self.in_format = False
+        self._clear()
+
+    def _clear(self) -> None:
+        self.origin = (0, 0)
+        self.graphics: list = []
+        self.native: list = []
+        self.width: Optional[int] = None
+        self.length: Optional[int] = None
+        self.copies = 1
+        self.ips = float(DEFAULT_IPS)
+
+    def idle(self) -> bool:
+        return not self.buf.strip() and not self.in_format
+
+    def feed(self, data: bytes) -> list:
+        self.buf += data
+        out = []
+        while True:
+            start = min(
+                [i for i in (self.buf.find(b"^"), self.buf.find(b"~")) if i >= 0],
+                default=-1,
+            )
+            if start < 0:
+                # Only whitespace (or junk) outside commands.
+                self.buf.clear()
+                break
+            del self.buf[:start]
+            if len(self.buf) < 3:
+                break
+            if bytes(self.buf[:3]) in _ZPL_NO_ARGS:
+                end = 3
+            else:
+                # Parameters run to the next command.
+                ends = [
+                    i
+                    for i in (
+                        self.buf.find(b"^", self._scanned),
+                        self.buf.find(b"~", self._scanned),
+                    )
+                    if i >= 0
+                ]
+                if not ends:
+                    self._scanned = len(self.buf)
+                    break
+                end = min(ends)
+            self._scanned = 1
+            token = bytes(self.buf[:end]).decode("latin-1")
+            del self.buf[:end]
+            item = self._command(token[:3].upper(), token[3:])
+            if item is not None:
+                out.append(item)
+        return out
+
+    def _command(self, cmd: str, args: str):
+        if cmd == "~HS":
+            return "status"
+        if cmd.startswith("~"):
+            # Other control commands (calibration, cancel) are not modelled.
+            return None
+        if cmd == "^XA":
+            self._clear()
+            self.in_format = True
+            return None
+        if not self.in_format:
+            raise PayloadError(f"{cmd} outside ^XA…^XZ")
+        try:
+            if cmd == "^XZ":
+                self.in_format = False
+                return self._label()
+            if cmd == "^FO":
+                x, y = (args.split(",") + ["0"])[:2]
+                self.origin = (int(x or 0), int(y or 0))
+            elif cmd == "^GF":
+                self._graphic_field(args)
+            elif cmd == "^PW":
+                self.width = int(args)
+            elif cmd == "^LL":
+                self.length = int(args.split(",")[0])
+            elif cmd == "^PQ":
+                self.copies = int(args.split(",")[0] or 1)
+            elif cmd == "^PR":
+                speed = args.split(",")[0].strip().upper()
+                self.ips = float(ZPL_SPEED_LETTERS.get(speed) or int(speed))
+            elif cmd in ("^FS", "^CI", "^FH", "^MD", "^LH"):
+                pass
+            else:
+                self.native.append(cmd + args)
+        except ValueError as exc:
+            if isinstance(exc, PayloadError):
+                raise
+            raise PayloadError(f"malformed command {cmd}{args[:20]}") from None
+        return None
+
+    def _graphic_field(self, args: str) -> None:
+        fmt, total, field_bytes, row_bytes, data = args.split(",", 4)
+        if fmt.upper() != "A":
+            raise PayloadError(f"^GF format {fmt} not supported (only A, hex)")
+        total, field_bytes, row_bytes = int(total), int(field_bytes), int(row_bytes)
+        hex_data = "".join(data.split())
+        if total != field_bytes or row_bytes <= 0 or total % row_bytes:
+            raise PayloadError(
+                f"^GF sizes inconsistent: {total},{field_bytes},{row_bytes}"
+            )
+        if len(hex_data) != 2 * total:
+            raise PayloadError(
+                f"^GF has {len(hex_data) // 2} data bytes, not {total} (compressed data is not supported)"
+            )
+        try:
+            raw = bytes.fromhex(hex_data)
+        except ValueError:
+            raise PayloadError("^GF data is not hex") from None
+        self.graphics.append(
+            (*self.origin, _graphic(row_bytes, total // row_bytes, raw))
+        )
+
+    def _label(self) -> Label:
+        warnings: list = []
+        image, rows = _compose(
+            self.graphics, self.width, self.length, self.head_dots, warnings
+        )
+        return Label(
+            "ZPL", image, rows, self.copies, self.ips, None, self.native, warnings
+        )
+
+
+def detect_lang(data: bytes) -> Optional[str]:
+    """Which language a connection speaks, from its first bytes."""
+    start = data.lstrip()
+    if not start:
+        return None
+    if start.startswith(b"^ee") or start[:1] not in (b"^", b"~"):
+        return "EPL"
+    return "ZPL"
+
+
+class _Session:
+    """Parser state for one connection (or the pty, across jobs)."""
+
+    def __init__(self, head_dots: int):
+        self.head_dots = head_dots
+        self.parser = None
+
+    def feed(self, data: bytes) -> list:
+        if self.parser is None or self.parser.idle():
+            lang = detect_lang(data)
+            if lang is None:
+                return []
+            if self.parser is None or self.parser.lang != lang:
+                self.parser = (EplParser if lang == "EPL" else ZplParser)(
+                    self.head_dots
+                )
+        return self.parser.feed(data)
+
+
+class VirtualPrinter:
+    """The printer: receives jobs, holds up to ``buffer_labels`` and prints them in order.
+
+    Printed labels are kept in :attr:`labels` (and saved as PNGs to
+    ``out_dir``, if given); rejected jobs are reported in :attr:`errors`.
+    """
+
+    def __init__(
+        self,
+        out_dir=None,
+        link_bytes_per_s: float = LINK_BYTES_PER_S,
+        time_scale: float = 1.0,
+        buffer_labels: int = BUFFER_LABELS,
+        head_dots: int = HEAD_DOTS,
+        on_label: Optional[Callable[[Label], None]] = None,
+    ):
+        self.out_dir = Path(out_dir) if out_dir else None
+        self.link_bytes_per_s = link_bytes_per_s
+        self.time_scale = time_scale
+        self.head_dots = head_dots
+        self.on_label = on_label
+        self.labels: list = []
+        self.errors: list = []
+        self.bytes_received = 0
+        self._queue: "queue.Queue[Optional[Label]]" = queue.Queue(maxsize=buffer_labels)
+        self._printing = 0
+        self._first_byte: Optional[float] = None
+        self._last_label: Optional[float] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: list = []
+        self._server: Optional[socketserver.TCPServer] = None
+        self._pty: Optional[tuple] = None
+        self._engine = threading.Thread(
+            target=self._print_loop, name="virtual-printer", daemon=True
+        )
+        self._engine.start()
+        if self.out_dir:
+            self.out_dir.mkdir(parents=True, exist_ok=True)
+
+    # ---- Receiving ----
+
+    def receive(self, session: _Session, data: bytes) -> list:
+        """Take bytes off the link; returns replies to send back."""
+        with self._lock:
+            if self._first_byte is None:
+                self._first_byte = time.monotonic()
+            self.bytes_received += len(data)
+        if self.link_bytes_per_s:
+            time.sleep(len(data) / self.link_bytes_per_s * self.time_scale)
+        try:
+            items = session.feed(data)
+        except PayloadError as exc:
+            self.errors.append(str(exc))
+            session.parser = None
+            return []
+        replies = []
+        for item in items:
+            if isinstance(item, Label):
+                # Blocks while the buffer is full, which stops the link.
+                self._queue.put(item)
+            elif item == "status":
+                replies.append(self.host_status())
+            else:
+                replies.append(item)
+        return replies
+
+    def finish(self, session: _Session) -> None:
+        """The sender closed the connection; a job left open is an error."""
+        if session.parser is not None and not session.parser.idle():
+            self.errors.append(f"{session.parser.lang} job ended incomplete")
+
+    # ---- Printing ----
+
+    def _print_loop(self) -> None:
+        while True:
+            label = self._queue.get()
+            if label is None:
+                self._queue.task_done()
+                return
+            with self._lock:
+                self._printing = 1
+            time.sleep(label.print_seconds * self.time_scale)
+            with self._lock:
+                self.labels.append(label)
+                self._printing = 0
+                self._last_label = time.monotonic()
+                number = len(self.labels)
+            if self.out_dir:
+                label.image.save(self.out_dir / f"label-{number:04d}.png")
+            if self.on_label:
+                self.on_label(label)
+            self._queue.task_done()
+
+    def pending(self) -> int:
+        """Labels received but not printed yet."""
+        return self._queue.qsize() + self._printing
+
+    def host_status(self) -> bytes:
+        """A ZPL ``~HS`` reply (see :func:`ditherbooth.printer.status.parse_host_status`)."""
+        full = int(self._queue.full())
+        return (
+            f"\x02030,0,0,1245,{self.pending():03d},{full},0,0,000,0,0,0\x03\r\n"
+            "\x02000,0,0,0,0,0,0,0,00000000,1,000\x03\r\n"
+            "\x021234,0\x03\r\n"
+        ).encode()
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything received has printed."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stats(self) -> dict:
+        """Throughput so far, in printer time (real time over ``time_scale``)."""
+        copies = sum(label.copies for label in self.labels)
+        elapsed = 0.0
+        if self._first_byte is not None and self._last_label is not None:
+            elapsed = (self._last_label - self._first_byte) / self.time_scale
+        return {
+            "labels": copies,
+            "bytes": self.bytes_received,
+            "errors": len(self.errors),
+            "seconds": round(elapsed, 3),
+            "labels_per_minute": round(copies * 60 / elapsed, 1) if elapsed else None,
+        }
+
+    # ---- Links ----
+
+    def serve_tcp(self, host: str = "127.0.0.1", port: int = 9100) -> str:
+        """Listen for raw jobs like a network printer; returns its ``tcp://`` name."""
+        printer = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                session = _Session(printer.head_dots)
+                while True:
+                    data = self.request.recv(4096)
+                    if not data:
+                        break
+                    for reply in printer.receive(session, data):
+                        self.request.sendall(reply)
+                printer.finish(session)
+
+        # One connection at a time, like a printer's raw port: jobs are
+        # taken in the order they connect.
+        class Server(socketserver.TCPServer):
+            allow_reuse_address = True
+
+            def server_bind(self):
+                # A small receive buffer, so senders feel the link speed.
+                self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16 * 1024)
+                super().server_bind()
+
+        self._server = Server((host, port), Handler)
+        thread = threading.Thread(
+            target=self._server.serve_forever, name="virtual-printer-tcp", daemon=True
+        )
+        thread.start()
+        self._threads.append(thread)
+        bound_host, bound_port = self._server.server_address[:2]
+        return f"tcp://{bound_host}:{bound_port}"
+
+    def open_pty(self) -> str:
+        """Appear as a serial device; returns its ``/dev/pts/N`` path."""
+        master, slave = os.openpty()
+        # Raw mode: binary graphics must pass through untranslated.
+        tty.setraw(slave)
+        self._pty = (master, slave)
+        thread = threading.Thread(
+            target=self._pty_loop,
+            args=(master,),
+            name="virtual-printer-pty",
+            daemon=True,
+        )
+        thread.start()
+        self._threads.append(thread)
+        return os.ttyname(slave)
+
+    def _pty_loop(self, master: int) -> None:
+        session = _Session(self.head_dots)
+        while not self._stop.is_set():
+            if not select.select([master], [], [], 0.1)[0]:
+                continue
+            try:
+                data = os.read(master, 4096)
+            except OSError:
+                return
+            for reply in self.receive(session, data):
+                os.write(master, reply)
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for thread in self._threads:
+            thread.join(timeout=1)
+        if self._pty is not None:
+            for fd in self._pty:
+                os.close(fd)
+            self._pty = None
+        self._queue.put(None)
+        self._engine.join(timeout=1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument(
+        "--pty",
+        action="store_true",
+        help="appear as a /dev/pts serial device instead of TCP",
+    )
+    parser.add_argument("--out", help="save printed labels as PNGs here")
+    parser.add_argument(
+        "--link",
+        type=float,
+        default=LINK_BYTES_PER_S,
+        help="link speed in bytes/s (9600 baud: 960)",
+    )
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=1.0,
+        help="below 1 runs faster than a real printer",
+    )
+    parser.add_argument(
+        "--buffer",
+        type=int,
+        default=BUFFER_LABELS,
+        help="labels held before the link stalls",
+    )
+    args = parser.parse_args()
+
+    def report(label: Label) -> None:
+        line = f"{label.lang} {label.image.width}x{label.rows} dots x{label.copies}, {label.print_seconds:.2f} s"
+        print(line + "".join(f"; {w}" for w in label.warnings), flush=True)
+
+    printer = VirtualPrinter(
+        args.out, args.link, args.time_scale, args.buffer, on_label=report
+    )
+    name = printer.open_pty() if args.pty else printer.serve_tcp(args.host, args.port)
+    print(f"Virtual printer ready; set printer_name to {name}", flush=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        printer.close()
+        print(printer.stats())
+        for error in printer.errors:
+            print("rejected:", error)
+
+
+if __name__ == "__main__":
+    main()
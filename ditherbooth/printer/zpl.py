@@ -1,28 +1,42 @@
-import math
+from typing import Iterator
 from PIL import Image
 
+from ditherbooth.imaging.raster import PackedRaster
+
+
+def zpl_graphic_field(raster: PackedRaster, x: int = 20, y: int = 20) -> bytes:
+    """Compose the ``^FO…^GFA`` field prefix for a packed raster."""
+    total_bytes = len(raster.data)
+    return f"^FO{x},{y}^GFA,{total_bytes},{total_bytes},{raster.row_bytes},".encode()
+
+
+def zpl_header(raster: PackedRaster, x: int = 20, y: int = 20) -> bytes:
+    """Compose the ``^XA^FO…^GFA`` prefix for a packed raster."""
+    return b"^XA" + zpl_graphic_field(raster, x, y)
+
+
+def raster_to_zpl_gf(raster: PackedRaster, x: int = 20, y: int = 20) -> bytes:
+    """Wrap an already packed raster (hex cached on the raster) in ZPL."""
+    return zpl_header(raster, x, y) + raster.hex + b"^FS^XZ"
+
+
+def iter_raster_to_zpl_gf(
+    raster: PackedRaster, x: int = 20, y: int = 20, band_rows: int = 256
+) -> Iterator[bytes]:
+    """Yield a ZPL job as chunks, hex-encoding one band of rows at a time.
+
+    Unlike :func:`raster_to_zpl_gf` this never builds the full hex string, so
+    memory stays flat however tall the raster is.
+    """
+    yield zpl_header(raster, x, y)
+    step = band_rows * raster.row_bytes
+    for start in range(0, len(raster.data), step):
+        yield raster.data[start : start + step].hex().upper().encode()
+    yield b"^FS^XZ"
+
 
 def img_to_zpl_gf(img: Image.Image, x: int = 20, y: int = 20) -> bytes:
     if img.mode != "1":
         raise ValueError("Image must be 1-bit")
-    width, height = img.size
-    row_bytes = math.ceil(width / 8)
-    pixels = img.load()
-    data = bytearray()
-    for row in range(height):
-        byte = 0
-        bit_count = 0
-        for col in range(width):
-            # Set bit for white pixel; 0-bit prints black in ZPL GF data
-            if pixels[col, row] == 255:
-                byte |= 1 << (7 - (bit_count % 8))
-            bit_count += 1
-            if bit_count % 8 == 0:
-                data.append(byte)
-                byte = 0
-        if bit_count % 8 != 0:
-            data.append(byte)
-    total_bytes = len(data)
-    hexdata = data.hex().upper()
-    header = f"^XA^FO{x},{y}^GFA,{total_bytes},{total_bytes},{row_bytes},".encode()
-    return header + hexdata.encode() + b"^FS^XZ"
+    # Set bit for white pixel; 0-bit prints black in ZPL GF data
+    return raster_to_zpl_gf(PackedRaster.from_image(img), x, y)
@@ -0,0 +1,209 @@
+"""On-demand sampling profiler for the print and preview paths.
+
+While any of the next N profiled requests is in flight, a background thread
+samples the stacks of every thread at a fixed interval. That includes the
+threadpool workers running decoding, dithering and encoding, which a
+``cProfile`` started in the request's own thread would miss. Only stacks that
+pass through ditherbooth code are kept, so idle workers, the idle event loop
+and threads blocked in ``threading`` waits don't drown out the work.
+
+Results are exported as collapsed stacks (for ``flamegraph.pl`` and most
+flame graph viewers) or as a speedscope JSON profile.
+"""
+
+from collections import Counter
+import os
+import sys
+import threading
+import time
+from typing import Callable, Optional
+
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+_THREADING_FILE = os.path.abspath(threading.__file__)
+
+
+def _frame_label(name: str, filename: str, line: int) -> str:
+    # Paths as in an import: ditherbooth/app.py, PIL/Image.py, threading.py.
+    if filename.startswith(_PACKAGE_DIR):
+        filename = os.path.relpath(filename, os.path.dirname(_PACKAGE_DIR))
+    elif "site-packages" + os.sep in filename:
+        filename = filename.split("site-packages" + os.sep, 1)[1]
+    else:
+        filename = os.path.basename(filename)
+    return f"{name} ({filename}:{line})"
+
+
+class SamplingProfiler:
+    """Samples thread stacks every ``interval`` seconds during the next
+    ``requests`` profiled requests; see :class:`ProfileMiddleware`."""
+
+    def __init__(self, requests: int, interval: float = 0.005):
+        self.requests = requests
+        self.interval = interval
+        self.begun = 0
+        self.finished = 0
+        self.samples: Counter = Counter()
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+        self._active = 0
+        self._lock = threading.Lock()
+        self._busy = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def state(self) -> str:
+        if self._stop.is_set():
+            return "done"
+        return "running" if self.begun else "armed"
+
+    def begin(self) -> bool:
+        """A request starts; returns whether it is one of those profiled."""
+        with self._lock:
+            if self._stop.is_set() or self.begun >= self.requests:
+                return False
+            self.begun += 1
+            self._active += 1
+            if self._thread is None:
+                self.started_at = time.time()
+                self._thread = threading.Thread(
+                    target=self._run, name="profiler", daemon=True
+                )
+                self._thread.start()
+            self._busy.set()
+        return True
+
+    def end(self) -> None:
+        with self._lock:
+            self._active -= 1
+            self.finished += 1
+            if not self._active:
+                self._busy.clear()
+            if self.finished >= self.requests:
+                self._finish()
+
+    def stop(self) -> None:
+        """Stop sampling early; what was captured is kept."""
+        with self._lock:
+            self._finish()
+
+    def _finish(self) -> None:
+        if not self._stop.is_set():
+            self.stopped_at = time.time()
+            self._stop.set()
+            self._busy.set()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.is_set():
+            if not self._busy.wait(0.1):
+                continue
+            self._sample(own)
+            self._stop.wait(self.interval)
+
+    def _sample(self, own: int) -> None:
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            ours = False
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                ours = ours or code.co_filename.startswith(_PACKAGE_DIR)
+                frame = frame.f_back
+            # Skip threads not working for us, or just waiting on a lock/event.
+            if not ours or stack[0][1] == _THREADING_FILE:
+                continue
+            stack.reverse()
+            with self._lock:
+                self.samples[tuple(stack)] += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "state": self.state,
+            "requests": self.requests,
+            "requests_started": self.begun,
+            "requests_finished": self.finished,
+            "interval_ms": self.interval * 1000,
+            "samples": sum(self.samples.values()),
+        }
+
+    # ---- Export ----
+
+    def _snapshot(self) -> list:
+        with self._lock:
+            return list(self.samples.items())
+
+    def collapsed(self) -> str:
+        """One ``frame;frame;... count`` line per distinct stack, root first."""
+        lines = [
+            ";".join(_frame_label(*f) for f in stack) + f" {count}"
+            for stack, count in self._snapshot()
+        ]
+        return "\n".join(sorted(lines)) + ("\n" if lines else "")
+
+    def speedscope(self, name: str = "ditherbooth") -> dict:
+        """The samples as a speedscope "sampled" profile, weighted in seconds."""
+        frames: list = []
+        index: dict = {}
+        samples, weights = [], []
+        for stack, count in self._snapshot():
+            ids = []
+            for f in stack:
+                if f not in index:
+                    index[f] = len(frames)
+                    frames.append(
+                        {"name": _frame_label(*f), "file": f[1], "line": f[2]}
+                    )
+                ids.append(index[f])
+            samples.append(ids)
+            weights.append(round(count * self.interval, 6))
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "exporter": "ditherbooth",
+            "name": name,
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": name,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": round(sum(weights), 6),
+                    "samples": samples,
+                    "weights": weights,
+                }
+            ],
+        }
+
+
+class ProfileMiddleware:
+    """ASGI middleware counting requests to ``paths`` against the profiler.
+
+    ``profiler`` returns the current :class:`SamplingProfiler`, if any. A
+    request counts until its response body is fully sent, so streamed
+    previews are covered to the last frame.
+    """
+
+    def __init__(
+        self, app, profiler: Callable[[], Optional[SamplingProfiler]], paths: tuple
+    ):
+        self.app = app
+        self.profiler = profiler
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        profiler = (
+            self.profiler()
+            if scope["type"] == "http" and scope["path"] in self.paths
+            else None
+        )
+        if profiler is None or not profiler.begin():
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.end()
@@ -0,0 +1,166 @@
+"""Recently printed labels, kept for instant reprints.
+
+Each print's packed raster (zlib-compressed), a small PNG thumbnail and its
+media and language are written to a directory, and the oldest are dropped
+once there are more than ``max_items`` or they take more than ``max_bytes``.
+The newest rasters are also kept in memory, up to ``memory_bytes``, so a
+reprint usually doesn't read the disk at all. The directory is the source of
+truth, so worker processes sharing it see each other's prints.
+"""
+
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+import json
+import os
+from pathlib import Path
+import tempfile
+import threading
+import time
+from typing import Optional
+import zlib
+
+from PIL import Image
+
+from ditherbooth.imaging.raster import PackedRaster, png_bytes
+
+THUMBNAIL_WIDTH = 160
+
+
+@dataclass
+class RecentPrint:
+    id: str
+    created: float
+    media: str
+    lang: str
+    width: int
+    height: int
+    # Bytes on disk, raster and thumbnail together
+    size: int
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def thumbnail_png(raster: PackedRaster, width: int = THUMBNAIL_WIDTH) -> bytes:
+    """A grayscale PNG of the raster, at most ``width`` pixels wide."""
+    img = raster.to_image().convert("L")
+    if img.width > width:
+        img = img.resize(
+            (width, max(1, round(img.height * width / img.width))), Image.BOX
+        )
+    return png_bytes(img)
+
+
+class RecentPrints:
+    def __init__(
+        self,
+        directory,
+        max_items: int = 20,
+        max_bytes: int = 64 * 1024 * 1024,
+        memory_bytes: int = 8 * 1024 * 1024,
+    ):
+        self.directory = Path(directory)
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.memory_bytes = memory_bytes
+        self._rasters: "OrderedDict[str, PackedRaster]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _write(self, path: Path, data: bytes) -> None:
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def add(
+        self, job_id: str, raster: PackedRaster, media: str, lang: str
+    ) -> Optional[RecentPrint]:
+        """Keep a printed raster under its ``job_id``; ``None`` if it is too big to keep."""
+        bits = zlib.compress(raster.data, 1)
+        thumb = thumbnail_png(raster)
+        entry = RecentPrint(
+            job_id,
+            time.time(),
+            media,
+            lang,
+            raster.width,
+            raster.height,
+            len(bits) + len(thumb),
+        )
+        if entry.size > self.max_bytes:
+            return None
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._write(self.directory / f"{job_id}.bits", bits)
+        self._write(self.directory / f"{job_id}.png", thumb)
+        # Written last: an entry without its metadata is never listed.
+        self._write(
+            self.directory / f"{job_id}.json", json.dumps(entry.to_dict()).encode()
+        )
+        self._remember(job_id, raster)
+        self._prune()
+        return entry
+
+    def _remember(self, job_id: str, raster: PackedRaster) -> None:
+        with self._lock:
+            self._rasters[job_id] = raster
+            self._rasters.move_to_end(job_id)
+            total = sum(len(r.data) for r in self._rasters.values())
+            while total > self.memory_bytes and self._rasters:
+                total -= len(self._rasters.popitem(last=False)[1].data)
+
+    def _prune(self) -> None:
+        entries = self.list()
+        total = 0
+        for index, entry in enumerate(entries):
+            total += entry.size
+            if index >= self.max_items or total > self.max_bytes:
+                self.remove(entry.id)
+
+    def list(self) -> list:
+        """Kept prints, newest first."""
+        entries = []
+        for path in self.directory.glob("*.json"):
+            try:
+                entries.append(RecentPrint(**json.loads(path.read_text())))
+            except (OSError, ValueError, TypeError):
+                continue
+        return sorted(entries, key=lambda e: e.created, reverse=True)
+
+    def get(self, job_id: str) -> Optional[RecentPrint]:
+        path = self.directory / f"{Path(job_id).name}.json"
+        try:
+            return RecentPrint(**json.loads(path.read_text()))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def raster(self, entry: RecentPrint) -> Optional[PackedRaster]:
+        with self._lock:
+            raster = self._rasters.get(entry.id)
+        if raster is not None:
+            return raster
+        try:
+            data = zlib.decompress((self.directory / f"{entry.id}.bits").read_bytes())
+        except (OSError, zlib.error):
+            return None
+        raster = PackedRaster(entry.width, entry.height, data)
+        self._remember(entry.id, raster)
+        return raster
+
+    def thumbnail(self, entry: RecentPrint) -> Optional[bytes]:
+        try:
+            return (self.directory / f"{entry.id}.png").read_bytes()
+        except OSError:
+            return None
+
+    def remove(self, job_id: str) -> None:
+        with self._lock:
+            self._rasters.pop(job_id, None)
+        for suffix in (".json", ".bits", ".png"):
+            try:
+                (self.directory / f"{job_id}{suffix}").unlink()
+            except FileNotFoundError:
+                pass
+
+    def clear(self) -> None:
+        for entry in self.list():
+            self.remove(entry.id)
@@ -0,0 +1,317 @@
+"""State shared by the worker processes of one host, in SQLite (WAL mode).
+
+With ``uvicorn --workers N`` every worker has its own memory, so caches,
+duplicate detection and the print queue would otherwise be per process, and
+several processes would spool to the same printer at once. Here:
+
+- :class:`SharedCache` keeps recent rasters in a database on ``/dev/shm``
+  (memory-backed), so a preview on one worker saves the print on another
+  from dithering again;
+- :class:`PrintQueue` is a durable FIFO of encoded jobs per printer, with a
+  lease electing the one process that spools them, in order. It also
+  records duplicate-print keys.
+
+Each thread uses its own connection; WAL lets readers proceed while one
+process writes.
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Optional
+
+# Jobs stay queryable (``/api/jobs``) this long after they finish.
+FINISHED_JOB_TTL = 3600.0
+
+
+class _Database:
+    def __init__(self, path, synchronous: str = "NORMAL"):
+        self.path = str(path)
+        self.synchronous = synchronous
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+
+    SCHEMA = ""
+
+    def connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            self._local.conn = conn
+        return conn
+
+    def transaction(self):
+        """Write transaction, taking the database lock up front."""
+        return _Transaction(self.connect())
+
+
+class _Transaction:
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.conn.execute("COMMIT" if exc_type is None else "ROLLBACK")
+
+
+def default_cache_path(name: str) -> str:
+    """A path on ``/dev/shm`` (memory) when there is one, else the temp dir."""
+    base = (
+        "/dev/shm"
+        if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK)
+        else tempfile.gettempdir()
+    )
+    return os.path.join(base, name)
+
+
+class SharedCache(_Database):
+    """Least-recently-used byte values, bounded by total size."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS cache (
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            used REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS cache_used ON cache (used);
+    """
+
+    def __init__(self, path, max_bytes: int = 64 * 1024 * 1024):
+        # Only a cache: losing it in a crash costs a re-dither.
+        super().__init__(path, synchronous="OFF")
+        self.max_bytes = max_bytes
+
+    def get(self, key: str) -> Optional[bytes]:
+        conn = self.connect()
+        row = conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE cache SET used = ? WHERE key = ?", (time.time(), key))
+        return row["value"]
+
+    def put(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, used) VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time.time()),
+            )
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[
+                0
+            ]
+            for old in conn.execute(
+                "SELECT key, size FROM cache ORDER BY used"
+            ).fetchall():
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM cache WHERE key = ?", (old["key"],))
+                total -= old["size"]
+
+    def clear(self) -> None:
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM cache")
+
+
+class PrintQueue(_Database):
+    """Encoded print jobs in submission order, one queue per printer.
+
+    Jobs are ``queued``, then ``spooling`` while the elected spooler sends
+    them, then ``spooled`` or ``failed``. A job left ``spooling`` by a
+    process that died is sent again by the next spooler, as the journal
+    would replay it.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT UNIQUE NOT NULL,
+            printer TEXT NOT NULL,
+            meta TEXT NOT NULL,
+            payload BLOB,
+            state TEXT NOT NULL DEFAULT 'queued',
+            result TEXT,
+            submitted REAL NOT NULL,
+            finished REAL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (printer, state, seq);
+        CREATE TABLE IF NOT EXISTS leases (
+            printer TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS dedup (
+            key TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            result TEXT,
+            expires REAL NOT NULL
+        );
+    """
+
+    # ---- Jobs ----
+
+    def enqueue(self, job_id: str, printer: str, meta: dict, payload: bytes) -> None:
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, printer, meta, payload, submitted) VALUES (?, ?, ?, ?, ?)",
+                (job_id, printer, json.dumps(meta), payload, time.time()),
+            )
+
+    def printers_with_work(self) -> list:
+        rows = (
+            self.connect()
+            .execute(
+                "SELECT DISTINCT printer FROM jobs WHERE state IN ('queued', 'spooling')"
+            )
+            .fetchall()
+        )
+        return [row["printer"] for row in rows]
+
+    def next_job(self, printer: str) -> Optional[dict]:
+        """The oldest unfinished job for ``printer``, marked ``spooling``."""
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE printer = ? AND state IN ('queued', 'spooling') ORDER BY seq LIMIT 1",
+                (printer,),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET state = 'spooling' WHERE seq = ?", (row["seq"],)
+            )
+        return self._job(row)
+
+    def finish(self, job_id: str, state: str, result: dict) -> None:
+        """Record the outcome; the payload is no longer needed."""
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET state = ?, result = ?, payload = NULL, finished = ? WHERE id = ?",
+                (state, json.dumps(result), time.time(), job_id),
+            )
+            conn.execute(
+                "DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?",
+                (time.time() - FINISHED_JOB_TTL,),
+            )
+
+    def job(self, job_id: str) -> Optional[dict]:
+        row = (
+            self.connect()
+            .execute(
+                "SELECT seq, id, printer, meta, state, result, submitted, finished FROM jobs WHERE id = ?",
+                (job_id,),
+            )
+            .fetchone()
+        )
+        return self._job(row) if row is not None else None
+
+    def active(self) -> list:
+        rows = (
+            self.connect()
+            .execute(
+                "SELECT seq, id, printer, meta, state, result, submitted, finished FROM jobs"
+                " WHERE state IN ('queued', 'spooling') ORDER BY seq"
+            )
+            .fetchall()
+        )
+        return [self._job(row) for row in rows]
+
+    @staticmethod
+    def _job(row: sqlite3.Row) -> dict:
+        job = dict(row)
+        job["meta"] = json.loads(job["meta"])
+        job["result"] = json.loads(job["result"]) if job.get("result") else None
+        return job
+
+    # ---- Spooler election ----
+
+    def acquire(self, printer: str, owner: str, ttl: float) -> bool:
+        """Take or renew the lease to spool to ``printer``; False if another holds it."""
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT owner, expires FROM leases WHERE printer = ?", (printer,)
+            ).fetchone()
+            if row is not None and row["owner"] != owner and row["expires"] > now:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO leases (printer, owner, expires) VALUES (?, ?, ?)",
+                (printer, owner, now + ttl),
+            )
+        return True
+
+    def release(self, owner: str) -> None:
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM leases WHERE owner = ?", (owner,))
+
+    # ---- Duplicate prints ----
+
+    def claim(
+        self,
+        key: str,
+        fingerprint: str,
+        ttl: float,
+        stale_after: Optional[float] = None,
+    ) -> Optional[dict]:
+        """Claim ``key`` for a new job, or return the live claim already on it.
+
+        The claim is returned as ``{"fingerprint", "result"}``; ``result`` is
+        ``None`` while that job is still running. A claim whose job failed
+        can be taken over, so the print can be retried, and so can one still
+        running ``stale_after`` seconds after it was made (its worker died).
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT fingerprint, result, expires FROM dedup WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row["expires"] > now:
+                result = json.loads(row["result"]) if row["result"] else None
+                # Claims on a key all have its ttl, so this is when it was made.
+                stale = (
+                    result is None
+                    and stale_after is not None
+                    and row["expires"] - ttl <= now - stale_after
+                )
+                if not (result and "error" in result) and not stale:
+                    return {"fingerprint": row["fingerprint"], "result": result}
+            conn.execute(
+                "INSERT OR REPLACE INTO dedup (key, fingerprint, result, expires) VALUES (?, ?, NULL, ?)",
+                (key, fingerprint, now + ttl),
+            )
+            conn.execute("DELETE FROM dedup WHERE expires <= ?", (now,))
+        return None
+
+    def settle(self, key: str, result: dict) -> None:
+        """Store a claimed job's result: the response, or ``{"error": {...}}``."""
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE dedup SET result = ? WHERE key = ?", (json.dumps(result), key)
+            )
+
+    def claim_result(self, key: str) -> Optional[dict]:
+        """A claim's result, ``None`` while its job is running."""
+        row = (
+            self.connect()
+            .execute("SELECT result, expires FROM dedup WHERE key = ?", (key,))
+            .fetchone()
+        )
+        if row is None or row["expires"] <= time.time():
+            return {
+                "error": {
+                    "status_code": 409,
+                    "detail": "The original request is no longer tracked",
+                }
+            }
+        return json.loads(row["result"]) if row["result"] else None
@@ -111,6 +111,13 @@
     return new File([blob], 'sample.png', { type: blob.type || 'image/png' });
   }
 
+  // Progress pushed while a print is under way (see events.js).
+  function showJobProgress(kind, data) {
+    if (kind === 'stage' && data.stage === 'admitted') setStatus('Preparing image…');
+    else if (kind === 'stage' && data.stage === 'encoded') setStatus('Sending to printer…');
+    else if (kind === 'job' && data.state === 'queued' && data.position) setStatus(`Waiting for the printer (${data.position} ahead)…`);
+  }
+
   async function doPrint() {
     if (isPrinting) return; // prevent double submits
     if (!selectedFile) {
@@ -122,19 +129,15 @@
     document.body.setAttribute('aria-busy', 'true');
     showProgress(true);
     const formData = new FormData();
-    formData.append('file', selectedFile);
+    await window.ditherbooth.appendImage(formData, selectedFile, $('#media').value, publicConfig, selectedFile.name);
     // Always append; the API uses defaults if omitted
     formData.append('media', $('#media').value);
     formData.append('lang', $('#lang').value);
     setStatus('Sending to printer…');
     try {
-      const res = await fetch('/print', { method: 'POST', body: formData });
-      if (!res.ok) {
-        const detail = await res.text();
-        throw new Error(detail || 'Request failed');
-      }
-      const data = await res.json();
+      const data = await window.ditherbooth.printJob(formData, showJobProgress);
       if (data && data.mode === 'test') setStatus(`Test OK (${data.bytes} bytes)`, 'ok');
+      else if (data && data.eta_seconds) setStatus(`Sent to printer, ready in about ${Math.ceil(data.eta_seconds)} s`, 'ok');
       else setStatus('Sent to printer', 'ok');
     } catch (e) {
       console.error(e);
@@ -209,6 +212,14 @@
         $('#testDelay').value = (cfg.test_mode_delay_ms ?? 0);
         $('#eplDarkness').value = (cfg.epl_darkness ?? '');
         $('#eplSpeed').value = (cfg.epl_speed ?? '');
+        $('#maxContinuousHeight').value = (cfg.max_continuous_height_dots ?? '');
+        $('#printDedupSeconds').value = (cfg.print_dedup_seconds ?? 0);
+        $('#printResample').value = cfg.print_resample || 'best';
+        $('#previewResample').value = cfg.preview_resample || 'best';
+        $('#clientDither').checked = !!cfg.client_dither;
+        $('#previewExifThumbnail').checked = cfg.preview_exif_thumbnail !== false;
+        $('#printerStatusPoll').value = cfg.printer_status_poll == null ? '' : String(cfg.printer_status_poll);
+        $('#printerMaxPendingJobs').value = (cfg.printer_max_pending_jobs ?? 0);
         form.hidden = false;
         msg.textContent = 'Connected';
         msg.className = 'status ok';
@@ -232,6 +243,14 @@
         test_mode_delay_ms: parseInt($('#testDelay').value || '0', 10) || 0,
         epl_darkness: (function(){ const v=$('#eplDarkness').value.trim(); return v === '' ? null : parseInt(v,10); })(),
         epl_speed: (function(){ const v=$('#eplSpeed').value.trim(); return v === '' ? null : parseInt(v,10); })(),
+        max_continuous_height_dots: (function(){ const v=$('#maxContinuousHeight').value.trim(); return v === '' ? null : parseInt(v,10); })(),
+        print_dedup_seconds: parseInt($('#printDedupSeconds').value || '0', 10) || 0,
+        print_resample: $('#printResample').value,
+        preview_resample: $('#previewResample').value,
+        client_dither: $('#clientDither').checked,
+        preview_exif_thumbnail: $('#previewExifThumbnail').checked,
+        printer_status_poll: $('#printerStatusPoll').value === '' ? null : $('#printerStatusPoll').value === 'true',
+        printer_max_pending_jobs: parseInt($('#printerMaxPendingJobs').value || '0', 10) || 0,
       };
       try {
         const res = await fetch('/api/dev/settings', {
@@ -284,23 +303,91 @@
     }
   });
 
+  // One preview session per page so the server can drop stale frames.
+  const previewSession = (window.crypto && crypto.randomUUID)
+    ? crypto.randomUUID()
+    : 'p_' + Date.now() + '_' + Math.random().toString(36).slice(2);
+  let previewAbort = null;
+
+  function base64ToBlob(b64, type) {
+    const bin = atob(b64);
+    const bytes = new Uint8Array(bin.length);
+    for (let i = 0; i < bin.length; i++) bytes[i] = bin.charCodeAt(i);
+    return new Blob([bytes], { type });
+  }
+
+  // Expand packed 1-bit rows (MSB first, set bit = white) into RGBA pixels
+  // so the canvas can draw them without a PNG decode.
+  function packedToImageData(b64, width, height) {
+    const bin = atob(b64);
+    const rowBytes = Math.ceil(width / 8);
+    const data = new ImageData(width, height);
+    const px = data.data;
+    for (let y = 0; y < height; y++) {
+      for (let x = 0; x < width; x++) {
+        const bit = bin.charCodeAt(y * rowBytes + (x >> 3)) & (0x80 >> (x & 7));
+        const i = (y * width + x) * 4;
+        const v = bit ? 255 : 0;
+        px[i] = v; px[i + 1] = v; px[i + 2] = v; px[i + 3] = 255;
+      }
+    }
+    return data;
+  }
+
+  // POST to /preview/progressive and call onFrame(source, stage) for each
+  // frame (a quick ordered-dither one first, then the exact one). The source
+  // is raw ImageData when opts.raw is set, otherwise a PNG blob.
+  async function fetchProgressivePreview(formData, onFrame, opts = {}) {
+    formData.append('session', opts.session || previewSession);
+    if (opts.raw) formData.append('encoding', 'raw');
+    const res = await fetch('/preview/progressive', { method: 'POST', body: formData, signal: opts.signal });
+    if (!res.ok) throw new Error('Preview failed');
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buf = '';
+    const handle = async (line) => {
+      if (!line.trim()) return;
+      const frame = JSON.parse(line);
+      if (frame.stage === 'error') throw new Error('Preview failed');
+      if (frame.bits) await onFrame(packedToImageData(frame.bits, frame.width, frame.height), frame.stage);
+      else if (frame.png) await onFrame(base64ToBlob(frame.png, 'image/png'), frame.stage);
+    };
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buf += decoder.decode(value, { stream: true });
+      let nl;
+      while ((nl = buf.indexOf('\n')) >= 0) {
+        await handle(buf.slice(0, nl));
+        buf = buf.slice(nl + 1);
+      }
+    }
+    await handle(buf);
+  }
+  window.fetchProgressivePreview = fetchProgressivePreview;
+
   async function updatePreviews() {
+    if (previewAbort) previewAbort.abort();
     if (!selectedFile) {
       drawOutput(null);
       return;
     }
+    const controller = new AbortController();
+    previewAbort = controller;
     const formData = new FormData();
     formData.append('file', selectedFile);
     formData.append('media', $('#media').value);
     try {
-      const res = await fetch('/preview', { method: 'POST', body: formData });
-      if (!res.ok) throw new Error('Preview failed');
-      const blob = await res.blob();
-      drawOutput(blob);
+      // Raw bitmaps skip PNG encode/decode; createImageBitmap draws them directly.
+      const raw = 'createImageBitmap' in window && 'ImageData' in window;
+      await fetchProgressivePreview(formData, (frame) => drawOutput(frame), { signal: controller.signal, raw });
     } catch (e) {
+      if (e.name === 'AbortError') return;
       console.error(e);
       setStatus('Preview error: ' + e.message, 'err');
       drawOutput(null);
+    } finally {
+      if (previewAbort === controller) previewAbort = null;
     }
   }
 
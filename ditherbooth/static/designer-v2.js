@@ -271,10 +271,13 @@
 
   // ---- Clean JSON (excludes grid lines) ----
 
+  // Custom properties Fabric only serializes when asked to.
+  const EXTRA_PROPS = ['barcode', 'barcodeModule'];
+
   function canvasToCleanJSON() {
     const grid = canvas.getObjects().filter(o => o._isGrid);
     grid.forEach(o => canvas.remove(o));
-    const json = canvas.toJSON();
+    const json = canvas.toJSON(EXTRA_PROPS);
     grid.forEach(o => canvas.add(o));
     grid.forEach(o => canvas.sendToBack(o));
     return json;
@@ -326,9 +329,56 @@
     input.value = '';
   }
 
+  // ---- Barcode tool ----
+
+  // Barcodes are text objects whose text is the encoded data. The canvas only
+  // shows that text; the server (Preview) or the printer draws the bars.
+  function addBarcode(type) {
+    const qr = type === 'qr';
+    const code = new fabric.IText(qr ? 'https://example.com' : '12345678', {
+      left: 50,
+      top: 50,
+      // A Code 128 symbol is as tall as the object
+      fontSize: qr ? 20 : 60,
+      fontFamily: 'Courier New',
+      fill: '#000000',
+      textBackgroundColor: '#dddddd',
+      barcode: type,
+      barcodeModule: qr ? 4 : 2,
+    });
+    canvas.add(code);
+    canvas.setActiveObject(code);
+    canvas.renderAll();
+  }
+
+  function hasBarcodes(canvasJSON) {
+    return (canvasJSON.objects || []).some((o) => o.barcode);
+  }
+
+  // Render a canvas on the server: a PNG, or with ``print: true`` in
+  // ``options`` the print result.
+  async function renderOnServer(canvasJSON, options) {
+    const headers = { 'Content-Type': 'application/json' };
+    if (window.ditherbooth && window.ditherbooth.clientId) headers['X-Client-Id'] = window.ditherbooth.clientId;
+    const res = await fetch('/api/render', {
+      method: 'POST',
+      headers,
+      body: JSON.stringify({ canvas_json: canvasJSON, media: getSelectedMedia(), ...options }),
+    });
+    if (!res.ok) {
+      const detail = await res.text();
+      throw new Error(detail || 'Render failed');
+    }
+    return res;
+  }
+
   // ---- Shapes tool ----
 
   function addShape(type) {
+    if (type === 'code128' || type === 'qr') {
+      addBarcode(type);
+      return;
+    }
     let shape;
     const opts = { stroke: currentFill, strokeWidth: 2, fill: 'transparent', left: 50, top: 50 };
     if (type === 'rect') {
@@ -452,22 +502,36 @@
 
   // ---- Preview ----
 
+  const designerPreviewSession = 'designer_' + Date.now() + '_' + Math.random().toString(36).slice(2);
+
   async function doPreview() {
     if (!canvas) return;
     setDesignerStatus('Generating preview...', '');
     try {
+      const img = $('#dPreviewImg');
+      const frame = $('#dPreviewFrame');
+      const show = (previewBlob) => {
+        if (img.src) URL.revokeObjectURL(img.src);
+        img.src = URL.createObjectURL(previewBlob);
+        frame.style.display = '';
+      };
+      const canvasJSON = canvasToCleanJSON();
+      if (hasBarcodes(canvasJSON)) {
+        show(await (await renderOnServer(canvasJSON)).blob());
+        setDesignerStatus('Preview ready', 'ok');
+        return;
+      }
       const blob = await canvasToBlob();
       const formData = new FormData();
       formData.append('file', blob, 'design.png');
       formData.append('media', getSelectedMedia());
-      const res = await fetch('/preview', { method: 'POST', body: formData });
-      if (!res.ok) throw new Error('Preview failed');
-      const previewBlob = await res.blob();
-      const url = URL.createObjectURL(previewBlob);
-      const img = $('#dPreviewImg');
-      const frame = $('#dPreviewFrame');
-      img.src = url;
-      frame.style.display = '';
+      if (typeof window.fetchProgressivePreview === 'function') {
+        await window.fetchProgressivePreview(formData, show, { session: designerPreviewSession });
+      } else {
+        const res = await fetch('/preview', { method: 'POST', body: formData });
+        if (!res.ok) throw new Error('Preview failed');
+        show(await res.blob());
+      }
       setDesignerStatus('Preview ready', 'ok');
     } catch (e) {
       console.error(e);
@@ -481,15 +545,20 @@
     if (!canvas) return;
     setDesignerStatus('Sending to printer...', '');
     try {
-      const blob = await canvasToBlob();
-      const formData = new FormData();
-      formData.append('file', blob, 'design.png');
-      formData.append('media', getSelectedMedia());
       const config = window.getPublicConfig ? window.getPublicConfig() : null;
-      formData.append('lang', (config && config.default_lang) || 'EPL');
-      const res = await fetch('/print', { method: 'POST', body: formData });
-      if (!res.ok) throw new Error('Print failed');
-      const data = await res.json();
+      const lang = (config && config.default_lang) || 'EPL';
+      const canvasJSON = canvasToCleanJSON();
+      let data;
+      if (hasBarcodes(canvasJSON)) {
+        data = await (await renderOnServer(canvasJSON, { lang, print: true })).json();
+      } else {
+        const blob = await canvasToBlob();
+        const formData = new FormData();
+        await window.ditherbooth.appendImage(formData, blob, getSelectedMedia(), config, 'design.png');
+        formData.append('media', getSelectedMedia());
+        formData.append('lang', lang);
+        data = await window.ditherbooth.printJob(formData);
+      }
       if (data && data.mode === 'test') {
         setDesignerStatus(`Test OK (${data.bytes} bytes)`, 'ok');
       } else {
@@ -800,13 +869,20 @@
       progressEl.textContent = 'Printing ' + (i + 1) + '/' + queue.length + ': ' + item.name;
       progressEl.className = 'status';
       try {
+        if (hasBarcodes(item.canvasJSON)) {
+          await renderOnServer(item.canvasJSON, { lang, print: true });
+          continue;
+        }
         const blob = await canvasJSONToBlob(item.canvasJSON);
         const formData = new FormData();
-        formData.append('file', blob, 'design.png');
+        await window.ditherbooth.appendImage(formData, blob, media, config, 'design.png');
         formData.append('media', media);
         formData.append('lang', lang);
-        const res = await fetch('/print', { method: 'POST', body: formData });
-        if (!res.ok) throw new Error('Print failed');
+        await window.ditherbooth.printJob(formData, (kind, data) => {
+          if (kind === 'job' && data.state === 'queued' && data.position) {
+            progressEl.textContent = 'Printing ' + (i + 1) + '/' + queue.length + ': ' + item.name + ' (' + data.position + ' ahead)';
+          }
+        });
       } catch (e) {
         progressEl.textContent = 'Failed on ' + item.name + ' (' + (i + 1) + '/' + queue.length + '): ' + e.message;
         progressEl.className = 'status err';
@@ -0,0 +1,78 @@
+// Client-side dithering: turn an image into the packed 1-bit bitmap the
+// server prints, so busy kiosks only have to encode and spool it.
+// Mirrors the server pipeline: EXIF-upright, fit to the media width (and max
+// height), grayscale with Pillow's weights, the calibrated tone curve (if the
+// media has one), Floyd–Steinberg at threshold 128.
+(() => {
+  function fit(w, h, width, maxHeight) {
+    let scale = width / w;
+    if (maxHeight) scale = Math.min(scale, maxHeight / h);
+    return [Math.max(1, Math.round(w * scale)), Math.max(1, Math.round(h * scale))];
+  }
+
+  // ``lut`` maps each gray level 0-255 to the level to dither, or is null.
+  async function ditherToPacked(blob, width, maxHeight, lut) {
+    const bitmap = await createImageBitmap(blob, { imageOrientation: 'from-image' });
+    const [w, h] = fit(bitmap.width, bitmap.height, width, maxHeight);
+    const canvas = document.createElement('canvas');
+    canvas.width = width;
+    canvas.height = h;
+    const ctx = canvas.getContext('2d');
+    ctx.fillStyle = '#fff';
+    ctx.fillRect(0, 0, width, h);
+    ctx.imageSmoothingQuality = 'high';
+    ctx.drawImage(bitmap, Math.floor((width - w) / 2), 0, w, h);
+    bitmap.close && bitmap.close();
+    const rgba = ctx.getImageData(0, 0, width, h).data;
+
+    // Error diffusion needs this row and the next.
+    let cur = new Float32Array(width + 2);
+    let next = new Float32Array(width + 2);
+    const rowBytes = Math.ceil(width / 8);
+    const bits = new Uint8Array(rowBytes * h);
+    for (let y = 0; y < h; y++) {
+      for (let x = 0; x < width; x++) {
+        const i = (y * width + x) * 4;
+        const gray = Math.round((rgba[i] * 299 + rgba[i + 1] * 587 + rgba[i + 2] * 114) / 1000);
+        cur[x + 1] += lut ? lut[gray] : gray;
+      }
+      for (let x = 0; x < width; x++) {
+        const old = cur[x + 1];
+        const white = old >= 128;
+        const err = old - (white ? 255 : 0);
+        if (white) bits[y * rowBytes + (x >> 3)] |= 0x80 >> (x & 7);
+        cur[x + 2] += err * 7 / 16;
+        next[x] += err * 3 / 16;
+        next[x + 1] += err * 5 / 16;
+        next[x + 2] += err / 16;
+      }
+      [cur, next] = [next, cur];
+      next.fill(0);
+    }
+    return { bits, width, height: h };
+  }
+
+  // Append the image to a /print form: pre-dithered when the server asks for
+  // it and the browser can, otherwise the original file. With auto_rotate on
+  // the server picks the orientation, so it gets the original.
+  async function appendImage(formData, blob, media, config, filename) {
+    const dims = config && config.media_dimensions && config.media_dimensions[media];
+    const rotates = config && config.auto_rotate && config.auto_rotate !== 'off';
+    if (config && config.client_dither && !rotates && dims && window.createImageBitmap) {
+      try {
+        const maxHeight = dims.height || config.max_continuous_height_dots || null;
+        const lut = (config.tone_curves && config.tone_curves[media]) || null;
+        const packed = await ditherToPacked(blob, dims.width, maxHeight, lut);
+        formData.append('file', new Blob([packed.bits], { type: 'application/octet-stream' }), 'label.bits');
+        formData.append('packed', 'true');
+        formData.append('height', String(packed.height));
+        return;
+      } catch (e) {
+        console.warn('Client-side dithering failed, uploading the image', e);
+      }
+    }
+    formData.append('file', blob, filename);
+  }
+
+  window.ditherbooth = Object.assign(window.ditherbooth || {}, { ditherToPacked, appendImage });
+})();
@@ -0,0 +1,124 @@
+// Server-pushed print progress. Each kiosk keeps one /api/events stream and
+// submits prints with wait=false; job states, render stages and the result
+// arrive on the stream instead of over a long /print request per job.
+// Without EventSource (or a stream), or when the server says results may go
+// to another worker's streams, prints fall back to waiting on /print.
+(() => {
+  const randomId = () => Math.random().toString(36).slice(2, 12);
+  const clientId = (() => {
+    try {
+      let id = localStorage.getItem('ditherbooth_client_id');
+      if (!id) {
+        id = randomId();
+        localStorage.setItem('ditherbooth_client_id', id);
+      }
+      return id;
+    } catch (_) {
+      return randomId();
+    }
+  })();
+
+  const pending = new Map(); // job_id -> { resolve, reject, onUpdate }
+  const early = new Map(); // results that beat the /print response
+  const listeners = new Set();
+  let source = null;
+  let opened = null;
+  let asyncPrints = null;
+
+  // Whether wait=false results reach this stream (not across workers).
+  function serverPrintsAsync() {
+    if (!asyncPrints) {
+      asyncPrints = fetch('/api/public-config')
+        .then((res) => (res.ok ? res.json() : {}))
+        .then((cfg) => cfg.async_prints === true)
+        .catch(() => false);
+    }
+    return asyncPrints;
+  }
+
+  function settle(data) {
+    const job = pending.get(data.job_id);
+    if (!job) {
+      early.set(data.job_id, data);
+      if (early.size > 50) early.delete(early.keys().next().value);
+      return;
+    }
+    pending.delete(data.job_id);
+    if (data.error) job.reject(new Error(data.error.detail || 'Print failed'));
+    else job.resolve(data.result);
+  }
+
+  // Results may have been missed while the stream was down: ask for them.
+  async function recheck() {
+    for (const [id, job] of pending) {
+      try {
+        const res = await fetch(`/api/jobs/${id}`);
+        if (!res.ok) continue;
+        const state = await res.json();
+        if (state.state === 'failed') settle({ job_id: id, error: { detail: state.error } });
+        else if (state.state !== 'queued') settle({ job_id: id, result: { status: 'ok', job_id: id, eta_seconds: state.eta_seconds } });
+        else job.onUpdate && job.onUpdate('job', state);
+      } catch (_) {}
+    }
+  }
+
+  function connect() {
+    if (opened) return opened;
+    if (!window.EventSource) return Promise.resolve(false);
+    source = new EventSource('/api/events?client=' + encodeURIComponent(clientId));
+    const on = (kind, handler) => source.addEventListener(kind, (e) => handler(JSON.parse(e.data || '{}')));
+    const forward = (id, kind, data) => {
+      const job = pending.get(id);
+      if (job && job.onUpdate) job.onUpdate(kind, data);
+    };
+    on('stage', (d) => forward(d.job_id, 'stage', d));
+    on('job', (d) => forward(d.id, 'job', d));
+    on('result', settle);
+    ['queue', 'printer', 'resync'].forEach((kind) => on(kind, (d) => listeners.forEach((fn) => fn(kind, d))));
+    on('resync', recheck);
+    let wasDown = false;
+    source.addEventListener('error', () => { wasDown = true; });
+    opened = new Promise((resolve) => {
+      const timer = setTimeout(() => resolve(false), 3000);
+      source.addEventListener('open', () => {
+        clearTimeout(timer);
+        resolve(true);
+        if (wasDown) recheck();
+        wasDown = false;
+      });
+    });
+    return opened;
+  }
+
+  // Print a /print form; resolves with the same result /print returns.
+  // ``onUpdate(kind, data)`` gets the job's ``stage`` and ``job`` events.
+  async function printJob(formData, onUpdate) {
+    const headers = { 'X-Client-Id': clientId };
+    const streaming = (await connect()) && (await serverPrintsAsync());
+    if (streaming) formData.append('wait', 'false');
+    const res = await fetch('/print', { method: 'POST', body: formData, headers });
+    if (!res.ok) {
+      const detail = await res.text();
+      throw new Error(detail || 'Request failed');
+    }
+    const data = await res.json();
+    if (res.status !== 202) return data;
+    return new Promise((resolve, reject) => {
+      pending.set(data.job_id, { resolve, reject, onUpdate });
+      const done = early.get(data.job_id);
+      if (done) {
+        early.delete(data.job_id);
+        settle(done);
+      }
+    });
+  }
+
+  // ``fn(kind, data)`` for queue, printer and resync events.
+  function onStatus(fn) {
+    listeners.add(fn);
+    connect();
+    return () => listeners.delete(fn);
+  }
+
+  window.ditherbooth = Object.assign(window.ditherbooth || {}, { clientId, printJob, onStatus });
+})();
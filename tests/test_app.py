@@ -16,12 +16,14 @@ def test_print_endpoint(tmp_path, monkeypatch):
     # Ensure test_mode is not enabled via any existing config
     monkeypatch.setenv("DITHERBOOTH_CONFIG_PATH", str(tmp_path / "cfg.json"))
     import ditherbooth.app as app_module
+
     importlib.reload(app_module)
     client = TestClient(app_module.app)
     called = []
 
     def fake_spool_raw(printer_name, payload):
         called.append((printer_name, payload))
+
     async def fake_run_in_threadpool(func, *args, **kwargs):
         return func(*args, **kwargs)
 
@@ -40,7 +42,8 @@ def test_print_endpoint(tmp_path, monkeypatch):
     data = {"media": "continuous58", "lang": "EPL"}
     response = client.post("/print", files=files, data=data)
     assert response.status_code == 200
-    assert response.json() == {"status": "ok"}
+    body = response.json()
+    assert body["status"] == "ok" and body["job_id"]
     assert called, "spool_raw was not called"
     printer_name, payload = called[0]
     assert printer_name == "Zebra_LP2844"
@@ -59,6 +62,7 @@ def test_print_endpoint_label_media(tmp_path, monkeypatch, media, width, height)
     # Ensure test_mode is not enabled via any existing config
     monkeypatch.setenv("DITHERBOOTH_CONFIG_PATH", str(tmp_path / "cfg.json"))
     import ditherbooth.app as app_module
+
     importlib.reload(app_module)
     client = TestClient(app_module.app)
     called = []
@@ -84,7 +88,8 @@ def test_print_endpoint_label_media(tmp_path, monkeypatch, media, width, height)
     data = {"media": media, "lang": "EPL"}
     response = client.post("/print", files=files, data=data)
     assert response.status_code == 200
-    assert response.json() == {"status": "ok"}
+    body = response.json()
+    assert body["status"] == "ok" and body["job_id"]
     assert called, "spool_raw was not called"
     _, payload = called[0]
     row_bytes = width // 8
@@ -95,5 +100,1002 @@ def test_print_endpoint_label_media(tmp_path, monkeypatch, media, width, height)
 def test_printer_name_from_env(monkeypatch):
     monkeypatch.setenv("DITHERBOOTH_PRINTER", "myprinter")
     import ditherbooth.app as app_module
+
     importlib.reload(app_module)
     assert app_module.PRINTER_NAME == "myprinter"
+
+
+def test_print_reuses_cached_raster_across_lang_and_darkness(tmp_path, monkeypatch):
+    monkeypatch.setenv("DITHERBOOTH_CONFIG_PATH", str(tmp_path / "cfg.json"))
+    import ditherbooth.app as app_module
+
+    importlib.reload(app_module)
+    client = TestClient(app_module.app)
+    called = []
+    conversions = []
+
+    async def fake_run_in_threadpool(func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+    real_to_1bit = app_module.to_1bit
+
+    def counting_to_1bit(*args, **kwargs):
+        conversions.append(args[1:])
+        return real_to_1bit(*args, **kwargs)
+
+    monkeypatch.setattr(app_module, "run_in_threadpool", fake_run_in_threadpool)
+    monkeypatch.setattr(
+        app_module, "spool_raw", lambda name, payload: called.append(payload)
+    )
+    monkeypatch.setattr(app_module, "to_1bit", counting_to_1bit)
+
+    from PIL import Image
+    import io
+
+    img = Image.new("RGB", (400, 240), color="black")
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    files = {"file": ("test.png", buf.getvalue(), "image/png")}
+
+    assert (
+        client.post(
+            "/print", files=files, data={"media": "label50x30", "lang": "EPL"}
+        ).status_code
+        == 200
+    )
+    assert (
+        client.post(
+            "/print", files=files, data={"media": "label50x30", "lang": "ZPL"}
+        ).status_code
+        == 200
+    )
+    client.put(
+        "/api/dev/settings", headers={"X-Dev-Password": "dev"}, json={"epl_darkness": 3}
+    )
+    assert (
+        client.post(
+            "/print", files=files, data={"media": "label50x30", "lang": "EPL"}
+        ).status_code
+        == 200
+    )
+
+    assert conversions == [(400, 240)]
+    assert called[1].startswith(b"^XA^FO20,20^GFA,12000,12000,50,")
+    assert called[2].startswith(b"N\nD3\nS2\nq400\nQ240\nGW20,0,50,240,")
+    # Same packed body in both EPL payloads
+    assert (
+        called[0].split(b"GW20,0,50,240,")[1] == called[2].split(b"GW20,0,50,240,")[1]
+    )
+
+
+def test_print_streams_large_jobs(tmp_path, monkeypatch):
+    monkeypatch.setenv("DITHERBOOTH_CONFIG_PATH", str(tmp_path / "cfg.json"))
+    import ditherbooth.app as app_module
+
+    importlib.reload(app_module)
+    client = TestClient(app_module.app)
+    chunks = []
+
+    async def fake_run_in_threadpool(func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+    def fake_spool_raw(printer_name, payload):
+        assert not isinstance(payload, (bytes, bytearray))
+        chunks.extend(payload)
+
+    monkeypatch.setattr(app_module, "run_in_threadpool", fake_run_in_threadpool)
+    monkeypatch.setattr(app_module, "spool_raw", fake_spool_raw)
+
+    from PIL import Image
+    import io
+
+    img = Image.new("L", (463, 5000), color=0)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    files = {"file": ("tall.png", buf.getvalue(), "image/png")}
+    response = client.post(
+        "/print", files=files, data={"media": "continuous58", "lang": "EPL"}
+    )
+    assert response.status_code == 200
+    assert len(chunks) > 3
+    payload = b"".join(chunks)
+    assert payload.startswith(b"N\nD8\nS2\nq463\nQ16,0\nGW20,0,58,5000,")
+    assert payload.endswith(b"\nP1\n")
+
+
+def _png_bytes(shade=0):
+    from PIL import Image
+    import io
+
+    buf = io.BytesIO()
+    Image.new("L", (40, 10), color=shade).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_print_rate_limited_per_client(tmp_path, monkeypatch):
+    monkeypatch.setenv("DITHERBOOTH_CONFIG_PATH", str(tmp_path / "cfg.json"))
+    monkeypatch.setenv("DITHERBOOTH_PRINT_RATE", "0.1,2")
+    import ditherbooth.app as app_module
+
+    importlib.reload(app_module)
+    client = TestClient(app_module.app)
+    monkeypatch.setattr(app_module, "spool_raw", lambda name, payload: None)
+
+    for shade in range(2):
+        files = {"file": ("test.png", _png_bytes(shade), "image/png")}
+        assert client.post("/print", files=files).status_code == 200
+    files = {"file": ("test.png", _png_bytes(2), "image/png")}
+    res = client.post("/print", files=files)
+    assert res.status_code == 429
+    assert res.headers["Retry-After"] == "10"
+    # Another kiosk has its own bucket
+    res = client.post("/print", files=files, headers={"X-Client-Id": "kiosk-2"})
+    assert res.status_code == 200
+    # Background prints are refused up front rather than accepted
+    res = client.post("/print", files=files, data={"wait": "false"})
+    assert res.status_code == 429
+    assert res.headers["Retry-After"] == "10"
+
+
+def test_preview_refused_when_imaging_slots_busy(tmp_path, monkeypatch):
+    monkeypatch.setenv("DITHERBOOTH_CONFIG_PATH", str(tmp_path / "cfg.json"))
+    import ditherbooth.app as app_module
+
+    importlib.reload(app_module)
+    client = TestClient(app_module.app)
+
+    # Every slot is taken by jobs in flight; previews don't queue.
+    app_module._imaging_gate.in_flight = app_module._imaging_gate.limit
+    files = {"file": ("test.png", _png_bytes(), "image/png")}
+    res = client.post("/preview", files=files)
+    assert res.status_code == 503
+    assert int(res.headers["Retry-After"]) >= 1
+    assert app_module._preview_gate.in_flight == 0
+
+    app_module._imaging_gate.in_flight = 0
+    assert client.post("/preview", files=files).status_code == 200
+    assert app_module._imaging_gate.in_flight == 0
+
+
+def test_prints_release_imaging_slot_before_spooling(tmp_path, monkeypatch):
+    monkeypatch.setenv("DITHERBOOTH_CONFIG_PATH", str(tmp_path / "cfg.json"))
+    import ditherbooth.app as app_module
+
+    importlib.reload(app_module)
+    client = TestClient(app_module.app)
+    # Slots in use while the job is handed to the printer (or waits for it)
+    in_flight = []
+    monkeypatch.setattr(
+        app_module,
+        "spool_raw",
+        lambda name, payload: in_flight.append(app_module._imaging_gate.in_flight),
+    )
+
+    files = {"file": ("test.png", _png_bytes(), "image/png")}
+    assert client.post("/print", files=files).status_code == 200
+    canvas_json = {
+        "objects": [
+            {
+                "type": "rect",
+                "left": 0,
+                "top": 0,
+                "width": 20,
+                "height": 20,
+                "fill": "#000000",
+            }
+        ]
+    }
+    tpl_id = client.post(
+        "/api/templates", json={"name": "T", "canvas_json": canvas_json}
+    ).json()["id"]
+    res = client.post(
+        f"/api/templates/{tpl_id}/render", json={"print": True, "media": "label50x30"}
+    )
+    assert res.status_code == 200
+    res = client.post(
+        f"/api/templates/{tpl_id}/merge", json={"rows": [{}], "media": "label50x30"}
+    )
+    assert res.text.splitlines()[-1] == '{"status": "done", "printed": 1}'
+    assert in_flight == [0, 0, 0]
+
+
+def test_admission_gate_queues_in_order():
+    import asyncio
+    from ditherbooth.admission import AdmissionGate, Overloaded
+
+    async def scenario():
+        gate = AdmissionGate(1, queue=1, timeout=1)
+        order = []
+
+        async def job(name, hold):
+            async with gate.slot():
+                order.append(name)
+                await asyncio.sleep(hold)
+
+        first = asyncio.create_task(job("a", 0.05))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(job("b", 0))
+        await asyncio.sleep(0)
+        # One running, one waiting: the queue is full
+        with pytest.raises(Overloaded):
+            await gate.acquire()
+        await asyncio.gather(first, second)
+        assert order == ["a", "b"]
+        assert gate.in_flight == 0
+
+        short = AdmissionGate(1, queue=1, timeout=0.01)
+        await short.acquire()
+        with pytest.raises(Overloaded):
+            await short.acquire()
+        assert not short._waiters
+
+    asyncio.run(scenario())
+
+
+def test_print_suppresses_duplicates(tmp_path, monkeypatch):
+    monkeypatch.setenv("DITHERBOOTH_CONFIG_PATH", str(tmp_path / "cfg.json"))
+    import ditherbooth.app as app_module
+
+    importlib.reload(app_module)
+    client = TestClient(app_module.app)
+    called = []
+    monkeypatch.setattr(
+        app_module, "spool_raw", lambda name, payload: called.append(payload)
+    )
+
+    # Double tap: same upload within the window prints once
+    files = {"file": ("test.png", _png_bytes(), "image/png")}
+    first = client.post("/print", files=files)
+    again = client.post("/print", files=files)
+    assert again.status_code == 200
+    assert again.json() == first.json()
+    assert again.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert len(called) == 1
+
+    # Idempotency keys work with the content window disabled
+    client.put(
+        "/api/dev/settings",
+        headers={"X-Dev-Password": "dev"},
+        json={"print_dedup_seconds": 0},
+    )
+    files = {"file": ("test.png", _png_bytes(50), "image/png")}
+    headers = {"Idempotency-Key": "job-1"}
+    assert client.post("/print", files=files, headers=headers).status_code == 200
+    assert (
+        client.post("/print", files=files, headers=headers).headers[
+            "Idempotent-Replayed"
+        ]
+        == "true"
+    )
+    assert len(called) == 2
+    assert client.post("/print", files=files).status_code == 200
+    assert len(called) == 3
+    other = {"file": ("test.png", _png_bytes(60), "image/png")}
+    assert client.post("/print", files=other, headers=headers).status_code == 422
+
+
+def test_print_retries_after_failure(tmp_path, monkeypatch):
+    import subprocess
+
+    monkeypatch.setenv("DITHERBOOTH_CONFIG_PATH", str(tmp_path / "cfg.json"))
+    import ditherbooth.app as app_module
+
+    importlib.reload(app_module)
+    client = TestClient(app_module.app)
+    attempts = []
+
+    def flaky_spool(name, payload):
+        attempts.append(payload)
+        if len(attempts) == 1:
+            raise subprocess.CalledProcessError(1, ["lpr"])
+
+    monkeypatch.setattr(app_module, "spool_raw", flaky_spool)
+    files = {"file": ("test.png", _png_bytes(), "image/png")}
+    headers = {"Idempotency-Key": "retry-me"}
+    assert client.post("/print", files=files, headers=headers).status_code == 502
+    res = client.post("/print", files=files, headers=headers)
+    assert res.status_code == 200
+    assert "Idempotent-Replayed" not in res.headers
+    assert len(attempts) == 2
+
+
+def test_startup_warm_up_is_optional(tmp_path, monkeypatch):
+    monkeypatch.setenv("DITHERBOOTH_CONFIG_PATH", str(tmp_path / "cfg.json"))
+    import ditherbooth.app as app_module
+
+    importlib.reload(app_module)
+    spooled = []
+    monkeypatch.setattr(
+        app_module, "spool_raw", lambda name, payload: spooled.append(payload)
+    )
+
+    # Runs the real pipeline without caching or printing anything
+    app_module.warm_up()
+    assert len(app_module._raster_cache) == 0
+    assert spooled == []
+
+    calls = []
+    monkeypatch.setattr(app_module, "warm_up", lambda: calls.append(1))
+    with TestClient(app_module.app):
+        pass
+    assert calls == []
+    monkeypatch.setenv("DITHERBOOTH_WARMUP", "1")
+    with TestClient(app_module.app) as client:
+        assert calls == [1]
+        assert client.get("/api/public-config").status_code == 200
+
+
+def test_app_import_leaves_drawing_modules_unloaded():
+    import subprocess
+    import sys
+
+    code = (
+        "import sys, ditherbooth.app; "
+        "print([m for m in ('PIL.ImageDraw', 'PIL.ImageFont', 'ditherbooth.imaging.render') if m in sys.modules])"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert out.stdout.strip() == "[]"
+
+
+def test_printer_status_asked_in_job_language_and_not_on_devices(tmp_path, monkeypatch):
+    from ditherbooth.printer.status import PrinterStatus
+
+    monkeypatch.setenv("DITHERBOOTH_CONFIG_PATH", str(tmp_path / "cfg.json"))
+    import ditherbooth.app as app_module
+
+    importlib.reload(app_module)
+    client = TestClient(app_module.app)
+    monkeypatch.setattr(app_module, "spool_raw", lambda name, payload: None)
+    asked = []
+
+    def query_status(name, lang):
+        asked.append((name, lang))
+        return PrinterStatus(online=True, source=lang.lower())
+
+    monkeypatch.setattr(app_module, "query_status", query_status)
+    files = {"file": ("test.png", _png_bytes(), "image/png")}
+
+    app_module.write_config(
+        {
+            **app_module.DEFAULT_CONFIG,
+            "printer_name": "tcp://printer:9100",
+            "default_lang": "EPL",
+        }
+    )
+    assert client.post("/print", files=files, data={"lang": "ZPL"}).status_code == 200
+    assert asked == [("tcp://printer:9100", "ZPL")]
+
+    # Devices are only polled when asked to
+    app_module.write_config(
+        {**app_module.DEFAULT_CONFIG, "printer_name": "/dev/usb/lp0"}
+    )
+    assert (
+        client.post(
+            "/print", files={"file": ("test.png", _png_bytes(1), "image/png")}
+        ).status_code
+        == 200
+    )
+    assert len(asked) == 1
+    app_module.write_config(
+        {
+            **app_module.DEFAULT_CONFIG,
+            "printer_name": "/dev/usb/lp0",
+            "printer_status_poll": True,
+        }
+    )
+    assert (
+        client.post(
+            "/print", files={"file": ("test.png", _png_bytes(2), "image/png")}
+        ).status_code
+        == 200
+    )
+    assert asked[1:] == [("/dev/usb/lp0", "EPL")]
+
+
+def test_print_waits_for_printer_and_tracks_job(tmp_path, monkeypatch):
+    from ditherbooth.printer.status import PrinterStatus
+
+    monkeypatch.setenv("DITHERBOOTH_CONFIG_PATH", str(tmp_path / "cfg.json"))
+    import ditherbooth.app as app_module
+
+    importlib.reload(app_module)
+    client = TestClient(app_module.app)
+    monkeypatch.setattr(app_module, "PRINTER_STATUS_TTL", 0.01)
+    app_module._printer_status.ttl = 0
+    spooled = []
+    monkeypatch.setattr(
+        app_module, "spool_raw", lambda name, payload: spooled.append(payload)
+    )
+    replies = [
+        PrinterStatus(online=True, source="zpl", paper_out=True, pending_jobs=0),
+        PrinterStatus(online=True, source="zpl", paper_out=False, pending_jobs=0),
+        PrinterStatus(online=True, source="zpl", pending_jobs=1),
+        PrinterStatus(online=True, source="zpl", pending_jobs=0),
+        PrinterStatus(online=True, source="zpl", pending_jobs=0),
+    ]
+    monkeypatch.setattr(app_module, "query_status", lambda name, lang: replies.pop(0))
+
+    # Held while the paper is out, sent once it is loaded
+    res = client.post("/print", files={"file": ("test.png", _png_bytes(), "image/png")})
+    assert res.status_code == 200
+    assert len(spooled) == 1
+    body = res.json()
+    assert body["eta_seconds"] > 0
+
+    status = client.get("/api/printer/status").json()
+    assert status["printer"]["pending_jobs"] == 1
+    assert [job["id"] for job in status["jobs"]] == [body["job_id"]]
+
+    # The printer reports its buffer empty: the job is done
+    job = client.get(f"/api/jobs/{body['job_id']}").json()
+    assert job["state"] == "done" and job["completion"] == "printer"
+    assert client.get("/api/jobs/unknown").status_code == 404
+
+    # A printer that stays blocked refuses the job
+    monkeypatch.setattr(app_module, "PRINTER_WAIT_TIMEOUT", 0)
+    monkeypatch.setattr(
+        app_module,
+        "query_status",
+        lambda name, lang: PrinterStatus(online=True, source="zpl", head_open=True),
+    )
+    res = client.post(
+        "/print", files={"file": ("test.png", _png_bytes(10), "image/png")}
+    )
+    assert res.status_code == 503
+    assert "head_open" in res.json()["detail"]
+    assert "Retry-After" in res.headers
+    assert len(spooled) == 1
+
+
+def test_heic_without_decoder_is_unsupported(tmp_path, monkeypatch):
+    from ditherbooth.imaging import decode
+
+    monkeypatch.setenv("DITHERBOOTH_CONFIG_PATH", str(tmp_path / "cfg.json"))
+    import ditherbooth.app as app_module
+
+    importlib.reload(app_module)
+    client = TestClient(app_module.app)
+    monkeypatch.setattr(decode, "_heif_available", lambda: False)
+
+    heic = b"\x00\x00\x00\x18ftypheic\x00\x00\x00\x00mif1heic" + b"\x00" * 64
+    res = client.post("/preview", files={"file": ("IMG_0001.HEIC", heic, "image/heic")})
+    assert res.status_code == 415
+    assert "pillow-heif" in res.json()["detail"]
+    res = client.post(
+        "/preview", files={"file": ("broken.jpg", b"garbage", "image/jpeg")}
+    )
+    assert res.status_code == 400
+
+
+def test_print_accepts_client_dithered_bitmap(tmp_path, monkeypatch):
+    from ditherbooth.imaging.process import to_1bit
+    from ditherbooth.imaging.raster import pack_1bit
+
+    monkeypatch.setenv("DITHERBOOTH_CONFIG_PATH", str(tmp_path / "cfg.json"))
+    import ditherbooth.app as app_module
+
+    importlib.reload(app_module)
+    client = TestClient(app_module.app)
+    called = []
+    monkeypatch.setattr(
+        app_module, "spool_raw", lambda name, payload: called.append(payload)
+    )
+    monkeypatch.setattr(
+        app_module,
+        "to_1bit",
+        lambda *a, **k: pytest.fail("server dithered a packed upload"),
+    )
+
+    # Same bytes to the printer as when the server dithers the image
+    img = to_1bit(_png_bytes(90), 463)
+    bits = pack_1bit(img)
+    data = {
+        "media": "continuous58",
+        "lang": "EPL",
+        "packed": "true",
+        "height": str(img.height),
+    }
+    res = client.post(
+        "/print",
+        files={"file": ("label.bits", bits, "application/octet-stream")},
+        data=data,
+    )
+    assert res.status_code == 200
+    expected = app_module.encode_payload(
+        app_module.PackedRaster.from_image(img),
+        app_module.Media.continuous58,
+        app_module.Lang.EPL,
+        app_module.load_config(),
+    )
+    assert called == [expected]
+
+    # Dimensions are checked against the media
+    res = client.post(
+        "/print",
+        files={"file": ("label.bits", bits[:-1], "application/octet-stream")},
+        data=data,
+    )
+    assert res.status_code == 400
+    data["height"] = str(img.height + 1)
+    res = client.post(
+        "/print",
+        files={"file": ("label.bits", bits, "application/octet-stream")},
+        data=data,
+    )
+    assert res.status_code == 400
+    tall = bytes(100 * 300)
+    data = {"media": "label50x30", "packed": "true"}
+    res = client.post(
+        "/print",
+        files={"file": ("label.bits", tall, "application/octet-stream")},
+        data=data,
+    )
+    assert res.status_code == 400
+    assert "taller" in res.json()["detail"]
+
+    # Bits at the media width cannot be turned to suit auto_rotate
+    client.put(
+        "/api/dev/settings",
+        headers={"X-Dev-Password": "dev"},
+        json={"auto_rotate": "area"},
+    )
+    assert client.get("/api/public-config").json()["auto_rotate"] == "area"
+    res = client.post(
+        "/print",
+        files={"file": ("label.bits", bits, "application/octet-stream")},
+        data={**data, "media": "continuous58", "height": str(img.height)},
+    )
+    assert res.status_code == 400
+    assert "auto_rotate" in res.json()["detail"]
+    assert len(called) == 1
+
+
+def test_tone_calibration_applies_per_media(tmp_path, monkeypatch):
+    from PIL import Image
+    import io
+
+    monkeypatch.setenv("DITHERBOOTH_CONFIG_PATH", str(tmp_path / "cfg.json"))
+    import ditherbooth.app as app_module
+
+    importlib.reload(app_module)
+    client = TestClient(app_module.app)
+    headers = {"X-Dev-Password": "dev"}
+    client.put("/api/dev/settings", headers=headers, json={"test_mode": True})
+
+    res = client.post("/api/calibration/label50x30/wedge", headers=headers)
+    assert res.status_code == 200
+    assert res.json()["mode"] == "test" and len(res.json()["wedge_levels"]) == 11
+    res = client.post(
+        "/api/calibration/label50x30/wedge", headers=headers, json={"print": False}
+    )
+    assert res.headers["content-type"] == "image/png"
+
+    def white(media):
+        files = {"file": ("gray.png", _png_bytes(128), "image/png")}
+        res = client.post("/preview", files=files, data={"media": media})
+        return Image.open(io.BytesIO(res.content)).convert("L").histogram()[255]
+
+    before = white("label50x30")
+    response = [0, 2, 5, 10, 18, 28, 40, 54, 68, 84, 100]
+    res = client.put(
+        "/api/calibration/label50x30", headers=headers, json={"response": response}
+    )
+    assert res.status_code == 200 and len(res.json()["lut"]) == 256
+    assert white("label50x30") > before
+    assert client.get("/api/calibration", headers=headers).json()["curves"].keys() == {
+        "label50x30"
+    }
+
+    assert (
+        client.put(
+            "/api/calibration/label50x30", headers=headers, json={"response": [1, 2]}
+        ).status_code
+        == 400
+    )
+    assert (
+        client.put("/api/calibration/label50x30", json={"gamma": 1.2}).status_code
+        == 401
+    )
+    client.delete("/api/calibration/label50x30", headers=headers)
+    assert white("label50x30") == before
+    assert app_module.DEFAULT_CONFIG["tone_curves"] == {}
+
+
+def test_recalibrating_reprints_and_reaches_client_dither(tmp_path, monkeypatch):
+    monkeypatch.setenv("DITHERBOOTH_CONFIG_PATH", str(tmp_path / "cfg.json"))
+    import ditherbooth.app as app_module
+
+    importlib.reload(app_module)
+    client = TestClient(app_module.app)
+    called = []
+    monkeypatch.setattr(
+        app_module, "spool_raw", lambda name, payload: called.append(payload)
+    )
+    headers = {"X-Dev-Password": "dev"}
+    assert client.get("/api/public-config").json()["tone_curves"] == {}
+
+    def send():
+        files = {"file": ("gray.png", _png_bytes(128), "image/png")}
+        return client.post("/print", files=files, data={"media": "label50x30"})
+
+    send()
+    response = [0, 2, 5, 10, 18, 28, 40, 54, 68, 84, 100]
+    lut = client.put(
+        "/api/calibration/label50x30", headers=headers, json={"response": response}
+    ).json()["lut"]
+    assert "Idempotent-Replayed" not in send().headers
+    assert len(called) == 2 and called[0] != called[1]
+    assert client.get("/api/public-config").json()["tone_curves"] == {"label50x30": lut}
+
+
+def test_unfinished_jobs_are_replayed_on_startup(tmp_path, monkeypatch):
+    import time
+    from ditherbooth.journal import JobJournal
+
+    # A previous run journaled a job and died before spooling it
+    journal = JobJournal(tmp_path / "journal.log")
+    journal.open()
+    list(
+        journal.record(
+            "lost",
+            {"media": "label50x30", "lang": "ZPL", "rows": 240},
+            iter([b"^XA", b"^XZ"]),
+        )
+    )
+    journal.close()
+
+    monkeypatch.setenv("DITHERBOOTH_CONFIG_PATH", str(tmp_path / "cfg.json"))
+    import ditherbooth.app as app_module
+
+    importlib.reload(app_module)
+    spooled = []
+    monkeypatch.setattr(
+        app_module, "spool_raw", lambda name, payload: spooled.append(b"".join(payload))
+    )
+    with TestClient(app_module.app):
+        deadline = time.monotonic() + 5
+        while not spooled and time.monotonic() < deadline:
+            time.sleep(0.01)
+    assert spooled == [b"^XA^XZ"]
+    assert JobJournal(tmp_path / "journal.log").open() == []
+
+
+def test_shared_state_queues_prints_for_elected_spooler(tmp_path, monkeypatch):
+    import io
+    import time
+    from PIL import Image
+    from ditherbooth.shared import PrintQueue
+
+    monkeypatch.setenv("DITHERBOOTH_CONFIG_PATH", str(tmp_path / "cfg.json"))
+    monkeypatch.setenv("DITHERBOOTH_SHARED_STATE", "1")
+    monkeypatch.setenv("DITHERBOOTH_SHARED_CACHE_PATH", str(tmp_path / "cache.db"))
+    import ditherbooth.app as app_module
+
+    importlib.reload(app_module)
+    monkeypatch.setattr(app_module, "SPOOLER_LEASE_SECONDS", 0.5)
+    spooled = []
+    monkeypatch.setattr(
+        app_module, "spool_raw", lambda name, payload: spooled.append(payload)
+    )
+    app_module.write_config({**app_module.DEFAULT_CONFIG, "printer_status_poll": False})
+
+    # Another worker is spooling and has queued a job ahead of ours
+    queue = PrintQueue(tmp_path / "state.db")
+    assert queue.acquire("Zebra_LP2844", "other-worker", ttl=0.5)
+    queue.enqueue(
+        "earlier",
+        "Zebra_LP2844",
+        {"media": "label50x30", "lang": "EPL", "rows": 240},
+        b"EARLIER",
+    )
+
+    buf = io.BytesIO()
+    Image.new("RGB", (400, 240), "gray").save(buf, format="PNG")
+    files = {"file": ("label.png", buf.getvalue(), "image/png")}
+    data = {"media": "label50x30", "lang": "EPL"}
+    with TestClient(app_module.app) as client:
+        # Results may not reach a stream on another worker
+        assert client.get("/api/public-config").json()["async_prints"] is False
+        start = time.monotonic()
+        resp = client.post("/print", files=files, data=data)
+        assert resp.status_code == 200
+        # Held until the other worker's lease ran out, then spooled in order
+        assert time.monotonic() - start >= 0.3
+        assert spooled[0] == b"EARLIER" and spooled[1].startswith(b"N\n")
+        job_id = resp.json()["job_id"]
+        assert client.get(f"/api/jobs/{job_id}").json()["state"] in ("printing", "done")
+        assert queue.job("earlier")["state"] == "spooled"
+
+        # A repeat on any worker is answered from the shared queue
+        again = client.post("/print", files=files, data=data)
+        assert (
+            again.headers.get("Idempotent-Replayed") == "true"
+            and again.json()["job_id"] == job_id
+        )
+        assert len(spooled) == 2
+
+        # The raster is in the shared cache for the other workers
+        app_module._raster_cache.clear()
+        monkeypatch.setattr(app_module, "to_1bit", lambda *a, **k: 1 / 0)
+        assert (
+            client.post("/print", files=files, data={**data, "lang": "ZPL"}).status_code
+            == 200
+        )
+        assert spooled[2].startswith(b"^XA")
+
+
+def test_shared_duplicate_takes_over_a_dead_workers_claim(tmp_path, monkeypatch):
+    import time
+    from ditherbooth.shared import PrintQueue
+
+    monkeypatch.setenv("DITHERBOOTH_CONFIG_PATH", str(tmp_path / "cfg.json"))
+    monkeypatch.setenv("DITHERBOOTH_SHARED_STATE", "1")
+    monkeypatch.setenv("DITHERBOOTH_SHARED_CACHE_PATH", str(tmp_path / "cache.db"))
+    import ditherbooth.app as app_module
+
+    importlib.reload(app_module)
+    monkeypatch.setattr(app_module, "DUPLICATE_WAIT_TIMEOUT", 0.3)
+    spooled = []
+    monkeypatch.setattr(
+        app_module, "spool_raw", lambda name, payload: spooled.append(payload)
+    )
+    app_module.write_config(
+        {
+            **app_module.DEFAULT_CONFIG,
+            "printer_status_poll": False,
+            "print_dedup_seconds": 0,
+        }
+    )
+
+    # Another worker claimed the key and died before settling it
+    image = _png_bytes()
+    fingerprint = app_module.print_fingerprint(
+        image, app_module.Media.label50x30, app_module.Lang.EPL
+    )
+    queue = PrintQueue(tmp_path / "state.db")
+    key = app_module.shared_key(("key", "stuck"))
+    assert queue.claim(key, fingerprint, app_module.IDEMPOTENCY_TTL) is None
+
+    files = {"file": ("test.png", image, "image/png")}
+    data = {"media": "label50x30", "lang": "EPL"}
+    with TestClient(app_module.app) as client:
+        start = time.monotonic()
+        resp = client.post(
+            "/print", files=files, data=data, headers={"Idempotency-Key": "stuck"}
+        )
+        assert resp.status_code == 200 and "Idempotent-Replayed" not in resp.headers
+        assert time.monotonic() - start >= 0.3
+        assert len(spooled) == 1
+    assert queue.claim_result(key) == resp.json()
+
+
+def test_profile_captures_next_print_and_preview_requests(tmp_path, monkeypatch):
+    monkeypatch.setenv("DITHERBOOTH_CONFIG_PATH", str(tmp_path / "cfg.json"))
+    import ditherbooth.app as app_module
+
+    importlib.reload(app_module)
+    client = TestClient(app_module.app)
+    headers = {"X-Dev-Password": "dev"}
+    client.put("/api/dev/settings", headers=headers, json={"test_mode": True})
+
+    from PIL import Image
+    import io
+
+    buf = io.BytesIO()
+    Image.radial_gradient("L").resize((1600, 2400)).save(buf, format="PNG")
+    files = {"file": ("photo.png", buf.getvalue(), "image/png")}
+    data = {"media": "label100x150", "lang": "ZPL"}
+
+    assert (
+        client.post(
+            "/api/dev/profile", json={"requests": 0}, headers=headers
+        ).status_code
+        == 400
+    )
+    assert client.post("/api/dev/profile").status_code == 401
+    resp = client.post(
+        "/api/dev/profile", json={"requests": 2, "interval_ms": 1}, headers=headers
+    )
+    assert resp.json()["state"] == "armed"
+    assert client.post("/api/dev/profile", headers=headers).status_code == 409
+
+    assert client.post("/preview", files=files, data=data).status_code == 200
+    assert client.get("/api/dev/profile", headers=headers).json()["state"] == "running"
+    assert client.post("/print", files=files, data=data).status_code == 200
+    status = client.get("/api/dev/profile", headers=headers).json()
+    assert (
+        status["state"] == "done"
+        and status["requests_finished"] == 2
+        and status["samples"] > 0
+    )
+
+    # Threadpool work is in the stacks
+    folded = client.get("/api/dev/profile/result?format=collapsed", headers=headers)
+    assert "ditherbooth/imaging/process.py" in folded.text
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in folded.text.splitlines())
+    scope = client.get("/api/dev/profile/result", headers=headers)
+    assert "speedscope.json" in scope.headers["content-disposition"]
+    profile = scope.json()["profiles"][0]
+    assert profile["type"] == "sampled" and len(profile["samples"]) == len(
+        profile["weights"]
+    )
+
+    # A new capture can start once the last one is done
+    assert client.post("/api/dev/profile", headers=headers).status_code == 200
+    assert client.delete("/api/dev/profile", headers=headers).json()["state"] == "done"
+
+
+def test_events_stream_pushes_progress_of_accepted_print(tmp_path, monkeypatch):
+    import asyncio
+    import json
+
+    import httpx
+
+    monkeypatch.setenv("DITHERBOOTH_CONFIG_PATH", str(tmp_path / "cfg.json"))
+    import ditherbooth.app as app_module
+
+    importlib.reload(app_module)
+    monkeypatch.setattr(
+        app_module, "printer_status", lambda cfg, lang=None: asyncio.sleep(0)
+    )
+    spooled = []
+    monkeypatch.setattr(
+        app_module, "spool_raw", lambda name, payload: spooled.append(payload)
+    )
+
+    async def open_stream(client_id, body, disconnect):
+        # TestClient buffers whole responses, so the endless stream is read over raw ASGI.
+        async def receive():
+            await disconnect.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            body.extend(message.get("body", b""))
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": "/api/events",
+            "raw_path": b"/api/events",
+            "query_string": f"client={client_id}".encode(),
+            "headers": [],
+            "client": ("127.0.0.1", 1),
+            "server": ("testserver", 80),
+            "root_path": "",
+        }
+        await app_module.app(scope, receive, send)
+
+    def events(body):
+        parsed = []
+        for block in bytes(body).decode().split("\n\n"):
+            fields = dict(
+                line.split(": ", 1)
+                for line in block.splitlines()
+                if ": " in line and line[0] != ":"
+            )
+            if "event" in fields:
+                parsed.append((fields["event"], json.loads(fields["data"])))
+        return parsed
+
+    async def scenario():
+        mine, theirs = bytearray(), bytearray()
+        disconnect = asyncio.Event()
+        streams = [
+            asyncio.create_task(open_stream(c, b, disconnect))
+            for c, b in (("k1", mine), ("k2", theirs))
+        ]
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as http:
+            await asyncio.sleep(0.05)
+            res = await http.post(
+                "/print",
+                files={"file": ("test.png", _png_bytes(), "image/png")},
+                data={"wait": "false"},
+                headers={"X-Client-Id": "k1"},
+            )
+            assert res.status_code == 202
+            job_id = res.json()["job_id"]
+            for _ in range(200):
+                if any(kind == "result" for kind, _ in events(mine)):
+                    break
+                await asyncio.sleep(0.01)
+        disconnect.set()
+        await asyncio.gather(*streams)
+        assert not app_module._events.subscribers
+        return job_id, events(mine), events(theirs)
+
+    job_id, mine, theirs = asyncio.run(scenario())
+    assert len(spooled) == 1
+    assert [d["stage"] for kind, d in mine if kind == "stage"] == [
+        "admitted",
+        "dithered",
+        "encoded",
+        "sent",
+    ]
+    states = [d["state"] for kind, d in mine if kind == "job" and d["id"] == job_id]
+    assert states == ["queued", "printing"]
+    result = next(d for kind, d in mine if kind == "result")
+    assert (
+        result["job_id"] == job_id
+        and result["result"]["job_id"] == job_id
+        and not result["replayed"]
+    )
+    # Other kiosks only see the queue, not this kiosk's job
+    assert {kind for kind, _ in theirs} == {"queue"}
+
+
+def test_recent_prints_reprint_without_dithering(tmp_path, monkeypatch):
+    import asyncio
+    import time
+
+    monkeypatch.setenv("DITHERBOOTH_CONFIG_PATH", str(tmp_path / "cfg.json"))
+    monkeypatch.setenv("DITHERBOOTH_RECENT_PRINTS", "2")
+    monkeypatch.setenv("DITHERBOOTH_PRINT_RATE", "0")
+    import ditherbooth.app as app_module
+
+    importlib.reload(app_module)
+    spooled = []
+    monkeypatch.setattr(
+        app_module, "spool_raw", lambda name, payload: spooled.append(payload)
+    )
+    monkeypatch.setattr(
+        app_module, "printer_status", lambda cfg, lang=None: asyncio.sleep(0)
+    )
+
+    # One event loop throughout, for the prints kept in the background
+    with TestClient(app_module.app) as client:
+        headers = {"X-Dev-Password": "dev"}
+        data = {"media": "label50x30", "lang": "ZPL"}
+        ids = []
+        for shade in (0, 60, 120):
+            res = client.post(
+                "/print",
+                files={"file": ("photo.png", _png_bytes(shade), "image/png")},
+                data=data,
+            )
+            ids.append(res.json()["job_id"])
+            # Kept after the response, one print at a time
+            for _ in range(200):
+                if not app_module._remembering:
+                    break
+                time.sleep(0.01)
+        prints = client.get("/api/recent", headers=headers).json()["prints"]
+        assert [p["id"] for p in prints] == ids[:0:-1]
+        assert prints[0]["media"] == "label50x30" and prints[0]["lang"] == "ZPL"
+        thumb = client.get(prints[0]["thumbnail"], headers=headers)
+        assert thumb.headers["content-type"] == "image/png"
+        # Guests' photos are not listed to anyone on the network
+        assert client.get("/api/recent").status_code == 401
+        assert client.get(prints[0]["thumbnail"]).status_code == 401
+
+        # Straight from the stored raster: nothing is decoded or dithered
+        monkeypatch.setattr(
+            app_module, "get_raster", lambda *args: pytest.fail("dithered again")
+        )
+        res = client.post(f"/api/recent/{ids[1]}/reprint")
+        assert res.status_code == 200
+        body = res.json()
+        assert body["reprint_of"] == ids[1] and body["job_id"] != ids[1]
+        assert spooled[-1] == spooled[1]
+        assert client.post(f"/api/recent/{ids[0]}/reprint").status_code == 404
+
+        assert client.delete("/api/recent").status_code == 401
+        assert client.delete("/api/recent", headers=headers).status_code == 200
+        assert client.get("/api/recent", headers=headers).json()["prints"] == []
+
+        # Test-mode prints are not kept
+        client.put("/api/dev/settings", headers=headers, json={"test_mode": True})
+        bits = {"file": ("label.bits", bytes(50 * 240), "application/octet-stream")}
+        res = client.post(
+            "/print", files=bits, data={**data, "packed": "true", "height": "240"}
+        )
+        assert res.json()["mode"] == "test" and not app_module._remembering
+        assert client.get("/api/recent", headers=headers).json()["prints"] == []
@@ -0,0 +1,60 @@
+from PIL import Image
+
+from ditherbooth import batch
+from ditherbooth.app import (
+    DEFAULT_CONFIG,
+    Lang,
+    Media,
+    encode_payload,
+    get_raster,
+    media_box,
+)
+
+
+def test_batch_converts_and_spools_in_order(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv("DITHERBOOTH_CONFIG_PATH", str(tmp_path / "cfg.json"))
+    images = tmp_path / "images"
+    images.mkdir()
+    for name, shade in (("b", 60), ("a", 200)):
+        Image.linear_gradient("L").resize((120, 80)).point(
+            lambda v: min(255, v + shade)
+        ).save(images / f"{name}.png")
+    (images / "notes.txt").write_text("not an image")
+    out = tmp_path / "out"
+
+    spooled = []
+    monkeypatch.setattr(
+        batch, "spool_raw", lambda printer, payload: spooled.append(payload)
+    )
+    assert (
+        batch.main(
+            [
+                "convert",
+                str(images),
+                "--media",
+                "label50x30",
+                "--lang",
+                "ZPL",
+                "--out",
+                str(out),
+                "--jobs",
+                "2",
+                "--spool",
+            ]
+        )
+        == 0
+    )
+
+    assert sorted(p.name for p in out.iterdir()) == ["a.png", "a.zpl", "b.png", "b.zpl"]
+    width, max_height = media_box(Media.label50x30, DEFAULT_CONFIG)
+    raster = get_raster((images / "a.png").read_bytes(), width, max_height)
+    assert (out / "a.zpl").read_bytes() == encode_payload(
+        raster, Media.label50x30, Lang.ZPL, DEFAULT_CONFIG
+    )
+    assert spooled == [(out / "a.zpl").read_bytes(), (out / "b.zpl").read_bytes()]
+    assert "2 of 2 images" in capsys.readouterr().out
+
+    # Printing later reads the files back as they are
+    spooled.clear()
+    assert batch.main(["spool", str(out / "*.zpl"), "--printer", "/dev/null"]) == 0
+    assert spooled == [(out / "a.zpl").read_bytes(), (out / "b.zpl").read_bytes()]
@@ -1,4 +1,5 @@
-from ditherbooth.imaging.process import to_1bit
+from ditherbooth.imaging.process import to_1bit, to_1bit_ordered
+from ditherbooth.imaging.raster import pack_1bit
 from PIL import Image
 import io
 
@@ -13,3 +14,299 @@ def test_to_1bit_converts_and_resizes():
     pixels = result.load()
     assert pixels[0, 0] == 0
     assert pixels[19, 9] == 0
+
+
+def test_to_1bit_ordered_is_low_resolution():
+    img = Image.new("L", (100, 50), 128)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    result = to_1bit_ordered(buf.getvalue(), 200, scale=2)
+    assert result.mode == "1"
+    assert result.size == (100, 50)
+    # Mid-gray comes out as a roughly even checker of black and white
+    black = result.histogram()[0]
+    assert 0.4 < black / (100 * 50) < 0.6
+
+
+def test_pack_1bit_sets_bits_for_white():
+    img = Image.new("1", (10, 2), 0)
+    img.putpixel((0, 0), 255)
+    img.putpixel((9, 1), 255)
+    assert pack_1bit(img) == b"\x80\x00\x00\x40"
+
+
+def test_trim_bottom_white_on_packed_raster():
+    from ditherbooth.imaging.raster import PackedRaster, trim_bottom_white
+
+    img = Image.new("1", (16, 40), 255)
+    for x in range(16):
+        img.putpixel((x, 9), 0)
+    # A lone speck further down is not treated as content
+    img.putpixel((3, 30), 0)
+    trimmed = trim_bottom_white(PackedRaster.from_image(img), margin=2)
+    assert trimmed.height == 12
+    assert trimmed.to_image().tobytes() == img.crop((0, 0, 16, 12)).tobytes()
+
+
+def test_rotate_90_on_packed_bits_matches_pillow():
+    from ditherbooth.imaging.raster import PackedRaster, center_rows, rotate_90
+
+    # Odd sizes exercise the row padding bits and partial 8x8 blocks
+    img = Image.effect_noise((21, 13), 80).convert("1")
+    raster = PackedRaster.from_image(img)
+    assert rotate_90(raster) == PackedRaster.from_image(
+        img.transpose(Image.Transpose.ROTATE_270)
+    )
+    assert rotate_90(raster, clockwise=False) == PackedRaster.from_image(
+        img.transpose(Image.Transpose.ROTATE_90)
+    )
+
+    padded = center_rows(raster, 18)
+    expected = Image.new("1", (21, 18), 1)
+    expected.paste(img, (0, 2))
+    assert padded == PackedRaster.from_image(expected)
+
+
+def test_band_density_counts_black_per_band():
+    from ditherbooth.imaging.raster import PackedRaster, band_density
+
+    img = Image.new("1", (10, 6), 1)
+    img.paste(0, (0, 0, 10, 2))
+    img.paste(0, (0, 4, 5, 5))
+    assert band_density(PackedRaster.from_image(img), band_rows=4) == [0.5, 0.25]
+
+
+def _gradient_png(width, height):
+    img = Image.linear_gradient("L").resize((width, height))
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_iter_1bit_bands_matches_full_conversion():
+    from ditherbooth.imaging.process import iter_1bit_bands
+
+    img_bytes = _gradient_png(300, 1000)
+    full = to_1bit(img_bytes, 200)
+    bands = list(iter_1bit_bands(img_bytes, 200, band_rows=64))
+    assert all(b.mode == "1" and b.width == 200 for b in bands)
+    assert sum(b.height for b in bands) == full.height
+    stitched = Image.new("1", full.size)
+    top = 0
+    for band in bands:
+        stitched.paste(band, (0, top))
+        top += band.height
+    # The overlap settles error diffusion before each boundary, so tone matches per strip
+    for y in range(0, full.height - 64, 64):
+        box = (0, y, 200, y + 64)
+        a = full.crop(box).histogram()[0]
+        b = stitched.crop(box).histogram()[0]
+        assert abs(a - b) <= 0.02 * 200 * 64
+
+
+def test_iter_1bit_bands_boundary_rows_match_full_conversion():
+    from PIL import ImageChops
+
+    from ditherbooth.imaging.process import iter_1bit_bands
+
+    img_bytes = _gradient_png(300, 1000)
+    full = to_1bit(img_bytes, 200)
+
+    def stitched(overlap_rows):
+        out = Image.new("1", full.size)
+        top = 0
+        for band in iter_1bit_bands(
+            img_bytes, 200, band_rows=64, overlap_rows=overlap_rows
+        ):
+            out.paste(band, (0, top))
+            top += band.height
+        return out
+
+    def black(img, y):
+        return 200 - img.crop((0, y, 200, y + 1)).histogram()[255]
+
+    def mismatch(img, rows):
+        diff = ImageChops.logical_xor(full, img)
+        return sum(diff.crop((0, y, 200, y + 1)).histogram()[255] for y in rows) / (
+            200 * len(rows)
+        )
+
+    boundaries = range(64, full.height, 64)
+    edge = [y + d for y in boundaries for d in range(-2, 3) if y + d < full.height]
+    inner = [y for y in range(full.height) if 16 <= y % 64 < 48]
+
+    banded = stitched(32)
+    # Dots don't line up pixel for pixel: Floyd-Steinberg is chaotic, and
+    # about a third of them differ between any two runs that start from
+    # different error states, inside strips as much as at their edges. The
+    # rows around a boundary must be no worse than that, and each must stay
+    # within 12% of the width (24 dots) of the one-pass row's black count.
+    assert mismatch(banded, edge) <= mismatch(banded, inner) + 0.06
+    assert max(abs(black(banded, y) - black(full, y)) for y in edge) <= 24
+    # Restarting each strip from no error at all leaves a visible seam
+    assert max(abs(black(stitched(0), y) - black(full, y)) for y in edge) > 24
+
+
+def test_iter_1bit_bands_reduces_large_sources():
+    from ditherbooth.imaging.process import DRAFT_GAP, _reduce_source, iter_1bit_bands
+
+    # Kept at no more than DRAFT_GAP times the output (and never below it)
+    src = Image.new("L", (2000, 6000))
+    small = _reduce_source(src, (200, 600))
+    assert 200 * DRAFT_GAP <= small.width < 200 * DRAFT_GAP * 2
+    assert _reduce_source(src, (900, 2700)) is src
+
+    img_bytes = _gradient_png(2000, 6000)
+    full = to_1bit(img_bytes, 200)
+    bands = list(iter_1bit_bands(img_bytes, 200, band_rows=64))
+    assert sum(b.height for b in bands) == full.height
+    black = sum(b.histogram()[0] for b in bands)
+    assert abs(black - full.histogram()[0]) <= 0.01 * full.width * full.height
+
+
+def test_banded_conversion_bounds_peak_memory(tmp_path):
+    # Peak RSS is only meaningful per process, so measure each path in its own
+    # interpreter: a 463x40000 output dithered in one go vs. in strips.
+    import subprocess
+    import sys
+
+    import pytest
+
+    pytest.importorskip("resource")
+    src = tmp_path / "tall.png"
+    src.write_bytes(_gradient_png(463, 40000))
+    script = (
+        "import resource, sys\n"
+        "from ditherbooth.imaging.process import iter_1bit_bands, to_1bit\n"
+        "from ditherbooth.imaging.raster import PackedRaster\n"
+        "data = open(sys.argv[2], 'rb').read()\n"
+        "base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss\n"
+        "if sys.argv[1] == 'banded':\n"
+        "    PackedRaster.from_bands(iter_1bit_bands(data, 463))\n"
+        "else:\n"
+        "    PackedRaster.from_image(to_1bit(data, 463))\n"
+        "unit = 1024 if sys.platform == 'darwin' else 1\n"
+        "print((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base) // unit)\n"
+    )
+
+    def peak(mode):
+        out = subprocess.run(
+            [sys.executable, "-c", script, mode, str(src)],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return int(out.stdout.strip())
+
+    # Both paths hold the decoded 8-bit source; beyond that, the full path
+    # holds full-size resized and 1-bit copies while strips hold a few rows.
+    source_kb = 463 * 40000 // 1024
+    full = peak("full") - source_kb
+    banded = peak("banded") - source_kb
+    assert banded < full / 3
+
+
+def _jpeg_with_thumbnail(main, thumb):
+    import struct
+
+    buf = io.BytesIO()
+    thumb.save(buf, format="JPEG")
+    thumb_bytes = buf.getvalue()
+    # TIFF header, IFD0 with Orientation=1, then IFD1 pointing at the thumbnail.
+    tiff = b"II*\x00" + struct.pack("<I", 8)
+    tiff += (
+        struct.pack("<H", 1)
+        + struct.pack("<HHIHH", 0x0112, 3, 1, 1, 0)
+        + struct.pack("<I", 26)
+    )
+    tiff += (
+        struct.pack("<H", 2)
+        + struct.pack("<HHII", 0x0201, 4, 1, 56)
+        + struct.pack("<HHII", 0x0202, 4, 1, len(thumb_bytes))
+    )
+    tiff += struct.pack("<I", 0) + thumb_bytes
+    buf = io.BytesIO()
+    main.save(buf, format="JPEG", exif=b"Exif\x00\x00" + tiff)
+    return buf.getvalue()
+
+
+def test_sniff_format_from_magic_bytes():
+    from ditherbooth.imaging.decode import sniff_format
+
+    img = Image.new("RGB", (8, 8))
+    for fmt in ("JPEG", "PNG", "WEBP", "GIF", "BMP", "TIFF"):
+        buf = io.BytesIO()
+        img.save(buf, format=fmt)
+        assert sniff_format(buf.getvalue()) == fmt
+    assert sniff_format(b"\x00\x00\x00\x18ftypheic\x00\x00\x00\x00mif1heic") == "HEIF"
+    assert (
+        sniff_format(b"\x00\x00\x00\x1cftypavif\x00\x00\x00\x00avifmif1miaf") == "AVIF"
+    )
+    assert sniff_format(b"not an image") is None
+
+
+def test_jpeg_decodes_at_reduced_scale_to_same_output_size():
+    img = Image.linear_gradient("L").resize((1600, 1200)).convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG")
+    result = to_1bit(buf.getvalue(), 200)
+    assert result.size == (200, 150)
+    # Dark at the top, light at the bottom, as in the full-size decode
+    top = result.crop((0, 0, 200, 20)).histogram()[0]
+    bottom = result.crop((0, 130, 200, 150)).histogram()[0]
+    assert top > 0.8 * 200 * 20 and bottom < 0.2 * 200 * 20
+
+
+def test_ordered_preview_can_use_exif_thumbnail():
+    from ditherbooth.imaging.decode import exif_thumbnail, open_image
+
+    data = _jpeg_with_thumbnail(
+        Image.new("RGB", (400, 300), "black"), Image.new("RGB", (160, 120), "white")
+    )
+    with open_image(data) as img:
+        assert exif_thumbnail(img).size == (160, 120)
+    # The stand-in thumbnail is white, the photo black
+    assert to_1bit_ordered(data, 200, thumbnail=True).histogram()[0] == 0
+    assert to_1bit_ordered(data, 200).histogram()[-1] == 0
+
+    # A thumbnail of another shape is ignored
+    data = _jpeg_with_thumbnail(
+        Image.new("RGB", (400, 200), "black"), Image.new("RGB", (160, 120), "white")
+    )
+    assert to_1bit_ordered(data, 200, thumbnail=True).histogram()[-1] == 0
+
+
+def test_tone_lut_from_measured_wedge():
+    from ditherbooth.imaging.tone import WEDGE_LEVELS, lut_from_gamma, lut_from_response
+
+    # A linear response needs no correction
+    linear = [level * 100 / 255 for level in WEDGE_LEVELS]
+    assert all(abs(v - i) <= 1 for i, v in enumerate(lut_from_response(linear)))
+
+    # Dot gain: midtones print too dark, so the curve lightens them
+    lut = lut_from_response([0, 2, 5, 10, 18, 28, 40, 54, 68, 84, 100])
+    assert lut[0] == 0 and lut[255] == 255
+    assert lut[128] > 160
+    assert lut == sorted(lut)
+    assert lut_from_gamma(1.0) == list(range(256))
+
+    img = Image.new("L", (40, 20), 128)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    plain = to_1bit(buf.getvalue(), 40).histogram()[-1]
+    corrected = to_1bit(buf.getvalue(), 40, lut=lut).histogram()[-1]
+    assert corrected > plain
+
+
+def test_resample_profiles_keep_output_size():
+    import pytest
+
+    data = _gradient_png(1000, 600)
+    best = to_1bit(data, 200)
+    for profile in ("fast", "balanced"):
+        result = to_1bit(data, 200, profile=profile)
+        assert result.size == best.size == (200, 120)
+        # Same tones: the share of white dots barely moves
+        assert abs(result.histogram()[-1] - best.histogram()[-1]) < 0.02 * 200 * 120
+    with pytest.raises(ValueError):
+        to_1bit(data, 200, profile="sharpest")
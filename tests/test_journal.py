@@ -0,0 +1,83 @@
+import os
+
+from ditherbooth.journal import JobJournal
+
+
+def test_journal_keeps_unfinished_jobs_across_restarts(tmp_path):
+    path = tmp_path / "journal.log"
+    journal = JobJournal(path)
+    assert journal.open() == []
+    assert journal.record("a", {"media": "continuous58"}, b"first") == b"first"
+    streamed = journal.record("b", {"media": "label50x30"}, iter([b"sec", b"ond"]))
+    assert list(streamed) == [b"sec", b"ond"]
+    journal.record("c", {}, b"third")
+    journal.mark("a", "spooled")
+    journal.mark("c", "failed")
+    journal.close()
+
+    # A crash mid-write leaves a torn record at the end
+    with open(path, "ab") as f:
+        f.write(b'{"op":"data","id":"b","size":100,"crc":0}\npartial')
+
+    journal = JobJournal(path)
+    assert journal.open() == ["b"]
+    assert journal.meta("b") == {"media": "label50x30"}
+    assert b"".join(journal.read("b")) == b"second"
+    journal.mark("b", "spooled")
+    journal.close()
+    assert JobJournal(path).open() == []
+    # Nothing left to keep, so the file was emptied
+    assert os.path.getsize(path) == 0
+
+
+def test_journal_compacts_to_unfinished_jobs(tmp_path):
+    path = tmp_path / "journal.log"
+    journal = JobJournal(path, compact_bytes=4096)
+    journal.open()
+    list(journal.record("live", {}, iter([b"x" * 1000, b"y" * 1000])))
+    reader = journal.read("live")
+    for i in range(10):
+        journal.record(f"done-{i}", {}, b"z" * 1000)
+        journal.mark(f"done-{i}", "spooled")
+    assert os.path.getsize(path) < 4096
+    # Readers opened before a compaction still see their data
+    assert b"".join(reader) == b"x" * 1000 + b"y" * 1000
+    assert b"".join(journal.read("live")) == b"x" * 1000 + b"y" * 1000
+    journal.close()
+
+    journal = JobJournal(path)
+    assert journal.open() == ["live"]
+    assert b"".join(journal.read("live")) == b"x" * 1000 + b"y" * 1000
+    journal.close()
+
+
+def test_journal_writes_streams_as_they_are_spooled(tmp_path):
+    path = tmp_path / "journal.log"
+    journal = JobJournal(path)
+    journal.open()
+    encoded = []
+
+    def encode():
+        for chunk in (b"head", b"body", b"tail"):
+            encoded.append(chunk)
+            yield chunk
+
+    # The first chunk is spooled before the rest is even encoded
+    stream = journal.record("s", {}, encode())
+    assert encoded == []
+    assert next(stream) == b"head"
+    assert encoded == [b"head"]
+    assert b"head" in path.read_bytes()
+
+    # Cut off mid-stream: the job was never complete, so it is not replayed
+    journal.close()
+    assert JobJournal(path).open() == []
+
+    journal = JobJournal(path)
+    journal.open()
+    assert list(journal.record("t", {}, encode())) == [b"head", b"body", b"tail"]
+    journal.close()
+    journal = JobJournal(path)
+    assert journal.open() == ["t"]
+    assert b"".join(journal.read("t")) == b"headbodytail"
+    journal.close()
@@ -41,3 +41,95 @@ def test_public_config_has_continuous80_and_label55x30():
     opts = data.get("media_options", [])
     assert "continuous80" in opts
     assert "label55x30" in opts
+
+
+def test_progressive_preview_streams_fast_then_final(monkeypatch):
+    import json
+
+    import ditherbooth.app as app_module
+
+    client = TestClient(app_module.app)
+
+    async def fake_run_in_threadpool(func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+    monkeypatch.setattr(app_module, "run_in_threadpool", fake_run_in_threadpool)
+
+    files = {"file": ("x.png", make_img_bytes(), "image/png")}
+    data = {"media": "continuous58", "session": "s1"}
+    res = client.post("/preview/progressive", files=files, data=data)
+    assert res.status_code == 200
+    frames = [json.loads(line) for line in res.text.splitlines() if line]
+    assert [f["stage"] for f in frames] == ["fast", "final"]
+    # The quick frame is half resolution, the final one is printer width
+    assert frames[0]["width"] == 463 // 2
+    assert frames[1]["width"] == 463
+    assert "s1" not in app_module._preview_sessions
+
+
+def test_progressive_preview_cancelled_by_newer_request(monkeypatch):
+    import json
+
+    import ditherbooth.app as app_module
+
+    client = TestClient(app_module.app)
+
+    async def fake_run_in_threadpool(func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+    real_to_1bit = app_module.to_1bit
+
+    def superseded_to_1bit(*args, **kwargs):
+        # Simulate a newer preview for the same session arriving mid-render
+        app_module._preview_sessions["s2"] = -1
+        return real_to_1bit(*args, **kwargs)
+
+    monkeypatch.setattr(app_module, "run_in_threadpool", fake_run_in_threadpool)
+    monkeypatch.setattr(app_module, "to_1bit", superseded_to_1bit)
+    app_module._raster_cache.clear()
+
+    files = {"file": ("x.png", make_img_bytes(), "image/png")}
+    data = {"media": "continuous58", "session": "s2"}
+    res = client.post("/preview/progressive", files=files, data=data)
+    assert res.status_code == 200
+    stages = [json.loads(line)["stage"] for line in res.text.splitlines() if line]
+    assert stages == ["fast", "cancelled"]
+    app_module._preview_sessions.pop("s2", None)
+
+
+def test_progressive_preview_invalid_image_returns_400(monkeypatch):
+    import ditherbooth.app as app_module
+
+    client = TestClient(app_module.app)
+    files = {"file": ("bad.bin", b"not_an_image", "application/octet-stream")}
+    res = client.post(
+        "/preview/progressive", files=files, data={"media": "continuous58"}
+    )
+    assert res.status_code == 400
+
+
+def test_preview_raw_bitmap_negotiation(monkeypatch):
+    import ditherbooth.app as app_module
+
+    client = TestClient(app_module.app)
+
+    async def fake_run_in_threadpool(func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+    monkeypatch.setattr(app_module, "run_in_threadpool", fake_run_in_threadpool)
+
+    files = {"file": ("x.png", make_img_bytes(), "image/png")}
+    data = {"media": "continuous58"}
+    res = client.post(
+        "/preview",
+        files=files,
+        data=data,
+        headers={"Accept": "application/octet-stream"},
+    )
+    assert res.status_code == 200
+    assert res.headers["content-type"] == "application/octet-stream"
+    width = int(res.headers["x-width"])
+    height = int(res.headers["x-height"])
+    row_bytes = int(res.headers["x-row-bytes"])
+    assert (width, row_bytes) == (463, 58)
+    assert len(res.content) == row_bytes * height
@@ -1,3 +1,4 @@
+import time
 from unittest.mock import patch, mock_open, MagicMock
 
 from PIL import Image
@@ -5,6 +6,12 @@ import pytest
 from ditherbooth.printer.cups import spool_raw
 from ditherbooth.printer.epl import img_to_epl_gw
 from ditherbooth.printer.zpl import img_to_zpl_gf
+from ditherbooth.printer.vector import (
+    NativeLabel,
+    NativeUnsupported,
+    canvas_to_epl,
+    canvas_to_zpl,
+)
 
 
 def make_black_image():
@@ -66,3 +73,367 @@ def test_spool_raw_lpr_path(tmp_path, monkeypatch):
         assert args[0] == "lpr"
         assert args[1] == "-P"
         assert args[2] == "TestPrinter"
+
+
+def make_tall_raster(height=1000, width=463):
+    from ditherbooth.imaging.raster import PackedRaster
+
+    img = Image.linear_gradient("L").resize((width, height)).convert("1")
+    return PackedRaster.from_image(img)
+
+
+def test_iter_encoders_match_whole_payloads():
+    from ditherbooth.printer.epl import iter_raster_to_epl_gw, raster_to_epl_gw
+    from ditherbooth.printer.zpl import iter_raster_to_zpl_gf, raster_to_zpl_gf
+
+    raster = make_tall_raster()
+    epl_chunks = list(iter_raster_to_epl_gw(raster, gap=0, band_rows=100))
+    assert len(epl_chunks) == 12  # header, 10 bands, footer
+    assert b"".join(epl_chunks) == raster_to_epl_gw(raster, gap=0)
+    zpl_chunks = list(iter_raster_to_zpl_gf(raster, band_rows=100))
+    assert b"".join(zpl_chunks) == raster_to_zpl_gf(raster)
+
+
+def test_iter_zpl_memory_does_not_grow_with_payload():
+    import tracemalloc
+
+    from ditherbooth.printer.zpl import iter_raster_to_zpl_gf
+
+    raster = make_tall_raster(height=20000)
+    tracemalloc.start()
+    total = 0
+    for chunk in iter_raster_to_zpl_gf(raster):
+        total += len(chunk)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert total > 2 * len(raster.data)
+    # Only one band of hex is alive at a time
+    assert peak < 200 * 1024
+
+
+def test_spool_raw_dev_path_writes_chunks():
+    m = mock_open()
+    with patch("builtins.open", m):
+        spool_raw("/dev/usb/lp0", iter([b"head", "er", b"body"]))
+    assert [c.args[0] for c in m().write.call_args_list] == [b"head", b"er", b"body"]
+
+
+def test_spool_raw_sends_one_job_at_a_time_per_printer():
+    import threading
+
+    written = []
+    dev = MagicMock()
+    dev.__enter__.return_value.write.side_effect = written.append
+
+    def job(mark):
+        for _ in range(20):
+            time.sleep(0.001)
+            yield mark * 100
+
+    with patch("builtins.open", return_value=dev):
+        threads = [
+            threading.Thread(target=spool_raw, args=("/dev/usb/lp0", job(m)))
+            for m in (b"A", b"B")
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=5)
+    # Both jobs arrive whole, one after the other, never interleaved
+    assert b"".join(written) in (b"A" * 2000 + b"B" * 2000, b"B" * 2000 + b"A" * 2000)
+
+
+def test_spool_raw_tcp_streams_to_socket():
+    import socket
+    import threading
+
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+    received = bytearray()
+
+    def serve():
+        conn, _ = server.accept()
+        with conn:
+            while True:
+                data = conn.recv(4096)
+                if not data:
+                    break
+                received.extend(data)
+
+    t = threading.Thread(target=serve)
+    t.start()
+    port = server.getsockname()[1]
+    spool_raw(f"tcp://127.0.0.1:{port}", (bytes([i]) * 1000 for i in range(5)))
+    t.join(timeout=5)
+    server.close()
+    assert bytes(received) == b"".join(bytes([i]) * 1000 for i in range(5))
+
+
+def test_spool_raw_lpr_streams_iterable_to_stdin():
+    proc = MagicMock()
+    proc.wait.return_value = 0
+    with patch("subprocess.Popen", return_value=proc) as mock_popen:
+        spool_raw("TestPrinter", iter([b"a", b"b"]))
+    assert mock_popen.call_args[0][0] == ["lpr", "-P", "TestPrinter"]
+    assert [c.args[0] for c in proc.stdin.write.call_args_list] == [b"a", b"b"]
+    proc.stdin.close.assert_called_once()
+
+
+def test_spool_raw_lpr_stream_failure_raises():
+    import subprocess
+
+    proc = MagicMock()
+    proc.wait.return_value = 1
+    with patch("subprocess.Popen", return_value=proc):
+        with pytest.raises(subprocess.CalledProcessError):
+            spool_raw("TestPrinter", iter([b"a"]))
+
+
+def _dot_image(size=8):
+    import base64
+    import io
+
+    buf = io.BytesIO()
+    Image.new("L", (size, size), 0).save(buf, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buf.getvalue()).decode()
+
+
+def test_canvas_to_epl_uses_native_commands():
+    canvas_json = {
+        "objects": [
+            {
+                "type": "i-text",
+                "left": 10,
+                "top": 5,
+                "width": 100,
+                "height": 27,
+                "text": 'Say "hi"',
+                "fontSize": 24,
+                "fill": "#000000",
+            },
+            {
+                "type": "rect",
+                "left": 0,
+                "top": 40,
+                "width": 50,
+                "height": 10,
+                "fill": "#000000",
+            },
+            {
+                "type": "rect",
+                "left": 0,
+                "top": 60,
+                "width": 48,
+                "height": 18,
+                "fill": "transparent",
+                "stroke": "#000000",
+                "strokeWidth": 2,
+            },
+            {
+                "type": "line",
+                "left": 0,
+                "top": 90,
+                "width": 100,
+                "height": 0,
+                "x1": -50,
+                "y1": 0,
+                "x2": 50,
+                "y2": 0,
+                "stroke": "#000000",
+                "strokeWidth": 4,
+            },
+        ]
+    }
+    payload = canvas_to_epl(canvas_json, 200, 120, x=0, y=0, gap=None)
+    assert payload == (
+        b"N\nq200\nQ120\n"
+        b'A10,5,0,4,1,1,N,"Say \\"hi\\""\n'
+        b"LO0,40,50,10\n"
+        b"X0,60,2,50,80\n"
+        b"LO2,90,100,4\n"
+        b"P1\n"
+    )
+
+
+def test_canvas_to_zpl_rasterizes_only_images():
+    canvas_json = {
+        "objects": [
+            {
+                "type": "image",
+                "left": 16,
+                "top": 4,
+                "width": 8,
+                "height": 8,
+                "src": _dot_image(),
+            },
+            {
+                "type": "textbox",
+                "left": 0,
+                "top": 20,
+                "width": 100,
+                "height": 23,
+                "text": "Total_^",
+                "fontSize": 20,
+                "fill": "#000000",
+                "textAlign": "center",
+            },
+            {
+                "type": "i-text",
+                "left": 0,
+                "top": 50,
+                "width": 100,
+                "height": 60,
+                "text": "https://example.com",
+                "fontSize": 20,
+                "fill": "#000000",
+                "barcode": "qr",
+            },
+        ]
+    }
+    payload = canvas_to_zpl(canvas_json, 64, 120, x=0, y=0)
+    assert payload == (
+        b"^XA^CI28^FO16,4^GFA,8,8,1,0000000000000000^FS"
+        b"^FO0,20^FB100,1,0,C^A0N,20,20^FH^FDTotal_5F_5E^FS"
+        b"^FO0,50^BQN,2,2^FH^FDQA,https://example.com^FS"
+        b"^XZ"
+    )
+
+
+def test_native_label_rejects_raster_over_native():
+    canvas_json = {
+        "objects": [
+            {
+                "type": "i-text",
+                "left": 0,
+                "top": 0,
+                "width": 60,
+                "height": 23,
+                "text": "Under",
+                "fontSize": 20,
+                "fill": "#000000",
+            },
+            {
+                "type": "rect",
+                "left": 0,
+                "top": 0,
+                "width": 30,
+                "height": 30,
+                "fill": "#ffffff",
+            },
+        ]
+    }
+    with pytest.raises(NativeUnsupported):
+        NativeLabel(canvas_json, "ZPL", 64, 64)
+    # Stacked the other way round the printer's black-on-top output is exact.
+    canvas_json["objects"].reverse()
+    assert b"^A0N" in NativeLabel(canvas_json, "ZPL", 64, 64).to_zpl()
+
+
+def test_parse_printer_status_replies():
+    from ditherbooth.printer.status import (
+        parse_epl_error,
+        parse_host_status,
+        parse_lpstat,
+        query_status,
+    )
+
+    reply = (
+        b"\x02030,1,0,1245,003,1,0,0,00000000,1,000\x03\r\n"
+        b"\x02000,0,1,0,0,2,6,0,00000000,1,0,0\x03\r\n"
+        b"\x021234,0\x03\r\n"
+    )
+    status = parse_host_status(reply)
+    assert status.paper_out and status.buffer_full and status.head_open
+    assert not status.paused
+    assert status.pending_jobs == 3
+    assert status.blocking == ["paper_out", "head_open", "buffer_full"]
+
+    assert parse_epl_error(b"00\r\n").ready
+    assert parse_epl_error(b"07\r\n").error == "error 07"
+
+    status = parse_lpstat(
+        "printer Zebra is idle.  enabled since Mon 01 Jan\n",
+        "Zebra-12 pi 1024 Mon 01 Jan\nZebra-13 pi 2048 Mon 01 Jan\n",
+    )
+    assert status.online and status.pending_jobs == 2 and not status.blocking
+    status = parse_lpstat("printer Zebra disabled since Mon 01 Jan -\n\tPaused\n", "")
+    assert not status.online and status.paused and status.error == "Paused"
+
+    # Unreachable printers are reported, not raised
+    status = query_status("/dev/nonexistent-lp0", "ZPL")
+    assert status.source == "unavailable" and not status.online
+
+
+def test_status_query_stays_out_of_a_job_being_sent():
+    from ditherbooth.printer.cups import printer_lock
+    from ditherbooth.printer.status import query_status
+
+    with patch("os.open") as device_open:
+        with printer_lock("/dev/usb/lp0"):
+            status = query_status("/dev/usb/lp0", "EPL")
+    device_open.assert_not_called()
+    assert status.ready and status.error is None
+
+
+def test_virtual_printer_decodes_jobs_back_to_images():
+    from ditherbooth.imaging.raster import PackedRaster
+    from ditherbooth.printer.epl import raster_to_epl_gw
+    from ditherbooth.printer.virtual import EplParser, PayloadError, ZplParser
+    from ditherbooth.printer.zpl import raster_to_zpl_gf
+
+    img = Image.linear_gradient("L").resize((64, 40)).convert("1")
+    raster = PackedRaster.from_image(img)
+    payload = raster_to_epl_gw(raster, x=0, y=0, label_height=60, speed=4)
+    parser = EplParser()
+    # Arriving in small pieces, split inside the binary data
+    labels = [
+        item
+        for i in range(0, len(payload), 7)
+        for item in parser.feed(payload[i : i + 7])
+    ]
+    assert len(labels) == 1
+    label = labels[0]
+    assert label.image.crop((0, 0, 64, 40)).tobytes() == img.tobytes()
+    assert (label.rows, label.ips, label.warnings) == (60, 3.5, [])
+
+    payload = raster_to_zpl_gf(raster, x=10, y=5).replace(b"^XZ", b"^PQ3^XZ")
+    label = ZplParser().feed(payload)[0]
+    assert label.image.crop((10, 5, 74, 45)).tobytes() == img.tobytes()
+    assert label.copies == 3 and label.rows == 45
+
+    # A graphic past the label width is clipped, as on paper
+    label = EplParser().feed(raster_to_epl_gw(raster))[0]
+    assert label.warnings == [
+        "graphic at x=20 is 20 dots wider than the label and was clipped"
+    ]
+
+    with pytest.raises(PayloadError):
+        ZplParser().feed(b"^XA^FO0,0^GFA,10,10,2,FFFF^FS^XZ")
+
+
+def test_virtual_printer_over_tcp():
+    from ditherbooth.printer.status import query_status
+    from ditherbooth.printer.virtual import VirtualPrinter
+
+    img = Image.new("1", (16, 16), 1)
+    printer = VirtualPrinter(time_scale=0.001)
+    try:
+        name = printer.serve_tcp(port=0)
+        spool_raw(name, img_to_zpl_gf(img))
+        spool_raw(name, iter([img_to_epl_gw(img)[:10], img_to_epl_gw(img)[10:]]))
+        spool_raw(name, b"^XA^FO0,0")
+        status = query_status(name, "ZPL")
+        assert status.ready and status.pending_jobs is not None
+        assert query_status(name, "EPL").ready
+        assert printer.wait_idle(timeout=5)
+        # The connection handler notes the unfinished job when it closes
+        deadline = time.monotonic() + 5
+        while not printer.errors and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        printer.close()
+    assert [label.lang for label in printer.labels] == ["ZPL", "EPL"]
+    assert printer.errors == ["ZPL job ended incomplete"]
+    stats = printer.stats()
+    assert stats["labels"] == 2 and stats["labels_per_minute"] > 0
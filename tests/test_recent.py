@@ -0,0 +1,40 @@
+from PIL import Image
+
+from ditherbooth.imaging.raster import PackedRaster
+from ditherbooth.recent import RecentPrints
+
+
+def _raster(shade, width=400, height=240):
+    return PackedRaster.from_image(
+        Image.effect_noise((width, height), shade).convert("1")
+    )
+
+
+def test_recent_prints_are_bounded_and_survive_restarts(tmp_path):
+    recent = RecentPrints(tmp_path, max_items=2, memory_bytes=20_000)
+    rasters = {job_id: _raster(40 + i) for i, job_id in enumerate(("a", "b", "c"))}
+    for job_id, raster in rasters.items():
+        recent.add(job_id, raster, "label50x30", "EPL")
+    # Oldest dropped, files included
+    assert [e.id for e in recent.list()] == ["c", "b"]
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "b.bits",
+        "b.json",
+        "b.png",
+        "c.bits",
+        "c.json",
+        "c.png",
+    ]
+
+    # Only the newest raster fits in memory; the other comes back from disk
+    fresh = RecentPrints(tmp_path, max_items=2)
+    entry = fresh.get("b")
+    assert entry.media == "label50x30" and entry.lang == "EPL"
+    assert fresh.raster(entry) == recent.raster(recent.get("b")) == rasters["b"]
+    assert fresh.thumbnail(entry).startswith(b"\x89PNG")
+    assert fresh.get("a") is None
+
+    # Disk limit: a print bigger than all of it isn't kept
+    small = RecentPrints(tmp_path / "small", max_bytes=1000)
+    assert small.add("d", _raster(60), "label50x30", "ZPL") is None
+    assert small.list() == []
@@ -0,0 +1,226 @@
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+from ditherbooth.imaging.render import content_height, parse_color, render_canvas
+
+
+def black(img, x, y):
+    return img.getpixel((x, y)) == 0
+
+
+def test_parse_color():
+    assert parse_color("#000000") == 0
+    assert parse_color("black") == 0
+    assert parse_color("#fff") == 255
+    assert parse_color("rgb(40, 40, 40)") == 0
+    assert parse_color("transparent") is None
+    assert parse_color("rgba(0, 0, 0, 0)") is None
+    assert parse_color(None) is None
+
+
+def test_render_shapes_are_crisp_1bit():
+    canvas_json = {
+        "background": "#ffffff",
+        "objects": [
+            {
+                "type": "rect",
+                "left": 10,
+                "top": 10,
+                "width": 40,
+                "height": 20,
+                "fill": "#000000",
+                "stroke": "#000000",
+                "strokeWidth": 2,
+            },
+            {
+                "type": "line",
+                "left": 0,
+                "top": 50,
+                "width": 100,
+                "height": 0,
+                "x1": -50,
+                "y1": 0,
+                "x2": 50,
+                "y2": 0,
+                "stroke": "#000000",
+                "strokeWidth": 4,
+            },
+            {
+                "type": "circle",
+                "left": 60,
+                "top": 0,
+                "width": 30,
+                "height": 30,
+                "radius": 15,
+                "fill": "transparent",
+                "stroke": "#000000",
+                "strokeWidth": 2,
+            },
+        ],
+    }
+    img = render_canvas(canvas_json, 120)
+    assert img.mode == "1"
+    assert img.size == (120, 54)
+    # Filled rect covers its box (stroke included), nothing outside it
+    assert black(img, 10, 10) and black(img, 51, 31) and black(img, 30, 20)
+    assert not black(img, 9, 9) and not black(img, 53, 33)
+    assert black(img, 50, 52)
+    # Unfilled circle: ring is inked, middle is not
+    assert black(img, 76, 0) and not black(img, 76, 16)
+
+
+def test_render_text_and_image():
+    src = Image.new("L", (10, 10), 0)
+    buf = io.BytesIO()
+    src.save(buf, format="PNG")
+    data_url = "data:image/png;base64," + base64.b64encode(buf.getvalue()).decode()
+    canvas_json = {
+        "objects": [
+            {
+                "type": "i-text",
+                "left": 0,
+                "top": 0,
+                "width": 100,
+                "height": 45,
+                "text": "Hi",
+                "fontSize": 40,
+                "fill": "#000000",
+            },
+            {
+                "type": "image",
+                "left": 100,
+                "top": 0,
+                "width": 10,
+                "height": 10,
+                "scaleX": 2,
+                "scaleY": 2,
+                "src": data_url,
+            },
+        ]
+    }
+    img = render_canvas(canvas_json, 200, 60)
+    assert img.size == (200, 60)
+    assert img.crop((0, 0, 100, 45)).histogram()[0] > 50
+    assert img.crop((100, 0, 120, 20)).histogram()[0] == 400
+
+
+def test_render_code128_draws_bars_from_top_left():
+    from ditherbooth.imaging.barcode import code128_modules
+
+    canvas_json = {
+        "objects": [
+            {
+                "type": "i-text",
+                "left": 10,
+                "top": 5,
+                "width": 120,
+                "height": 40,
+                "text": "12345678",
+                "fontSize": 35,
+                "barcode": "code128",
+                "barcodeModule": 2,
+            },
+        ]
+    }
+    img = render_canvas(canvas_json, 200, 60)
+    modules = code128_modules("12345678")
+    # Start C, four digit pairs, checksum, stop: 7 symbols of 11 modules + 2
+    assert len(modules) == 79
+    for y in (5, 44):
+        row = [black(img, x, y) for x in range(10, 10 + 2 * len(modules))]
+        assert row == [bar for bar in modules for _ in range(2)]
+    assert not black(img, 9, 20) and not black(img, 10, 4) and not black(img, 10, 45)
+
+
+def test_render_qr_code():
+    pytest.importorskip("segno")
+    canvas_json = {
+        "objects": [
+            {
+                "type": "i-text",
+                "left": 0,
+                "top": 0,
+                "width": 100,
+                "height": 20,
+                "text": "hi",
+                "fontSize": 18,
+                "barcode": "qr",
+                "barcodeModule": 3,
+            },
+        ]
+    }
+    img = render_canvas(canvas_json, 100, 100)
+    # Version 1 is 21 modules square, with a finder pattern in the corner
+    assert img.getbbox() is not None
+    assert black(img, 0, 0) and black(img, 62, 0) and not black(img, 63, 0)
+    assert not black(img, 3, 3) and black(img, 6, 6)
+
+
+def test_content_height_and_max_height():
+    canvas_json = {
+        "objects": [
+            {
+                "type": "rect",
+                "left": 0,
+                "top": 100,
+                "width": 10,
+                "height": 50,
+                "fill": "#000",
+            }
+        ]
+    }
+    assert content_height(canvas_json) == 150
+    with pytest.raises(ValueError):
+        render_canvas(canvas_json, 50, max_height=120)
+
+
+def test_merge_renderer_matches_full_render():
+    from ditherbooth.imaging.render import MergeRenderer, fill_placeholders
+
+    canvas_json = {
+        "objects": [
+            {
+                "type": "rect",
+                "left": 0,
+                "top": 0,
+                "width": 200,
+                "height": 60,
+                "fill": "transparent",
+                "stroke": "#000",
+                "strokeWidth": 2,
+            },
+            {
+                "type": "i-text",
+                "left": 10,
+                "top": 10,
+                "width": 150,
+                "height": 45,
+                "text": "Hi {{ name }}",
+                "fontSize": 40,
+                "fill": "#000000",
+            },
+            # Static object stacked above the placeholder text
+            {
+                "type": "rect",
+                "left": 100,
+                "top": 20,
+                "width": 30,
+                "height": 30,
+                "fill": "#000",
+            },
+        ]
+    }
+    renderer = MergeRenderer(canvas_json, 300)
+    assert renderer.fields == ["name"]
+    merged = renderer.render({"name": "Alexandra"})
+
+    full = dict(canvas_json, objects=list(canvas_json["objects"]))
+    text = full["objects"][1]
+    full["objects"][1] = dict(
+        text, text=fill_placeholders(text["text"], {"name": "Alexandra"}), width=1000
+    )
+    expected = render_canvas(full, 300, merged.height)
+    assert merged.tobytes() == expected.tobytes()
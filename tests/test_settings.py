@@ -31,9 +31,19 @@ def test_public_config_defaults(tmp_path, monkeypatch):
     res = client.get("/api/public-config")
     assert res.status_code == 200
     data = res.json()
-    assert set(["default_media", "default_lang", "lock_controls", "design_mode", "media_options", "lang_options"]).issubset(data.keys())
+    assert set(
+        [
+            "default_media",
+            "default_lang",
+            "lock_controls",
+            "design_mode",
+            "media_options",
+            "lang_options",
+        ]
+    ).issubset(data.keys())
     assert data["default_media"] in data["media_options"]
     assert data["default_lang"] in data["lang_options"]
+    assert data["async_prints"] is True
 
 
 def test_dev_settings_requires_auth(tmp_path, monkeypatch):
@@ -62,7 +72,9 @@ def test_dev_settings_get_put_and_print_test_mode(tmp_path, monkeypatch):
         "default_lang": "EPL",
         "lock_controls": True,
     }
-    res = client.put("/api/dev/settings", headers={"X-Dev-Password": "pw"}, json=payload)
+    res = client.put(
+        "/api/dev/settings", headers={"X-Dev-Password": "pw"}, json=payload
+    )
     assert res.status_code == 200
     data = res.json()["config"]
     assert data["test_mode"] is True
@@ -97,3 +109,155 @@ def test_static_style_served(tmp_path, monkeypatch):
     res = client.get("/static/style.css")
     assert res.status_code == 200
     assert "text/css" in res.headers.get("content-type", "")
+
+
+def test_max_continuous_height_caps_print(tmp_path, monkeypatch):
+    app_module = setup_app_with_tmp_config(tmp_path, monkeypatch)
+    client = TestClient(app_module.app)
+    headers = {"X-Dev-Password": "dev"}
+    res = client.put(
+        "/api/dev/settings", headers=headers, json={"max_continuous_height_dots": 0}
+    )
+    assert res.status_code == 400
+    res = client.put(
+        "/api/dev/settings",
+        headers=headers,
+        json={"test_mode": True, "max_continuous_height_dots": 100},
+    )
+    assert res.status_code == 200
+
+    captured = []
+    real_get_raster = app_module.get_raster
+
+    def capture_get_raster(*args):
+        raster = real_get_raster(*args)
+        captured.append(raster)
+        return raster
+
+    monkeypatch.setattr(app_module, "get_raster", capture_get_raster)
+    files = {"file": ("tall.png", make_image_bytes(20, 400), "image/png")}
+    res = client.post(
+        "/print", files=files, data={"media": "continuous58", "lang": "ZPL"}
+    )
+    assert res.status_code == 200
+    assert captured[0].height == 100
+    assert captured[0].width == 463
+
+
+def test_resample_profile_per_endpoint(tmp_path, monkeypatch):
+    app_module = setup_app_with_tmp_config(tmp_path, monkeypatch)
+    client = TestClient(app_module.app)
+    headers = {"X-Dev-Password": "dev"}
+    res = client.put(
+        "/api/dev/settings", headers=headers, json={"preview_resample": "sharpest"}
+    )
+    assert res.status_code == 400
+    res = client.put(
+        "/api/dev/settings",
+        headers=headers,
+        json={"test_mode": True, "preview_resample": "fast", "print_resample": "best"},
+    )
+    assert res.status_code == 200
+
+    profiles = []
+    real_get_raster = app_module.get_raster
+
+    def capture_get_raster(*args):
+        profiles.append(args[4])
+        return real_get_raster(*args)
+
+    monkeypatch.setattr(app_module, "get_raster", capture_get_raster)
+    files = {"file": ("img.png", make_image_bytes(), "image/png")}
+    assert client.post("/preview", files=files).status_code == 200
+    assert client.post("/print", files=files).status_code == 200
+    assert profiles == ["fast", "best"]
+
+
+def test_auto_rotate_turns_landscape_photos_on_continuous(tmp_path, monkeypatch):
+    app_module = setup_app_with_tmp_config(tmp_path, monkeypatch)
+    client = TestClient(app_module.app)
+    headers = {"X-Dev-Password": "dev"}
+    assert (
+        client.put(
+            "/api/dev/settings", headers=headers, json={"auto_rotate": "sideways"}
+        ).status_code
+        == 400
+    )
+    res = client.put(
+        "/api/dev/settings",
+        headers=headers,
+        json={"test_mode": True, "auto_rotate": "area"},
+    )
+    assert res.status_code == 200
+
+    # Black on the left: turned clockwise it ends up along the top
+    img = Image.new("L", (300, 200), 255)
+    img.paste(0, (0, 0, 30, 200))
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    files = {"file": ("wide.png", buf.getvalue(), "image/png")}
+    data = {"media": "continuous58"}
+    res = client.post("/preview", files=files, data=data)
+    assert res.headers["X-Rotated"] == "true"
+    preview = Image.open(io.BytesIO(res.content))
+    assert preview.size == (463, 694)
+    assert preview.getpixel((231, 10)) == 0 and preview.getpixel((231, 680)) == 255
+    res = client.post("/print", files=files, data=data)
+    assert res.status_code == 200 and res.json()["rotated"] is True
+
+    # Portraits already fill the width; "feed" turns them to print shorter
+    files = {"file": ("tall.png", make_image_bytes(200, 300), "image/png")}
+    assert (
+        client.post("/preview", files=files, data=data).headers["X-Rotated"] == "false"
+    )
+    client.put("/api/dev/settings", headers=headers, json={"auto_rotate": "feed"})
+    res = client.post("/preview", files=files, data=data)
+    assert res.headers["X-Rotated"] == "true"
+    assert Image.open(io.BytesIO(res.content)).size == (463, 309)
+
+
+def test_adaptive_speed_prints_sparse_labels_faster(tmp_path, monkeypatch):
+    app_module = setup_app_with_tmp_config(tmp_path, monkeypatch)
+    client = TestClient(app_module.app)
+    spooled = []
+    monkeypatch.setattr(
+        app_module, "spool_raw", lambda name, payload: spooled.append(payload)
+    )
+    headers = {"X-Dev-Password": "dev"}
+    bad = {"speed_tables": {"Zebra_LP2844": [[0.1, 9, 8]]}}
+    assert client.put("/api/dev/settings", headers=headers, json=bad).status_code == 400
+    settings = {
+        "adaptive_speed": True,
+        "printer_status_poll": False,
+        "print_dedup_seconds": 0,
+        "epl_speed": 2,
+    }
+    assert (
+        client.put("/api/dev/settings", headers=headers, json=settings).status_code
+        == 200
+    )
+
+    def header(img):
+        buf = io.BytesIO()
+        img.save(buf, format="PNG")
+        files = {"file": ("label.png", buf.getvalue(), "image/png")}
+        assert (
+            client.post(
+                "/print", files=files, data={"media": "label50x30", "lang": "EPL"}
+            ).status_code
+            == 200
+        )
+        return spooled[-1].split(b"GW")[0].split(b"\n")
+
+    # A thin line is sparse enough for the fastest row; a dark photo is not
+    text = Image.new("L", (400, 240), 255)
+    text.paste(0, (20, 100, 380, 105))
+    assert b"S4" in header(text) and b"D9" in header(text)
+    assert b"S2" in header(Image.new("L", (400, 240), 40))
+
+    # A table for the configured printer replaces the default one
+    table = {"speed_tables": {"Zebra_LP2844": [[1.0, 3, 7]]}}
+    assert (
+        client.put("/api/dev/settings", headers=headers, json=table).status_code == 200
+    )
+    assert b"S3" in header(Image.new("L", (400, 240), 40))
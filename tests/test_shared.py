@@ -0,0 +1,76 @@
+import threading
+
+from ditherbooth.shared import PrintQueue, SharedCache
+
+
+def test_shared_cache_evicts_least_recently_used(tmp_path):
+    cache = SharedCache(tmp_path / "cache.db", max_bytes=100)
+    other = SharedCache(tmp_path / "cache.db", max_bytes=100)
+    cache.put("a", b"x" * 40)
+    cache.put("b", b"y" * 40)
+    # Visible to another process's connection, and counts as a use
+    assert other.get("a") == b"x" * 40
+    other.put("c", b"z" * 40)
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
+    cache.put("huge", b"!" * 101)
+    assert cache.get("huge") is None
+
+
+def test_print_queue_spools_each_job_once_in_order(tmp_path):
+    path = tmp_path / "state.db"
+    PrintQueue(path).enqueue("first", "lp", {"media": "label50x30"}, b"1")
+    for i in range(2, 21):
+        PrintQueue(path).enqueue(f"job{i}", "lp", {}, str(i).encode())
+    spooled = []
+
+    def worker(owner: str) -> None:
+        # One PrintQueue per worker process
+        queue = PrintQueue(path)
+        while queue.printers_with_work():
+            if not queue.acquire("lp", owner, ttl=5):
+                continue
+            job = queue.next_job("lp")
+            if job is not None:
+                spooled.append((owner, job["payload"]))
+                queue.finish(job["id"], "spooled", {"eta": 0})
+        queue.release(owner)
+
+    threads = [threading.Thread(target=worker, args=(f"w{i}",)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert [payload for _, payload in spooled] == [
+        str(i).encode() for i in range(1, 21)
+    ]
+    queue = PrintQueue(path)
+    job = queue.job("first")
+    assert (
+        job["state"] == "spooled"
+        and job["meta"] == {"media": "label50x30"}
+        and job["result"] == {"eta": 0}
+    )
+
+    # A lease is exclusive until it expires
+    assert queue.acquire("lp", "a", ttl=60)
+    assert not queue.acquire("lp", "b", ttl=60)
+    assert queue.acquire("lp", "a", ttl=-1)
+    assert queue.acquire("lp", "b", ttl=60)
+
+    # Duplicate keys: the first claim wins until its job fails
+    assert queue.claim("k", "fp", ttl=60) is None
+    assert queue.claim("k", "fp", ttl=60) == {"fingerprint": "fp", "result": None}
+    queue.settle("k", {"error": {"status_code": 503, "detail": "busy"}})
+    assert queue.claim_result("k")["error"]["status_code"] == 503
+    assert queue.claim("k", "fp", ttl=60) is None
+
+    # Claims whose worker died: expired ones are gone, running ones go stale
+    assert queue.claim("gone", "fp", ttl=-1) is None
+    assert queue.claim_result("gone")["error"]["status_code"] == 409
+    assert queue.claim("stuck", "fp", ttl=60) is None
+    assert queue.claim("stuck", "fp", ttl=60, stale_after=30) == {
+        "fingerprint": "fp",
+        "result": None,
+    }
+    assert queue.claim("stuck", "fp", ttl=60, stale_after=0) is None
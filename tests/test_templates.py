@@ -1,8 +1,10 @@
 import importlib
+import io
 import json
 
 import pytest
 from fastapi.testclient import TestClient
+from PIL import Image
 
 
 @pytest.fixture()
@@ -98,3 +100,289 @@ def test_public_config_has_media_dimensions(client):
     assert "label100x150" in dims
     assert dims["label100x150"]["width"] == 800
     assert dims["label100x150"]["height"] == 1200
+
+
+def test_render_template_png_and_print(client, monkeypatch):
+    import ditherbooth.app as app_module
+
+    canvas_json = {
+        "objects": [
+            {
+                "type": "rect",
+                "left": 0,
+                "top": 0,
+                "width": 40,
+                "height": 20,
+                "fill": "#000000",
+            }
+        ]
+    }
+    tpl_id = client.post(
+        "/api/templates", json={"name": "R", "canvas_json": canvas_json}
+    ).json()["id"]
+
+    res = client.post(f"/api/templates/{tpl_id}/render", json={"media": "label50x30"})
+    assert res.status_code == 200
+    assert res.headers["content-type"] == "image/png"
+
+    assert Image.open(io.BytesIO(res.content)).size == (400, 240)
+
+    called = []
+    monkeypatch.setattr(
+        app_module, "spool_raw", lambda name, payload: called.append(payload)
+    )
+    res = client.post(
+        f"/api/templates/{tpl_id}/render",
+        json={"media": "continuous58", "lang": "ZPL", "print": True},
+    )
+    assert res.status_code == 200
+    assert res.json()["encoding"] == "raster" and res.json()["job_id"]
+    assert called[0].startswith(b"^XA^FO20,20^GFA,1160,1160,58,")
+
+
+def test_render_template_not_found(client):
+    res = client.post("/api/templates/nonexistent-id/render")
+    assert res.status_code == 404
+
+
+def test_merge_template_prints_one_label_per_row(client, monkeypatch):
+    import ditherbooth.app as app_module
+
+    canvas_json = {
+        "objects": [
+            {
+                "type": "rect",
+                "left": 0,
+                "top": 0,
+                "width": 300,
+                "height": 80,
+                "fill": "transparent",
+                "stroke": "#000000",
+                "strokeWidth": 2,
+            },
+            {
+                "type": "i-text",
+                "left": 10,
+                "top": 10,
+                "width": 200,
+                "height": 45,
+                "text": "{{name}}",
+                "fontSize": 40,
+                "fill": "#000000",
+            },
+        ]
+    }
+    tpl_id = client.post(
+        "/api/templates", json={"name": "Badge", "canvas_json": canvas_json}
+    ).json()["id"]
+    called = []
+    monkeypatch.setattr(
+        app_module, "spool_raw", lambda name, payload: called.append(payload)
+    )
+
+    res = client.post(
+        f"/api/templates/{tpl_id}/merge",
+        json={"csv": "name\nAda\nGrace\nLinus\n", "media": "label50x30", "lang": "EPL"},
+    )
+    assert res.status_code == 200
+    lines = [json.loads(line) for line in res.text.splitlines() if line]
+    assert lines[0] == {
+        "status": "started",
+        "total": 3,
+        "fields": ["name"],
+        "encoding": "raster",
+    }
+    assert [l["status"] for l in lines[1:]] == ["printed", "printed", "printed", "done"]
+    assert len(called) == 3
+    assert all(p.startswith(b"N\nD8\nS2\nq400\nQ240\nGW20,0,50,240,") for p in called)
+    # Different names give different label bodies
+    assert len(set(called)) == 3
+
+
+def test_merge_template_submits_the_settings_each_label_used(client, monkeypatch):
+    import ditherbooth.app as app_module
+
+    canvas_json = {
+        "objects": [
+            {
+                "type": "i-text",
+                "left": 10,
+                "top": 10,
+                "width": 200,
+                "height": 45,
+                "text": "{{name}}",
+                "fontSize": 40,
+                "fill": "#000000",
+            }
+        ]
+    }
+    tpl_id = client.post(
+        "/api/templates", json={"name": "Badge", "canvas_json": canvas_json}
+    ).json()["id"]
+    app_module.write_config({**app_module.DEFAULT_CONFIG, "adaptive_speed": True})
+    monkeypatch.setattr(app_module, "spool_raw", lambda name, payload: None)
+    submitted = []
+    submit_payload = app_module.submit_payload
+
+    async def record(payload, media, lang, cfg, rows=None, *args, **kwargs):
+        submitted.append((payload, cfg["epl_speed"], rows))
+        return await submit_payload(payload, media, lang, cfg, rows, *args, **kwargs)
+
+    monkeypatch.setattr(app_module, "submit_payload", record)
+
+    res = client.post(
+        f"/api/templates/{tpl_id}/merge",
+        json={"rows": [{"name": "Ada"}], "media": "label50x30", "lang": "EPL"},
+    )
+    assert res.status_code == 200
+    payload, speed, rows = submitted[0]
+    # Sparse text prints faster than the configured speed, and the ETA knows
+    assert speed != app_module.DEFAULT_CONFIG["epl_speed"]
+    assert f"\nS{speed}\n".encode() in payload
+    assert rows == 240
+
+
+def test_merge_template_rejects_empty_rows(client):
+    tpl_id = client.post(
+        "/api/templates", json={"name": "B", "canvas_json": {"objects": []}}
+    ).json()["id"]
+    res = client.post(f"/api/templates/{tpl_id}/merge", json={"rows": []})
+    assert res.status_code == 400
+    res = client.post(f"/api/templates/{tpl_id}/merge", json={"rows": "nope"})
+    assert res.status_code == 400
+
+
+def test_render_template_prints_native_commands(client, monkeypatch):
+    import ditherbooth.app as app_module
+
+    canvas_json = {
+        "objects": [
+            {
+                "type": "i-text",
+                "left": 10,
+                "top": 10,
+                "width": 120,
+                "height": 45,
+                "text": "Hello",
+                "fontSize": 40,
+                "fill": "#000000",
+            },
+            {
+                "type": "rect",
+                "left": 0,
+                "top": 0,
+                "width": 300,
+                "height": 80,
+                "fill": "transparent",
+                "stroke": "#000000",
+                "strokeWidth": 2,
+            },
+        ]
+    }
+    tpl_id = client.post(
+        "/api/templates", json={"name": "N", "canvas_json": canvas_json}
+    ).json()["id"]
+    called = []
+    monkeypatch.setattr(
+        app_module, "spool_raw", lambda name, payload: called.append(payload)
+    )
+
+    res = client.post(
+        f"/api/templates/{tpl_id}/render",
+        json={"media": "label50x30", "lang": "EPL", "print": True, "native": True},
+    )
+    assert res.status_code == 200
+    assert res.json()["encoding"] == "native"
+    assert b"GW" not in called[0]
+    assert b'N,"Hello"\n' in called[0]
+    assert len(called[0]) < 200
+
+
+def test_merge_template_fills_native_barcodes(client, monkeypatch):
+    import ditherbooth.app as app_module
+
+    canvas_json = {
+        "objects": [
+            {
+                "type": "i-text",
+                "left": 10,
+                "top": 10,
+                "width": 200,
+                "height": 60,
+                "text": "{{sku}}",
+                "fontSize": 20,
+                "fill": "#000000",
+                "barcode": "code128",
+            },
+        ]
+    }
+    tpl_id = client.post(
+        "/api/templates", json={"name": "SKU", "canvas_json": canvas_json}
+    ).json()["id"]
+    called = []
+    monkeypatch.setattr(
+        app_module, "spool_raw", lambda name, payload: called.append(payload)
+    )
+
+    res = client.post(
+        f"/api/templates/{tpl_id}/merge",
+        json={
+            "rows": [{"sku": "A-1"}, {"sku": "B-2"}],
+            "media": "label50x30",
+            "lang": "ZPL",
+        },
+    )
+    lines = [json.loads(line) for line in res.text.splitlines() if line]
+    assert lines[0]["encoding"] == "native"
+    assert lines[-1] == {"status": "done", "printed": 2}
+    assert b"^BCN,60,N,N,N^FH^FDA-1^FS" in called[0]
+    assert b"^FDB-2^FS" in called[1]
+
+
+def test_render_unsaved_canvas_with_barcodes(client, monkeypatch):
+    import ditherbooth.app as app_module
+
+    canvas_json = {
+        "background": "#ffffff",
+        "objects": [
+            {
+                "type": "i-text",
+                "left": 10,
+                "top": 10,
+                "width": 200,
+                "height": 60,
+                "text": "A-1",
+                "fontSize": 50,
+                "fill": "#000000",
+                "barcode": "code128",
+                "barcodeModule": 2,
+            },
+        ],
+    }
+    res = client.post(
+        "/api/render", json={"canvas_json": canvas_json, "media": "label50x30"}
+    )
+    assert res.headers["content-type"] == "image/png"
+    img = Image.open(io.BytesIO(res.content))
+    # Bars, not text: every row of the symbol is the same
+    assert img.getpixel((10, 10)) == 0
+    rows = {img.crop((0, y, img.width, y + 1)).tobytes() for y in range(10, 70)}
+    assert len(rows) == 1
+
+    called = []
+    monkeypatch.setattr(
+        app_module, "spool_raw", lambda name, payload: called.append(payload)
+    )
+    res = client.post(
+        "/api/render",
+        json={
+            "canvas_json": canvas_json,
+            "media": "label50x30",
+            "lang": "ZPL",
+            "print": True,
+        },
+    )
+    assert res.json()["encoding"] == "native"
+    assert b"^BCN,60,N,N,N^FH^FDA-1^FS" in called[0]
+
+    assert client.post("/api/render", json={"media": "label50x30"}).status_code == 400